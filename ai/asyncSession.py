@@ -0,0 +1,283 @@
+"""Асинхронный клиент для YandexGPT (и других моделей из `ai.backends`) с пулом соединений и синхронная обертка над ним
+"""
+import asyncio
+import concurrent.futures
+from typing import Any, AsyncIterator, Callable, Iterable
+
+from ai.history import ChatHistory
+from ai.scheduler import PRIORITIES
+from ai.session import REQUEST_SECONDS, REQUESTS, YaGPTSession
+from ai.singleflight import AsyncSingleFlight, requestKey
+from ai.transport import EventLoopThread, PooledTransport
+
+
+class AsyncYaGPTSession(YaGPTSession):
+    """Асинхронный клиент YaGPT. Все запросы идут через общий `PooledTransport`, поэтому соединения переиспользуются,
+    а несколько запросов могут ожидать ответа модели одновременно.
+
+    Методы `ask` и `customAsk` здесь являются корутинами.
+    """
+    def __init__(self, *args, transport: PooledTransport | None = None, maxConcurrency: int = 16, **kwargs):
+        """Асинхронный клиент YaGPT. Принимает те же аргументы, что и `YaGPTSession`, а также:
+
+        Args:
+            transport (PooledTransport | None, optional): Общий транспорт. Если не задан - будет создан собственный с таймаутом `timeout`. Defaults to None.
+            maxConcurrency (int, optional): Сколько запросов может одновременно ожидать ответа модели, если транспорт создается здесь. Defaults to 16.
+        """
+        super().__init__(*args, **kwargs)
+        # собственный транспорт ограничивает запрос тем же таймаутом, что и синхронная сессия
+        self.transport = transport or PooledTransport(maxConcurrency=maxConcurrency, requestTimeout=self.timeout)
+
+    async def _post(self, request_body: dict[str, Any]) -> tuple[int, dict]: # type: ignore[override]
+        local = self.backend.complete(request_body)
+        if local is not None:
+            REQUESTS.inc(status=local[0])
+            return local
+        headers = await self._headersAsync()
+        with REQUEST_SECONDS.time(mode="async"):
+            status, payload = await self.transport.post(self.api_url, request_body, headers)
+        REQUESTS.inc(status=status)
+        return status, payload
+
+    async def _headersAsync(self) -> dict[str, str]:
+        # получение IAM-токена - блокирующий запрос, в цикле событий он остановил бы все запросы в полете
+        if self.backend.headersBlock():
+            return await asyncio.get_running_loop().run_in_executor(None, self._headers)
+        return self._headers()
+
+    def _createSingleFlight(self) -> Any:
+        return AsyncSingleFlight()
+
+    def _attachProbe(self):
+        # проверка должна выполняться в цикле событий транспорта, поэтому ее подключает `PooledYaGPTSession`
+        pass
+
+    async def probe(self) -> bool: # type: ignore[override]
+        """Проверить, отвечает ли модель (для фоновой проверки предохранителя)
+
+        Returns:
+            bool: True, если модель ответила без ошибки
+        """
+        status, _ = await self._post(self._probeBody())
+        return 200 <= status < 300
+
+    def _streamLines(self, request_body: dict[str, Any]) -> AsyncIterator[bytes]: # type: ignore[override]
+        local = self.backend.completeStream(request_body)
+        lines = self._iterLocal(local) if local is not None else self._postStream(request_body)
+        return self.breaker.guardStreamAsync(lines) if self.breaker is not None else lines
+
+    async def _postStream(self, request_body: dict[str, Any]) -> AsyncIterator[bytes]:
+        headers = await self._headersAsync()
+        async for line in self.transport.postStream(self.api_url, request_body, headers):
+            yield line
+
+    @staticmethod
+    async def _iterLocal(lines: Iterable[bytes]) -> AsyncIterator[bytes]:
+        for line in lines:
+            yield line
+
+    async def _send(self, request_body: dict[str, Any], priority: int = PRIORITIES.CHAT, deadline: float | None = None) -> tuple[int, dict]: # type: ignore[override]
+        if self.singleFlight is None:
+            return await self._schedule(request_body, priority, deadline)
+        return await self.singleFlight.do(requestKey(request_body), lambda: self._schedule(request_body, priority, deadline))
+
+    async def _schedule(self, request_body: dict[str, Any], priority: int = PRIORITIES.CHAT, deadline: float | None = None) -> tuple[int, dict]: # type: ignore[override]
+        send = lambda: self._post(request_body)
+        if self.breaker is not None:
+            send = self.breaker.wrapAsync(send, lambda r: r[0])
+        if self.scheduler is None:
+            return await send()
+        return await self.scheduler.runAsync(send, lambda r: r[0], priority, deadline)
+
+    async def ask(
+            self,
+            messageText: str,
+            typeUser: str = "user",
+            useChatHistory: bool = True,
+            history: ChatHistory | None = None,
+            priority: int = PRIORITIES.CHAT,
+            deadline: float | None = None,
+            **kwargs
+        ) -> str: # type: ignore[override]
+        """Выполнить запрос к нейросети YaGPT. Аргументы такие же, как у `YaGPTSession.ask`
+
+        Returns:
+            str: Строка с ответом нейронной сети
+        """
+        # потоковые ответы разбирает только `askStream`
+        request_body = self._prepareAsk(messageText, typeUser, useChatHistory, history, stream=False, **kwargs)
+        status, payload = await self._send(request_body, priority, deadline)
+        response_message = self._parseResponse(status, payload)
+        self._commitTurns(messageText, typeUser, response_message, history)
+        return response_message
+
+    async def askStream(
+            self,
+            messageText: str,
+            typeUser: str = "user",
+            useChatHistory: bool = True,
+            history: ChatHistory | None = None,
+            priority: int = PRIORITIES.CHAT,
+            deadline: float | None = None,
+            **kwargs
+        ) -> AsyncIterator[str]: # type: ignore[override]
+        """Выполнить потоковый запрос к нейросети YaGPT. Аргументы такие же, как у `YaGPTSession.ask`
+
+        Yields:
+            AsyncIterator[str]: Новые фрагменты ответа нейронной сети
+        """
+        request_body = self._prepareAsk(messageText, typeUser, useChatHistory, history, stream=True, **kwargs)
+        if self.scheduler is not None:
+            await self.scheduler.acquireAsync(priority, self.scheduler.deadlineAt(deadline))
+
+        parser = self.backend.streamParser()
+        REQUESTS.inc(status="stream")
+        async for line in self._streamLines(request_body):
+            delta = parser.feed(line)
+            if delta:
+                yield delta
+        self._commitTurns(messageText, typeUser, parser.text, history)
+
+    async def customAskStream(self, messages: list[dict[str, str]], priority: int = PRIORITIES.CHAT, deadline: float | None = None, **kwargs) -> AsyncIterator[str]: # type: ignore[override]
+        """Потоковый вариант `customAsk`. Ответ отдается фрагментами и не кэшируется
+
+        Yields:
+            AsyncIterator[str]: Новые фрагменты ответа нейронной сети
+        """
+        request_body = self._prepareCustomAsk(messages, stream=True, **kwargs)
+        if self.scheduler is not None:
+            await self.scheduler.acquireAsync(priority, self.scheduler.deadlineAt(deadline))
+
+        parser = self.backend.streamParser()
+        REQUESTS.inc(status="stream")
+        async for line in self._streamLines(request_body):
+            delta = parser.feed(line)
+            if delta:
+                yield delta
+
+    async def customAsk(self, messages: list[dict[str, str]], priority: int = PRIORITIES.CHAT, deadline: float | None = None, **kwargs) -> str: # type: ignore[override]
+        """Выполнить кастомный запрос к нейросети YaGPT. Аргументы такие же, как у `YaGPTSession.customAsk`
+
+        Returns:
+            str: Строка с ответом нейронной сети
+        """
+        request_body = self._prepareCustomAsk(messages, **kwargs)
+        cacheKey = self._cacheKey(request_body)
+        # sqlite блокирует поток, поэтому кэш читается и пишется в пуле потоков, а не в цикле событий
+        loop = asyncio.get_running_loop()
+        if cacheKey is not None and (cached := await loop.run_in_executor(None, self.responseCache.get, cacheKey)) is not None: # type: ignore
+            return cached
+
+        status, payload = await self._send(request_body, priority, deadline)
+        response_message = self._parseResponse(status, payload)
+        if cacheKey is not None:
+            await loop.run_in_executor(None, self.responseCache.set, cacheKey, response_message) # type: ignore
+        return response_message
+
+    async def close(self):
+        """Закрыть соединения транспорта"""
+        await self.transport.close()
+
+
+class PooledYaGPTSession:
+    """Синхронная обертка над `AsyncYaGPTSession` для кода бота, который работает в потоках JSPyBridge.
+
+    Запросы выполняются в фоновом цикле событий. `ask` и `customAsk` блокируют вызывающий поток до ответа,
+    а `askFuture` и `customAskFuture` сразу возвращают `concurrent.futures.Future`, поэтому обработчик события
+    не держит поток моста, пока модель генерирует ответ.
+    """
+    def __init__(self, *args, loopThread: EventLoopThread | None = None, **kwargs):
+        """Синхронная обертка над `AsyncYaGPTSession`. Принимает те же аргументы, что и `AsyncYaGPTSession`, а также:
+
+        Args:
+            loopThread (EventLoopThread | None, optional): Общий фоновый цикл событий. Если не задан - будет создан собственный. Defaults to None.
+        """
+        self._ownsLoop = loopThread is None
+        self.loopThread = loopThread or EventLoopThread(name="yagpt-loop")
+        self.session = AsyncYaGPTSession(*args, **kwargs)
+        breaker = self.session.breaker
+        if breaker is not None and breaker.probe is None:
+            # фоновая проверка предохранителя идет из его потока, а сам запрос - в цикле событий транспорта
+            breaker.probe = lambda: self.loopThread.run(self.session.probe(), timeout=self.session.timeout)
+
+    def __getattr__(self, name: str) -> Any:
+        # messages, systemPrompt, model_uri и прочие поля берутся из асинхронной сессии
+        return getattr(self.session, name)
+
+    def askFuture(self, messageText: str, typeUser: str = "user", useChatHistory: bool = True, history: ChatHistory | None = None, **kwargs) -> concurrent.futures.Future:
+        """Запустить `ask` в фоне
+
+        Returns:
+            concurrent.futures.Future: Future со строкой ответа нейронной сети
+        """
+        return self.loopThread.submit(self.session.ask(messageText, typeUser, useChatHistory, history, **kwargs))
+
+    def askStreamFuture(self, messageText: str, onDelta: Callable[[str], Any], typeUser: str = "user", useChatHistory: bool = True, history: ChatHistory | None = None, **kwargs) -> concurrent.futures.Future:
+        """Запустить потоковый запрос в фоне. Каждый новый фрагмент ответа передается в `onDelta`
+        (вызывается из фонового цикла событий).
+
+        Returns:
+            concurrent.futures.Future: Future с полным текстом ответа нейронной сети
+        """
+        async def consume() -> str:
+            chunks = []
+            async for delta in self.session.askStream(messageText, typeUser, useChatHistory, history, **kwargs):
+                chunks.append(delta)
+                onDelta(delta)
+            return "".join(chunks)
+        return self.loopThread.submit(consume())
+
+    def customAskStreamFuture(self, messages: list[dict[str, str]], onDelta: Callable[[str], Any], **kwargs) -> concurrent.futures.Future:
+        """Запустить потоковый `customAsk` в фоне. Каждый новый фрагмент ответа передается в `onDelta`
+        (вызывается из фонового цикла событий).
+
+        Returns:
+            concurrent.futures.Future: Future с полным текстом ответа нейронной сети
+        """
+        async def consume() -> str:
+            chunks = []
+            async for delta in self.session.customAskStream(messages, **kwargs):
+                chunks.append(delta)
+                onDelta(delta)
+            return "".join(chunks)
+        return self.loopThread.submit(consume())
+
+    def customAskFuture(self, messages: list[dict[str, str]], **kwargs) -> concurrent.futures.Future:
+        """Запустить `customAsk` в фоне
+
+        Returns:
+            concurrent.futures.Future: Future со строкой ответа нейронной сети
+        """
+        return self.loopThread.submit(self.session.customAsk(messages, **kwargs))
+
+    def ask(self, messageText: str, typeUser: str = "user", useChatHistory: bool = True, history: ChatHistory | None = None, **kwargs) -> str:
+        """Выполнить запрос к нейросети YaGPT и дождаться ответа. Аргументы такие же, как у `YaGPTSession.ask`
+
+        Returns:
+            str: Строка с ответом нейронной сети
+        """
+        return self.askFuture(messageText, typeUser, useChatHistory, history, **kwargs).result()
+
+    def customAsk(self, messages: list[dict[str, str]], **kwargs) -> str:
+        """Выполнить кастомный запрос к нейросети YaGPT и дождаться ответа. Аргументы такие же, как у `YaGPTSession.customAsk`
+
+        Returns:
+            str: Строка с ответом нейронной сети
+        """
+        return self.customAskFuture(messages, **kwargs).result()
+
+    def clearChatHistory(self):
+        """Очищает историю сообщений
+        """
+        # история меняется только из фонового цикла, чтобы не пересекаться с запросами в полете
+        async def clear():
+            self.session.clearChatHistory()
+        self.loopThread.run(clear())
+
+    def close(self):
+        """Закрыть соединения и, если цикл событий создан этой оберткой, остановить его"""
+        if self.session.breaker is not None:
+            self.session.breaker.close()
+        self.loopThread.run(self.session.close())
+        if self._ownsLoop:
+            self.loopThread.stop()
@@ -0,0 +1,338 @@
+"""Бэкенды языковых моделей: формат тела запроса, разбор ответа и потока для конкретного API.
+
+Сессия (`YaGPTSession`, `AsyncYaGPTSession`) отвечает за историю, кэш, планировщик, предохранитель и сетевой
+транспорт, а все, что зависит от API модели, делегирует бэкенду:
+
+- `YandexBackend` - YandexGPT (Yandex Foundation Models), используется по умолчанию;
+- `OpenAICompatibleBackend` - любой сервер с методом `/chat/completions`: llama.cpp (`llama-server`), Ollama, vLLM;
+- `OfflineBackend` - детерминированная заглушка без сети для запуска без ключей и для проверок.
+
+    session = YaGPTSession(backend=OpenAICompatibleBackend("http://127.0.0.1:11434/v1", model="qwen2.5:0.5b"))
+"""
+import json
+import re
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Callable
+
+from ai import prompts
+from ai.streaming import ChatCompletionDeltaParser, StreamDeltaParser, collectStream
+from ai.utils import IAMTokenProvider, RequestBodyTemplate, createOpenAIRequestBody, createRequestBody, toOpenAIMessage
+
+
+class LLMError(Exception):
+    """Языковая модель вернула ошибку вместо ответа"""
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class LLMBackend(ABC):
+    """Формат API языковой модели. Наследники обязаны реализовать сборку тела, разбор ответа и потока"""
+    schema: str = ""
+    """Формат тела запроса. Заготовки тел в `prompts.REGISTRY` разделяются по нему"""
+
+    def __init__(self, url: str, model: str) -> None:
+        """Бэкенд языковой модели
+
+        Args:
+            url (str): Адрес метода генерации ответа
+            model (str): Идентификатор модели в формате API
+        """
+        self.url = url
+        self.model = model
+
+    def headers(self) -> dict[str, str]:
+        """Заголовки запроса
+
+        Returns:
+            dict[str, str]: Словарь с заголовками
+        """
+        return {"Content-Type": "application/json"}
+
+    def headersBlock(self) -> bool:
+        """Будет ли `headers` ждать сеть (например, получения IAM-токена). Асинхронная сессия тогда собирает
+        заголовки в пуле потоков, а не в цикле событий
+
+        Returns:
+            bool: True, если вызов `headers` может блокировать поток
+        """
+        return False
+
+    @abstractmethod
+    def createBody(self, model: str, stream: bool, temperature: float, maxTokens: int, messages: list[dict[str, str]]) -> dict:
+        """Тело запроса из сообщений `{"role": ..., "text": ...}`
+
+        Returns:
+            dict: Словарь, являющийся JSON телом запроса
+        """
+
+    @abstractmethod
+    def createBodyTemplate(self, model: str, stream: bool, temperature: float, maxTokens: int, systemMessage: dict[str, str]) -> RequestBodyTemplate:
+        """Заготовка тела запроса с уже сериализованным системным сообщением (см. `prompts.REGISTRY.bodyTemplate`)
+
+        Returns:
+            RequestBodyTemplate: Заготовка тела запроса
+        """
+
+    @abstractmethod
+    def parseResponse(self, status: int, payload: dict) -> str:
+        """Достать текст ответа модели из JSON тела ответа
+
+        Args:
+            status (int): HTTP статус ответа
+            payload (dict): Разобранное JSON тело ответа
+
+        Returns:
+            str: Текст ответа модели
+
+        Raises:
+            LLMError: Если сервер ответил ошибкой (например, 429 при превышении квоты)
+        """
+
+    @abstractmethod
+    def streamParser(self) -> StreamDeltaParser | ChatCompletionDeltaParser:
+        """Новый разборщик строк потокового ответа"""
+
+    def collectStream(self, body: str) -> str:
+        """Собрать итоговый текст из полного тела потокового ответа"""
+        return collectStream(body, self.streamParser())
+
+    def complete(self, body: dict[str, Any]) -> tuple[int, dict] | None:
+        """Ответ без обращения к сети. `None` - запрос нужно отправить по HTTP
+
+        Returns:
+            tuple[int, dict] | None: HTTP статус и JSON тело ответа
+        """
+        return None
+
+    def completeStream(self, body: dict[str, Any]) -> list[bytes] | None:
+        """Потоковый ответ без обращения к сети. `None` - запрос нужно отправить по HTTP
+
+        Returns:
+            list[bytes] | None: Строки тела ответа
+        """
+        return None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.url!r}, model={self.model!r})"
+
+
+def errorMessage(payload: Any) -> str:
+    """Текст ошибки из тела ответа: `{"error": {"message": ...}}`, `{"error": "..."}` или `{"message": ...}`"""
+    error = payload.get("error", payload) if isinstance(payload, dict) else payload
+    message = error.get("message", error) if isinstance(error, dict) else error
+    return f"{message}"
+
+
+class YandexBackend(LLMBackend):
+    """YandexGPT. Подробнее читайте [здесь](https://yandex.cloud/ru/docs/foundation-models/operations/yandexgpt/create-prompt)"""
+    schema = "yandex"
+
+    def __init__(
+                    self,
+                    folder_id: str,
+                    iam_token: str | IAMTokenProvider,
+                    model_uri: str,
+                    data_logging_enabled: bool = False,
+                    url: str = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion",
+                ) -> None:
+        """YandexGPT
+
+        Args:
+            folder_id (str): Идентификатор каталога с ролью ai.languageModels.user или выше
+            iam_token (str | IAMTokenProvider): IAM-токен либо провайдер, который обновляет токен сам
+            model_uri (str): URI модели вида `gpt://<folder_id>/yandexgpt/latest`
+            data_logging_enabled (bool, optional): Логировать ли сообщения на стороне Яндекса. Defaults to False.
+            url (str, optional): Адрес метода completion. Defaults to адрес Yandex Foundation Models.
+        """
+        super().__init__(url, model_uri)
+        self.folder_id = folder_id
+        self.iam_token = iam_token
+        self.data_logging_enabled = data_logging_enabled
+
+    def headers(self) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.iam_token.token if isinstance(self.iam_token, IAMTokenProvider) else self.iam_token}",
+            "Content-Type": "application/json",
+            "x-folder-id": f"{self.folder_id}",
+            "x-data-logging-enabled": f"{self.data_logging_enabled}".lower()
+        }
+
+    def headersBlock(self) -> bool:
+        return isinstance(self.iam_token, IAMTokenProvider) and self.iam_token.expired
+
+    def createBody(self, model: str, stream: bool, temperature: float, maxTokens: int, messages: list[dict[str, str]]) -> dict:
+        return createRequestBody(model_uri=model, stream=stream, temperature=temperature, maxTokens=maxTokens, messages=messages)
+
+    def createBodyTemplate(self, model: str, stream: bool, temperature: float, maxTokens: int, systemMessage: dict[str, str]) -> RequestBodyTemplate:
+        return RequestBodyTemplate(model, stream, temperature, maxTokens, systemMessage)
+
+    def parseResponse(self, status: int, payload: dict) -> str:
+        if 200 <= status < 300 and "result" in payload:
+            return payload["result"]["alternatives"][0]["message"]["text"]
+        raise LLMError(status, errorMessage(payload))
+
+    def streamParser(self) -> StreamDeltaParser:
+        return StreamDeltaParser()
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Сервер с OpenAI-совместимым методом `/chat/completions`: llama.cpp (`llama-server`), Ollama, vLLM и облачные API.
+
+    Небольшая модель на локальном сервере отвечает на распознавание команд быстрее и дешевле облачной.
+    """
+    schema = "openai"
+
+    def __init__(self, baseUrl: str = "http://127.0.0.1:11434/v1", model: str = "qwen2.5:0.5b", apiKey: str | None = None) -> None:
+        """OpenAI-совместимый сервер
+
+        Args:
+            baseUrl (str, optional): Базовый адрес API (без `/chat/completions`). Defaults to адрес Ollama на этом компьютере.
+            model (str, optional): Имя модели на сервере. llama.cpp его не проверяет. Defaults to "qwen2.5:0.5b".
+            apiKey (str | None, optional): Ключ API для заголовка `Authorization`. Локальным серверам не нужен. Defaults to None.
+        """
+        super().__init__(f"{baseUrl.rstrip('/')}/chat/completions", model)
+        self.apiKey = apiKey
+
+    def headers(self) -> dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.apiKey:
+            headers["Authorization"] = f"Bearer {self.apiKey}"
+        return headers
+
+    def createBody(self, model: str, stream: bool, temperature: float, maxTokens: int, messages: list[dict[str, str]]) -> dict:
+        return createOpenAIRequestBody(model=model, stream=stream, temperature=temperature, maxTokens=maxTokens, messages=messages)
+
+    def createBodyTemplate(self, model: str, stream: bool, temperature: float, maxTokens: int, systemMessage: dict[str, str]) -> RequestBodyTemplate:
+        return RequestBodyTemplate(model, stream, temperature, maxTokens, systemMessage, createBody=createOpenAIRequestBody, formatMessage=toOpenAIMessage)
+
+    def parseResponse(self, status: int, payload: dict) -> str:
+        if 200 <= status < 300 and payload.get("choices"):
+            return payload["choices"][0]["message"].get("content") or ""
+        raise LLMError(status, errorMessage(payload))
+
+    def streamParser(self) -> ChatCompletionDeltaParser:
+        return ChatCompletionDeltaParser()
+
+
+class OfflineBackend(OpenAICompatibleBackend):
+    """Детерминированная заглушка без сети. Одинаковые сообщения всегда получают одинаковые ответы.
+
+    На запрос с перечнем команд выбирает команду, слова которой есть в сообщении игрока, и отвечает в формате
+    промпта (JSON объект, пакетный JSON массив или одно слово для `SYSTEM_PROMPT_INTENT`). На остальные сообщения
+    отвечает одной из заготовленных фраз `Prompts.CANNED_REPLIES`.
+    """
+    schema = "openai"
+    COMMANDS_PATTERN = re.compile(r"перечень (?:слов|команд): \[(.*?)\]")
+    BATCH_LINE_PATTERN = re.compile(r"^(\d+): (.*)$", re.MULTILINE)
+
+    def __init__(self, respond: Callable[[list[dict[str, str]]], str] | None = None, streamChunkSize: int = 16) -> None:
+        """Заглушка языковой модели
+
+        Args:
+            respond (Callable[[list[dict[str, str]]], str] | None, optional): Своя функция ответа на сообщения `{"role": ..., "text": ...}`. Defaults to None.
+            streamChunkSize (int, optional): Длина фрагментов потокового ответа в символах. Defaults to 16.
+        """
+        super().__init__(model="offline")
+        # запросы не уходят в сеть, адрес нужен только для логов и `repr`
+        self.url = "offline://"
+        self.respond = respond or self.answer
+        self.streamChunkSize = streamChunkSize
+
+    @staticmethod
+    def _pick(options: list[str], text: str) -> str:
+        return options[zlib.crc32(text.encode()) % len(options)]
+
+    def answer(self, messages: list[dict[str, str]]) -> str:
+        """Ответ заглушки по умолчанию
+
+        Args:
+            messages (list[dict[str, str]]): Сообщения запроса
+
+        Returns:
+            str: Текст ответа
+        """
+        userText = messages[-1]["text"] if messages else ""
+        system = next((m["text"] for m in messages if m["role"] == "system"), "")
+        match = self.COMMANDS_PATTERN.search(system)
+        if match is None:
+            return self._pick(prompts.Prompts.CANNED_REPLIES, userText)
+
+        commands = [c.strip() for c in match.group(1).split(",") if c.strip()]
+
+        def compare(text: str) -> dict:
+            words = set(re.findall(r"\w+", text.lower()))
+            result = next((c for c in commands if words & set(c.split())), None)
+            options = prompts.Prompts.CANNED_COMMAND_REPLIES if result is not None else prompts.Prompts.CANNED_REPLIES
+            return {"result": result, "creative": self._pick(options, text)}
+
+        if "JSON" not in system:
+            return compare(userText)["result"] or "null"
+        if '"id"' in system:
+            lines = self.BATCH_LINE_PATTERN.findall(userText)
+            return json.dumps([{"id": int(number), **compare(text)} for number, text in lines], ensure_ascii=False)
+        return json.dumps(compare(userText), ensure_ascii=False)
+
+    def _respond(self, body: dict[str, Any]) -> str:
+        # сообщения в теле уже в формате OpenAI
+        return self.respond([{"role": m["role"], "text": m.get("content", m.get("text", ""))} for m in body.get("messages", [])])
+
+    def complete(self, body: dict[str, Any]) -> tuple[int, dict]:
+        text = self._respond(body)
+        return 200, {
+            "model": self.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        }
+
+    def completeStream(self, body: dict[str, Any]) -> list[bytes]:
+        text = self._respond(body)
+        chunks = [text[i:i + self.streamChunkSize] for i in range(0, len(text), self.streamChunkSize)]
+        lines = [
+            f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': chunk}, 'finish_reason': None}]}, ensure_ascii=False)}".encode()
+            for chunk in chunks
+        ]
+        lines.append(f"data: {json.dumps({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}".encode())
+        lines.append(b"data: [DONE]")
+        return lines
+
+
+BACKENDS: dict[str, type[LLMBackend]] = {
+    "yandex": YandexBackend,
+    "openai": OpenAICompatibleBackend,
+    "offline": OfflineBackend,
+}
+"""Бэкенды, которые можно создать по названию через `createBackend`"""
+
+
+def createBackend(
+                    kind: str,
+                    url: str | None = None,
+                    model: str | None = None,
+                    apiKey: str | None = None,
+                    folder_id: str = "",
+                    iam_token: str | IAMTokenProvider | Callable[[], str | IAMTokenProvider] = "",
+                ) -> LLMBackend:
+    """Создать бэкенд по названию
+
+    Args:
+        kind (str): `yandex`, `openai` или `offline`
+        url (str | None, optional): Адрес API: для YandexGPT - метода completion, для OpenAI-совместимого - базовый. Defaults to None.
+        model (str | None, optional): Имя модели (для YandexGPT - например, `yandexgpt/latest`). Defaults to None.
+        apiKey (str | None, optional): Ключ OpenAI-совместимого API. Defaults to None.
+        folder_id (str, optional): Каталог YandexGPT. Defaults to "".
+        iam_token (str | IAMTokenProvider | Callable, optional): IAM-токен YandexGPT или функция, создающая его только для этого бэкенда. Defaults to "".
+
+    Returns:
+        LLMBackend: Бэкенд
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд языковой модели `{kind}`. Доступны: {', '.join(BACKENDS)}")
+    if kind == "yandex":
+        token = iam_token() if callable(iam_token) else iam_token
+        kwargs = {"url": url} if url else {}
+        return YandexBackend(folder_id, token, f"gpt://{folder_id}/{model or 'yandexgpt/latest'}", **kwargs)
+    if kind == "offline":
+        return OfflineBackend()
+    kwargs = {k: v for k, v in {"baseUrl": url, "model": model, "apiKey": apiKey}.items() if v}
+    return OpenAICompatibleBackend(**kwargs) # type: ignore
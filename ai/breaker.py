@@ -0,0 +1,265 @@
+"""Предохранитель (circuit breaker) перед языковой моделью.
+
+Если заметная доля запросов за последнее окно заканчивается ошибкой или отвечает слишком медленно, предохранитель
+размыкается, и следующие запросы сразу получают `CircuitOpenError` вместо ожидания полного таймаута. Бот в это
+время распознает команды локально и отвечает заготовленными фразами. Через `openFor` секунд предохранитель
+переходит в полуоткрытое состояние и проверяет модель пробным запросом в фоне: удачная проверка замыкает его,
+неудачная - размыкает снова на вдвое больший срок (но не больше `maxOpenFor`).
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator
+
+from utils.logs import getLogger
+from utils.metrics import REGISTRY
+
+
+log = getLogger(__name__)
+
+BREAKER_TRANSITIONS = REGISTRY.counter("ai_breaker_transitions_total", "Переключения предохранителя языковой модели по новому состоянию")
+BREAKER_REJECTED = REGISTRY.counter("ai_breaker_rejected_total", "Запросы, отклоненные разомкнутым предохранителем")
+
+
+class CircuitOpenError(RuntimeError):
+    """Предохранитель разомкнут: запрос к модели не отправлялся"""
+
+
+class BREAKER_STATES(object):
+    """Состояния предохранителя"""
+    CLOSED = "closed"
+    """Запросы идут к модели"""
+    OPEN = "open"
+    """Запросы сразу отклоняются"""
+    HALF_OPEN = "halfOpen"
+    """Идет проверка: пропускается только пробный запрос"""
+
+
+def isFailureStatus(status: int | None) -> bool:
+    """Считается ли HTTP статус отказом модели (429 и 5xx). Ошибки в самом запросе (4xx) модель не характеризуют"""
+    return status is not None and (status == 429 or status >= 500)
+
+
+class CircuitBreaker:
+    """Предохранитель по доле ошибок и медленных ответов за скользящее окно"""
+    def __init__(
+                    self,
+                    failureRate: float = 0.5,
+                    slowRate: float = 0.5,
+                    slowCall: float = 10.0,
+                    minRequests: int = 5,
+                    window: float = 30.0,
+                    openFor: float = 10.0,
+                    maxOpenFor: float = 120.0,
+                    probe: Callable[[], bool] | None = None,
+                ) -> None:
+        """Предохранитель перед языковой моделью
+
+        Args:
+            failureRate (float, optional): Доля ошибок за окно, при которой предохранитель размыкается. Defaults to 0.5.
+            slowRate (float, optional): Доля медленных ответов за окно, при которой предохранитель размыкается. Defaults to 0.5.
+            slowCall (float, optional): С какой длительности (в секундах, для потока - до первого фрагмента) ответ считается медленным. Defaults to 10.0.
+            minRequests (int, optional): Сколько запросов должно быть в окне, чтобы решение было осмысленным. Defaults to 5.
+            window (float, optional): Длина скользящего окна в секундах. Defaults to 30.0.
+            openFor (float, optional): Через сколько секунд после размыкания начинать проверку. Defaults to 10.0.
+            maxOpenFor (float, optional): Максимальный срок размыкания после нескольких неудачных проверок. Defaults to 120.0.
+            probe (Callable[[], bool] | None, optional): Пробный запрос, возвращающий True, если модель отвечает. Без него пробным становится первый настоящий запрос. Defaults to None.
+        """
+        self.failureRate = failureRate
+        self.slowRate = slowRate
+        self.slowCall = slowCall
+        self.minRequests = minRequests
+        self.window = window
+        self.openFor = openFor
+        self.maxOpenFor = maxOpenFor
+        self.probe = probe
+
+        self.state: str = BREAKER_STATES.CLOSED
+        self._calls: deque[tuple[float, bool, bool]] = deque()
+        """Запросы за окно: момент завершения, ошибка, медленный ответ"""
+        self._lock = threading.Lock()
+        self._openedAt: float = 0.0
+        self._currentOpenFor: float = openFor
+        self._trialInFlight = False
+        self._timer: threading.Timer | None = None
+
+        self.stats: dict[str, int] = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "opened": 0, "probes": 0}
+        REGISTRY.gauge("ai_breaker_open", lambda: 0 if self.state == BREAKER_STATES.CLOSED else 1, "Разомкнут ли предохранитель языковой модели")
+
+    @property
+    def isOpen(self) -> bool:
+        """True, если запросы к модели сейчас отклоняются"""
+        return self.state != BREAKER_STATES.CLOSED
+
+    def _transition(self, state: str):
+        # вызывается под self._lock
+        if self.state == state:
+            return
+        self.state = state
+        BREAKER_TRANSITIONS.inc(state=state)
+        log.warning("ai breaker", state=state, openFor=self._currentOpenFor if state == BREAKER_STATES.OPEN else None)
+
+    def _open(self, backoff: bool):
+        # вызывается под self._lock
+        self._currentOpenFor = min(self.maxOpenFor, self._currentOpenFor * 2) if backoff else self.openFor
+        self._openedAt = time.monotonic()
+        self._trialInFlight = False
+        self._calls.clear()
+        self.stats["opened"] += 1
+        self._transition(BREAKER_STATES.OPEN)
+        if self.probe is not None:
+            self._timer = threading.Timer(self._currentOpenFor, self._runProbe)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _close(self):
+        # вызывается под self._lock
+        self._calls.clear()
+        self._trialInFlight = False
+        self._currentOpenFor = self.openFor
+        self._transition(BREAKER_STATES.CLOSED)
+
+    def _runProbe(self):
+        with self._lock:
+            if self.state != BREAKER_STATES.OPEN:
+                return
+            self._transition(BREAKER_STATES.HALF_OPEN)
+            self.stats["probes"] += 1
+        try:
+            healthy = bool(self.probe()) # type: ignore
+        except Exception as e:
+            log.debug("ai breaker probe failed", error=str(e))
+            healthy = False
+        with self._lock:
+            if healthy:
+                self._close()
+            else:
+                self._open(backoff=True)
+
+    def before(self) -> float:
+        """Проверить, можно ли отправлять запрос
+
+        Returns:
+            float: Момент начала запроса по `time.monotonic()` для `record`
+
+        Raises:
+            CircuitOpenError: Если предохранитель разомкнут
+        """
+        with self._lock:
+            if self.state == BREAKER_STATES.OPEN and self.probe is None and time.monotonic() - self._openedAt >= self._currentOpenFor:
+                # без фоновой проверки пробным становится этот запрос
+                self._transition(BREAKER_STATES.HALF_OPEN)
+            if self.state == BREAKER_STATES.HALF_OPEN and self.probe is None and not self._trialInFlight:
+                self._trialInFlight = True
+                return time.monotonic()
+            if self.state != BREAKER_STATES.CLOSED:
+                self.stats["rejected"] += 1
+                BREAKER_REJECTED.inc()
+                raise CircuitOpenError("Языковая модель временно недоступна")
+        return time.monotonic()
+
+    def record(self, ok: bool, seconds: float):
+        """Учесть результат запроса
+
+        Args:
+            ok (bool): Запрос выполнен без ошибки модели
+            seconds (float): Длительность запроса (для потока - до первого фрагмента)
+        """
+        slow = seconds >= self.slowCall
+        now = time.monotonic()
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += not ok
+            self.stats["slow"] += slow
+            if self.state == BREAKER_STATES.HALF_OPEN:
+                # исход пробного запроса решает, замкнуться или разомкнуться снова
+                if self._trialInFlight and ok and not slow:
+                    self._close()
+                elif self._trialInFlight:
+                    self._open(backoff=True)
+                return
+            if self.state != BREAKER_STATES.CLOSED:
+                return
+
+            self._calls.append((now, not ok, slow))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+            count = len(self._calls)
+            if count < self.minRequests:
+                return
+            failures = sum(1 for _, failed, _ in self._calls if failed)
+            slowCalls = sum(1 for _, _, isSlow in self._calls if isSlow)
+            if failures / count >= self.failureRate or slowCalls / count >= self.slowRate:
+                self._open(backoff=False)
+
+    def wrap(self, send: Callable[[], Any], statusOf: Callable[[Any], int]) -> Callable[[], Any]:
+        """Обернуть функцию отправки запроса (аналогично `RequestScheduler.run`)
+
+        Args:
+            send (Callable[[], Any]): Функция, выполняющая запрос
+            statusOf (Callable[[Any], int]): Функция, достающая HTTP статус из результата `send`
+
+        Returns:
+            Callable[[], Any]: Функция с той же сигнатурой, учитывающая результат в предохранителе
+        """
+        def guarded() -> Any:
+            started = self.before()
+            try:
+                result = send()
+            except Exception:
+                self.record(False, time.monotonic() - started)
+                raise
+            self.record(not isFailureStatus(statusOf(result)), time.monotonic() - started)
+            return result
+        return guarded
+
+    def wrapAsync(self, send: Callable[[], Awaitable[Any]], statusOf: Callable[[Any], int]) -> Callable[[], Awaitable[Any]]:
+        """Асинхронный вариант `wrap`"""
+        async def guarded() -> Any:
+            started = self.before()
+            try:
+                result = await send()
+            except Exception:
+                self.record(False, time.monotonic() - started)
+                raise
+            self.record(not isFailureStatus(statusOf(result)), time.monotonic() - started)
+            return result
+        return guarded
+
+    def guardStream(self, lines: Iterator[Any]) -> Iterator[Any]:
+        """Обернуть ленивый поток ответа. Медленным считается долгое ожидание первой строки, а не длина всего ответа"""
+        started = self.before()
+        firstLine: float | None = None
+        failed = False
+        try:
+            for line in lines:
+                if firstLine is None:
+                    firstLine = time.monotonic() - started
+                yield line
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # поток, брошенный вызывающим на середине, не считается отказом модели
+            self.record(not failed, firstLine if firstLine is not None else time.monotonic() - started)
+
+    async def guardStreamAsync(self, lines: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """Асинхронный вариант `guardStream`"""
+        started = self.before()
+        firstLine: float | None = None
+        failed = False
+        try:
+            async for line in lines:
+                if firstLine is None:
+                    firstLine = time.monotonic() - started
+                yield line
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.record(not failed, firstLine if firstLine is not None else time.monotonic() - started)
+
+    def close(self):
+        """Отменить запланированную проверку"""
+        if self._timer is not None:
+            self._timer.cancel()
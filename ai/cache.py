@@ -0,0 +1,133 @@
+"""Постоянный кэш ответов нейросети на диске (sqlite)
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any
+
+
+class ResponseCache:
+    """Кэш ответов модели в файле sqlite с ограничением по времени жизни и количеству записей.
+
+    Ключ записи - хеш от произвольного набора частей (нормализованный текст игрока, версия списка команд,
+    параметры модели и т.д.), см. `makeKey`.
+    """
+    def __init__(self, path: str = ".aicache.sqlite", ttl: float | None = 7 * 24 * 3600, maxEntries: int = 10000, evictEvery: int = 100) -> None:
+        """Кэш ответов модели в файле sqlite
+
+        Args:
+            path (str, optional): Путь к файлу базы. `:memory:` - хранить только в памяти. Defaults to ".aicache.sqlite".
+            ttl (float | None, optional): Время жизни записи в секундах. `None` - записи не устаревают. Defaults to неделя.
+            maxEntries (int, optional): Максимальное количество записей. Сверх него удаляются записи, к которым дольше всего не обращались. Defaults to 10000.
+            evictEvery (int, optional): Раз в сколько записей удалять устаревшие и лишние записи. Между чистками кэш может превысить `maxEntries` не больше чем на `evictEvery - 1` записей. Defaults to 100.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.evictEvery = max(1, evictEvery)
+        self._writes: int = 0
+        """Сколько записей сделано с последней чистки"""
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def makeKey(*parts: Any) -> str:
+        """Собрать ключ кэша из частей. Части должны сериализоваться в JSON
+
+        Returns:
+            str: sha256 от частей ключа
+        """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Вернуть сохраненный ответ или `None`, если его нет или он устарел
+
+        Args:
+            key (str): Ключ из `makeKey`
+
+        Returns:
+            str | None: Сохраненный ответ модели
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str):
+        """Сохранить ответ модели
+
+        Args:
+            key (str): Ключ из `makeKey`
+            value (str): Ответ модели
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            # чистка - это удаление по индексу и подсчет всех записей, поэтому она идет не на каждую запись
+            self._writes += 1
+            if self._writes >= self.evictEvery:
+                self._evict(now)
+
+    def evict(self):
+        """Сразу удалить устаревшие записи и записи сверх `maxEntries`"""
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now: float):
+        self._writes = 0
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        overflow = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.maxEntries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self):
+        """Удалить все записи кэша"""
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+    def stats(self) -> dict[str, float]:
+        """Статистика кэша
+
+        Returns:
+            dict[str, float]: Количество попаданий, промахов, доля попаданий и число записей
+        """
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / total if total else 0.0,
+            "size": size,
+        }
+
+    def close(self):
+        """Закрыть файл базы"""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,152 @@
+"""Окно контекста: какая часть истории беседы уходит в запрос к модели.
+
+История игрока хранит больше реплик, чем стоит отправлять в каждом запросе: задержка и стоимость ответа растут
+с количеством входных токенов. `ContextWindow` подбирает для запроса самые свежие реплики, которые помещаются
+в бюджет токенов, а более старые заменяет кратким содержанием. Оценки токенов и краткие содержания кэшируются,
+поэтому подбор окна не пересчитывает всю историю при каждом запросе.
+"""
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable
+
+from ai.history import SUMMARY_PREFIX, ChatHistory, compactTurns
+from ai.utils import createMessageBody, estimateTokens
+from utils.metrics import REGISTRY
+
+
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "ai_context_tokens", "Примерное количество входных токенов в запросе с историей",
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192),
+)
+
+
+class ContextWindow:
+    """Подбирает реплики истории под бюджет входных токенов.
+
+    Последняя реплика (обычно текущее сообщение игрока) попадает в запрос всегда. Реплики, не поместившиеся в окно,
+    вместе с кратким содержанием самой истории сворачиваются в одно системное сообщение. Содержание наращивается
+    по мере того, как реплики выходят из окна, и не пересобирается заново, пока граница окна не сдвинулась.
+    """
+    def __init__(
+                    self,
+                    maxInputTokens: int = 2000,
+                    summarize: bool = True,
+                    summaryChars: int = 600,
+                    estimator: Callable[[str], int] = estimateTokens,
+                    cacheSize: int = 4096,
+                ) -> None:
+        """Окно контекста
+
+        Args:
+            maxInputTokens (int, optional): Бюджет входных токенов вместе с системным промптом. Defaults to 2000.
+            summarize (bool, optional): Заменять реплики за пределами окна кратким содержанием. Defaults to True.
+            summaryChars (int, optional): Максимальная длина краткого содержания. Defaults to 600.
+            estimator (Callable[[str], int], optional): Оценка количества токенов в тексте. Defaults to estimateTokens.
+            cacheSize (int, optional): Сколько оценок токенов хранить. Defaults to 4096.
+        """
+        self.maxInputTokens = maxInputTokens
+        self.summarize = summarize
+        self.summaryChars = summaryChars
+        self.estimator = estimator
+        self.cacheSize = cacheSize
+
+        self._tokens: OrderedDict[str, int] = OrderedDict()
+        """Текст сообщения -> оценка токенов. Хеш строки Python хранит в самом объекте, поэтому повторный поиск дешевый"""
+        self._summaries: weakref.WeakKeyDictionary[ChatHistory, tuple[str | None, dict[str, str], str, dict[str, str]]] = weakref.WeakKeyDictionary()
+        """История -> (ее краткое содержание, последняя свернутая реплика, текст, готовое сообщение). Выгруженные истории удаляются сами"""
+        self._lock = threading.Lock()
+
+        self.stats: dict[str, int] = {"requests": 0, "droppedTurns": 0, "tokenHits": 0, "tokenMisses": 0, "summaryHits": 0, "summaryBuilds": 0}
+
+    def tokens(self, message: dict[str, str]) -> int:
+        """Оценка токенов сообщения с кэшем по тексту
+
+        Args:
+            message (dict[str, str]): Сообщение `{"role": ..., "text": ...}`
+
+        Returns:
+            int: Примерное количество токенов
+        """
+        text = message["text"]
+        with self._lock:
+            count = self._tokens.get(text)
+            if count is not None:
+                self.stats["tokenHits"] += 1
+                return count
+        count = self.estimator(text)
+        with self._lock:
+            self.stats["tokenMisses"] += 1
+            self._tokens[text] = count
+            if len(self._tokens) > self.cacheSize:
+                self._tokens.popitem(last=False)
+        return count
+
+    def _summaryMessage(self, history: ChatHistory, dropped: list[dict[str, str]]) -> dict[str, str]:
+        with self._lock:
+            cached = self._summaries.get(history)
+        if cached is not None and cached[0] == history.summary:
+            _, through, text, message = cached
+            # ищем с конца: обычно граница окна сдвигается на одну-две реплики
+            for i in range(len(dropped) - 1, -1, -1):
+                if dropped[i] is through:
+                    if i == len(dropped) - 1:
+                        self.stats["summaryHits"] += 1
+                        return message
+                    text = compactTurns(text, dropped[i + 1:], self.summaryChars)
+                    break
+            else:
+                text = compactTurns(history.summary, dropped, self.summaryChars)
+        else:
+            text = compactTurns(history.summary, dropped, self.summaryChars)
+
+        self.stats["summaryBuilds"] += 1
+        message = createMessageBody(f"{SUMMARY_PREFIX}{text}", "system")
+        with self._lock:
+            self._summaries[history] = (history.summary, dropped[-1], text, message)
+        return message
+
+    def fit(self, history: ChatHistory, pending: list[dict[str, str]] | None = None) -> list[dict[str, str]]:
+        """Сообщения истории после системного промпта, помещающиеся в бюджет
+
+        Args:
+            history (ChatHistory): История беседы
+            pending (list[dict[str, str]] | None, optional): Реплики после истории, которые еще не сохранены в нее (например, новое сообщение игрока). Defaults to None.
+
+        Returns:
+            list[dict[str, str]]: Краткое содержание (если нужно) и самые свежие реплики в хронологическом порядке
+        """
+        turns = list(history.turns) + (pending or [])
+        systemTokens = self.tokens(history.systemMessage)
+        budget = self.maxInputTokens - systemTokens
+        stored = history.contextTurns()[0] if history.summary else None
+        summaryReserve = 0
+        if self.summarize:
+            # место под содержание резервируется заранее, чтобы после его добавления окно не пришлось подбирать заново
+            summaryReserve = len(SUMMARY_PREFIX) // 3 + self.summaryChars // 3 + 1
+            if stored is not None:
+                summaryReserve = max(summaryReserve, self.tokens(stored))
+
+        available = budget - summaryReserve if (self.summarize and (stored is not None or turns)) else budget
+        used = 0
+        start = len(turns)
+        for i in range(len(turns) - 1, -1, -1):
+            cost = self.tokens(turns[i])
+            if start < len(turns) and used + cost > available:
+                break
+            used += cost
+            start = i
+
+        dropped = turns[:start]
+        kept = turns[start:]
+        self.stats["requests"] += 1
+        self.stats["droppedTurns"] += len(dropped)
+
+        prefix: list[dict[str, str]] = []
+        if self.summarize and dropped:
+            prefix = [self._summaryMessage(history, dropped)]
+        elif self.summarize and stored is not None:
+            prefix = [stored]
+
+        CONTEXT_TOKENS.observe(systemTokens + used + (self.tokens(prefix[0]) if prefix else 0))
+        return prefix + kept
@@ -0,0 +1,83 @@
+"""Создание сессий языковых моделей и историй переписки по параметрам командной строки.
+
+Общая точка сборки для `main.py` (один бот) и `fleet.py` (несколько ботов в одном процессе). Модули клиента
+импортируются внутри `createAi`, поэтому импорт этого модуля ничего не стоит, а сама сборка может идти в фоне,
+пока бот подключается к серверу.
+"""
+import atexit
+import functools
+import os
+from typing import Any
+
+
+def createAi(options, maxSessions: int | None = None) -> tuple[Any, Any, Any]:
+    """Создать основную сессию, менеджер историй и (если задан `--intentBackend`) сессию локальной модели для команд
+
+    Args:
+        options (`utils.cli.Cli`): Параметры командной строки (`aiBackend`, `aiUrl`, `aiModel`, `aiConcurrency`, `aiRps`,
+            `aiSlowCall`, `contextTokens`, `historyStore`, `historyPath`, `historySessions`, `historyMessages`, `historyTtl`,
+            `intentBackend`, `intentUrl`, `intentModel`, `intentTimeout`)
+        maxSessions (int | None, optional): Сколько историй переписки держать в памяти, если не задан `--historySessions`. По умолчанию - как у `ChatSessionManager`. Defaults to None.
+
+    Returns:
+        tuple[Any, Any, Any]: `PooledYaGPTSession`, `ChatSessionManager` и `PooledYaGPTSession` локальной модели или `None`
+    """
+    import ai.utils, ai.asyncSession, ai.backends, ai.breaker, ai.history, ai.historyStore, ai.scheduler, ai.transport
+
+    @functools.cache
+    def iamToken() -> ai.utils.IAMTokenProvider:
+        # IAM-токен нужен только бэкендам YandexGPT и создается один раз на процесс. Он получается здесь, при запуске,
+        # поэтому первый запрос из цикла событий уже не ждет IAM
+        provider = ai.utils.IAMTokenProvider().start()
+        provider.token
+        return provider
+
+    def createBackend(prefix: str, default: str | None):
+        return ai.backends.createBackend(
+            options.getOption(f"{prefix}Backend") or default,
+            options.getOption(f"{prefix}Url"),
+            options.getOption(f"{prefix}Model"),
+            os.environ.get("OPENAI_API_KEY"),
+            folder_id=os.environ.get("YAGPT_FOLDERID") or "",
+            iam_token=iamToken,
+        )
+
+    # по умолчанию YandexGPT; `openai` - любой OpenAI-совместимый сервер, `offline` - заглушка без сети
+    yagpt = ai.asyncSession.PooledYaGPTSession(
+        backend=createBackend("ai", "yandex"),
+        temperature=0.1,
+        maxTokens=1000,
+        maxConcurrency=int(options.getOption("aiConcurrency") or 16),
+        # в запрос уходят свежие реплики в пределах бюджета, а старые - кратким содержанием
+        maxInputTokens=int(options.getOption("contextTokens") or 2000),
+        # при нагрузке запросы ждут в очереди в пределах квоты каталога, а не падают с 429
+        scheduler=ai.scheduler.RequestScheduler(rate=float(options.getOption("aiRps") or 10)),
+        # при сбоях или медленных ответах модели бот сразу переходит на локальные команды и заготовленные ответы
+        breaker=ai.breaker.CircuitBreaker(slowCall=float(options.getOption("aiSlowCall") or 10)),
+    )
+    # истории сохраняются между перезапусками; запись идет пачками в фоне и не задерживает ответы
+    storeKind = options.getOption("historyStore") or "file"
+    store = None if storeKind == "none" else ai.historyStore.createHistoryStore(storeKind, options.getOption("historyPath"))
+    sessions = options.getOption("historySessions") or maxSessions
+    # у каждого игрока своя ограниченная история, чтобы запросы не росли со временем работы сервера
+    chatSessions = ai.history.ChatSessionManager(
+        yagpt.systemPrompt,
+        **({"maxSessions": int(sessions)} if sessions else {}),
+        maxMessages=int(options.getOption("historyMessages") or 20),
+        idleTtl=float(options.getOption("historyTtl") or 1800),
+        store=store,
+    )
+    atexit.register(chatSessions.close)
+
+    # команды распознает небольшая локальная модель, а основная получает только сообщения для креативного ответа
+    intentSession = None
+    if options.getOption("intentBackend"):
+        intentSession = ai.asyncSession.PooledYaGPTSession(
+            backend=createBackend("intent", None),
+            temperature=0,
+            maxTokens=16,
+            loopThread=yagpt.loopThread,
+            # свой пул с коротким таймаутом: зависшая локальная модель не должна задерживать ответ основной
+            transport=ai.transport.PooledTransport(maxConcurrency=4, requestTimeout=float(options.getOption("intentTimeout") or 5)),
+        )
+    return yagpt, chatSessions, intentSession
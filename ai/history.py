@@ -0,0 +1,319 @@
+"""История переписки с ботом, ограниченная по размеру, и менеджер историй для каждого игрока
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable
+
+from ai import prompts
+from ai.historyStore import HistoryStore
+from ai.utils import createMessageBody, estimateTokens
+
+
+SUMMARY_PREFIX = "Краткое содержание прошлой беседы:\n"
+
+
+def compactTurns(summary: str | None, turns: list[dict[str, str]], maxChars: int = 600) -> str:
+    """Сжать вытесняемые реплики в краткое содержание без обращения к модели: каждая реплика укорачивается
+    до одной строки, а от всего содержания остаются последние `maxChars` символов
+
+    Args:
+        summary (str | None): Прежнее краткое содержание
+        turns (list[dict[str, str]]): Вытесняемые реплики
+        maxChars (int, optional): Максимальная длина содержания. Defaults to 600.
+
+    Returns:
+        str: Новое краткое содержание
+    """
+    lines = summary.split("\n") if summary else []
+    for turn in turns:
+        who = "Игрок" if turn["role"] == "user" else "Бот"
+        text = " ".join(turn["text"].split())
+        lines.append(f"{who}: {text[:117] + '...' if len(text) > 120 else text}")
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > maxChars:
+        lines.pop(0)
+    return "\n".join(lines)[-maxChars:]
+
+
+class ChatHistory:
+    """История сообщений одной беседы. Системный промпт всегда стоит первым и никогда не вытесняется,
+    а самые старые реплики удаляются, когда история превышает заданные лимиты.
+    """
+    def __init__(
+                    self,
+                    systemPrompt: str,
+                    maxMessages: int | None = None,
+                    maxTokens: int | None = None,
+                    summaryChars: int | None = None,
+                    onChange: Callable[["ChatHistory"], Any] | None = None,
+                ) -> None:
+        """История сообщений одной беседы
+
+        Args:
+            systemPrompt (str): Текст системного промпта, закрепленного в начале истории
+            maxMessages (int | None, optional): Сколько реплик (без системного промпта) хранить. `None` - без ограничения. Defaults to None.
+            maxTokens (int | None, optional): Сколько примерно токенов могут занимать реплики. `None` - без ограничения. Defaults to None.
+            summaryChars (int | None, optional): Длина краткого содержания вытесненных реплик. `None` - вытесненные реплики просто забываются. Defaults to None.
+            onChange (Callable[[ChatHistory], Any] | None, optional): Вызывается после каждого изменения истории (например, для сохранения на диск). Defaults to None.
+        """
+        self.systemMessage: dict[str, str] = prompts.REGISTRY.systemMessage(systemPrompt)
+        self.maxMessages = maxMessages
+        self.maxTokens = maxTokens
+        self.summaryChars = summaryChars
+        self.onChange = onChange
+
+        self.turns: deque[dict[str, str]] = deque()
+        self.tokens: int = 0
+        """Примерное количество токенов во всех репликах истории"""
+        self.summary: str | None = None
+        """Краткое содержание реплик, вытесненных из истории"""
+        self._summaryMessage: dict[str, str] | None = None
+        self.lastUsed: float = time.monotonic()
+        self._lock = threading.RLock()
+
+    @property
+    def messages(self) -> list[dict[str, str]]:
+        """Список сообщений для тела запроса: системный промпт, краткое содержание и сохраненные реплики"""
+        return [self.systemMessage, *self.contextTurns()]
+
+    def contextTurns(self) -> list[dict[str, str]]:
+        """Сообщения после системного промпта: краткое содержание прошлой беседы (если есть) и реплики"""
+        if self.summary and self._summaryMessage is None:
+            self._summaryMessage = createMessageBody(f"{SUMMARY_PREFIX}{self.summary}", "system")
+        return [self._summaryMessage, *self.turns] if self.summary else list(self.turns) # type: ignore
+
+    def append(self, text: str, role: str = "user") -> list[dict[str, str]]:
+        """Сохранить сообщение в историю и вытеснить старые реплики, если превышены лимиты
+
+        Args:
+            text (str): Текст сообщения
+            role (str, optional): Роль автора сообщения: `user`, `system` или `assistant`. Defaults to "user".
+
+        Returns:
+            list[dict[str, str]]: Список сообщений истории
+        """
+        return self.extend([(text, role)])
+
+    def extend(self, messages: list[tuple[str, str]]) -> list[dict[str, str]]:
+        """Сохранить несколько сообщений подряд (например, вопрос игрока и ответ модели). Другие потоки не могут
+        вставить свои сообщения между ними, а лимиты и `onChange` применяются один раз
+
+        Args:
+            messages (list[tuple[str, str]]): Пары (текст, роль) в хронологическом порядке
+
+        Returns:
+            list[dict[str, str]]: Список сообщений истории
+        """
+        with self._lock:
+            for text, role in messages:
+                self.turns.append(createMessageBody(text, role))
+                self.tokens += estimateTokens(text)
+            self.lastUsed = time.monotonic()
+            self._trim()
+            self._changed()
+            return self.messages
+
+    def _trim(self):
+        # последняя реплика остается всегда, даже если она одна не влезает в лимит
+        dropped = []
+        while len(self.turns) > 1 and (
+            (self.maxMessages is not None and len(self.turns) > self.maxMessages)
+            or (self.maxTokens is not None and self.tokens > self.maxTokens)
+        ):
+            turn = self.turns.popleft()
+            self.tokens -= estimateTokens(turn["text"])
+            dropped.append(turn)
+        if dropped and self.summaryChars:
+            self.summary = compactTurns(self.summary, dropped, self.summaryChars)
+            self._summaryMessage = None
+
+    def _changed(self):
+        if self.onChange is not None:
+            self.onChange(self)
+
+    def clear(self):
+        """Удалить все реплики и краткое содержание, оставив системный промпт"""
+        with self._lock:
+            self.turns.clear()
+            self.tokens = 0
+            self.summary = None
+            self._summaryMessage = None
+            self._changed()
+
+    def toRecord(self) -> dict[str, Any]:
+        """Запись истории для хранилища (см. `ai.historyStore`)
+
+        Returns:
+            dict[str, Any]: `{"summary": ..., "turns": [...], "updated": ...}`
+        """
+        return {"summary": self.summary, "turns": [dict(turn) for turn in self.turns], "updated": time.time()}
+
+    def loadRecord(self, record: dict[str, Any]):
+        """Восстановить реплики и краткое содержание из записи хранилища. Лимиты истории применяются сразу
+
+        Args:
+            record (dict[str, Any]): Запись из `toRecord`
+        """
+        self.turns = deque(createMessageBody(turn["text"], turn["role"]) for turn in record.get("turns", []))
+        self.tokens = sum(estimateTokens(turn["text"]) for turn in self.turns)
+        self.summary = record.get("summary")
+        self._summaryMessage = None
+        self._trim()
+
+    def sizeBytes(self) -> int:
+        """Примерный объем памяти, занятый историей
+
+        Returns:
+            int: Количество байт
+        """
+        return sum(sys.getsizeof(m) + sum(sys.getsizeof(v) for v in m.values()) for m in (self.systemMessage, *self.turns))
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+
+class ChatSessionManager:
+    """Хранит отдельную историю переписки для каждого игрока.
+
+    Истории игроков, которые давно не писали боту, удаляются по TTL, а при превышении `maxSessions`
+    вытесняется история, которая дольше всех не использовалась (LRU).
+
+    Если задано хранилище `store`, история игрока загружается из него при первом обращении, а каждое изменение
+    отправляется в него (с `WriteBehindStore` - без ожидания диска), поэтому беседы переживают перезапуск бота.
+    """
+    def __init__(
+                    self,
+                    systemPrompt: str,
+                    maxSessions: int = 256,
+                    idleTtl: float | None = 1800,
+                    maxMessages: int | None = 20,
+                    maxTokens: int | None = 4000,
+                    store: HistoryStore | None = None,
+                    summaryChars: int | None = 600,
+                ) -> None:
+        """Хранит отдельную историю переписки для каждого игрока
+
+        Args:
+            systemPrompt (str): Системный промпт для новых историй
+            maxSessions (int, optional): Сколько историй держать в памяти одновременно. Defaults to 256.
+            idleTtl (float | None, optional): Через сколько секунд простоя история игрока удаляется. `None` - не удалять. Defaults to 1800.
+            maxMessages (int | None, optional): Лимит реплик в одной истории. Defaults to 20.
+            maxTokens (int | None, optional): Лимит токенов реплик в одной истории. Defaults to 4000.
+            store (HistoryStore | None, optional): Постоянное хранилище историй. `None` - истории живут только в памяти. Defaults to None.
+            summaryChars (int | None, optional): Длина краткого содержания вытесненных реплик. `None` - не сохранять содержание. Defaults to 600.
+        """
+        self.systemPrompt = systemPrompt
+        self.maxSessions = maxSessions
+        self.idleTtl = idleTtl
+        self.maxMessages = maxMessages
+        self.maxTokens = maxTokens
+        self.store = store
+        self.summaryChars = summaryChars
+
+        self.sessions: OrderedDict[str, ChatHistory] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _createHistory(self, username: str) -> ChatHistory:
+        history = ChatHistory(self.systemPrompt, maxMessages=self.maxMessages, maxTokens=self.maxTokens, summaryChars=self.summaryChars)
+        if self.store is not None:
+            record = self.store.load(username)
+            if record is not None:
+                history.loadRecord(record)
+            store = self.store
+            history.onChange = lambda h: store.save(username, h.toRecord())
+        return history
+
+    def get(self, username: str) -> ChatHistory:
+        """Вернуть историю игрока, создав ее при первом обращении
+
+        Args:
+            username (str): Ник игрока
+
+        Returns:
+            ChatHistory: История переписки игрока с ботом
+        """
+        with self._lock:
+            self._evictIdle(time.monotonic())
+            history = self.sessions.get(username)
+            if history is not None:
+                self.sessions.move_to_end(username)
+                history.lastUsed = time.monotonic()
+                return history
+
+        # чтение из хранилища идет без блокировки, чтобы не задерживать других игроков
+        created = self._createHistory(username)
+        with self._lock:
+            history = self.sessions.setdefault(username, created)
+            self.sessions.move_to_end(username)
+            while len(self.sessions) > self.maxSessions:
+                self.sessions.popitem(last=False)
+            history.lastUsed = time.monotonic()
+            return history
+
+    def _evictIdle(self, now: float) -> int:
+        if self.idleTtl is None:
+            return 0
+        # OrderedDict упорядочен по последнему обращению, поэтому просроченные истории лежат в начале
+        evicted = 0
+        while self.sessions:
+            username, history = next(iter(self.sessions.items()))
+            if now - history.lastUsed < self.idleTtl:
+                break
+            del self.sessions[username]
+            evicted += 1
+        return evicted
+
+    def evictIdle(self) -> int:
+        """Удалить истории игроков, которые не писали дольше `idleTtl` секунд
+
+        Returns:
+            int: Количество удаленных историй
+        """
+        with self._lock:
+            return self._evictIdle(time.monotonic())
+
+    def drop(self, username: str):
+        """Выгрузить историю игрока из памяти (например, когда он вышел с сервера). В хранилище она остается
+
+        Args:
+            username (str): Ник игрока
+        """
+        with self._lock:
+            self.sessions.pop(username, None)
+
+    def forget(self, username: str):
+        """Удалить историю игрока из памяти и из хранилища
+
+        Args:
+            username (str): Ник игрока
+        """
+        self.drop(username)
+        if self.store is not None:
+            self.store.delete(username)
+
+    def close(self):
+        """Записать несохраненные изменения и закрыть хранилище"""
+        if self.store is not None:
+            self.store.close()
+
+    def memoryReport(self) -> dict[str, dict[str, float]]:
+        """Отчет о размере истории каждого игрока
+
+        Returns:
+            dict[str, dict[str, float]]: Для каждого ника - количество реплик, токенов, байт и секунд простоя
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                username: {
+                    "messages": len(history),
+                    "tokens": history.tokens,
+                    "bytes": history.sizeBytes(),
+                    "idle": round(now - history.lastUsed, 1),
+                }
+                for username, history in self.sessions.items()
+            }
+
+    def __len__(self) -> int:
+        return len(self.sessions)
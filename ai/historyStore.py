@@ -0,0 +1,277 @@
+"""Постоянное хранилище историй переписки с игроками.
+
+Запись истории - словарь `{"summary": краткое_содержание_или_None, "turns": [сообщения], "updated": время}`.
+Хранилища взаимозаменяемы: файлы JSON (по умолчанию), sqlite или tinydb. `WriteBehindStore` оборачивает любое из них
+и записывает изменения пачками в фоновом потоке, поэтому ответ игроку никогда не ждет диска.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any
+
+from utils.logs import getLogger
+
+
+log = getLogger(__name__)
+
+
+class HistoryStore(ABC):
+    """Базовое хранилище историй. Наследники переопределяют `load`, `saveMany` и `delete`"""
+    @abstractmethod
+    def load(self, key: str) -> dict[str, Any] | None:
+        """Прочитать историю
+
+        Args:
+            key (str): Ключ истории (обычно ник игрока)
+
+        Returns:
+            dict[str, Any] | None: Запись истории или `None`, если ее нет
+        """
+
+    def save(self, key: str, record: dict[str, Any]):
+        """Сохранить одну историю"""
+        self.saveMany({key: record})
+
+    @abstractmethod
+    def saveMany(self, records: dict[str, dict[str, Any]]):
+        """Сохранить несколько историй за один раз
+
+        Args:
+            records (dict[str, dict[str, Any]]): Ключ -> запись истории
+        """
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Удалить историю"""
+
+    def close(self):
+        """Освободить ресурсы хранилища"""
+
+
+class FileHistoryStore(HistoryStore):
+    """История каждого игрока - отдельный JSON файл в папке. Запись атомарная: временный файл и замена"""
+    SAFE_NAME = re.compile(r"[^\w\-.]")
+
+    def __init__(self, directory: str = ".aihistory") -> None:
+        """Хранилище историй в JSON файлах
+
+        Args:
+            directory (str, optional): Папка для файлов. Defaults to ".aihistory".
+        """
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> pathlib.Path:
+        # ник годится в имя файла не всегда, поэтому к очищенному нику добавляется короткий хеш исходного
+        safe = self.SAFE_NAME.sub("_", key)[:48]
+        return self.directory / f"{safe}.{hashlib.sha1(key.encode()).hexdigest()[:8]}.json"
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def saveMany(self, records: dict[str, dict[str, Any]]):
+        for key, record in records.items():
+            path = self._path(key)
+            tmpPath = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmpPath, "w", encoding="utf-8") as file:
+                json.dump(record, file, ensure_ascii=False)
+            os.replace(tmpPath, path)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class SqliteHistoryStore(HistoryStore):
+    """Истории в одной таблице sqlite. Пачка записей сохраняется одной транзакцией"""
+    def __init__(self, path: str = ".aihistory.sqlite") -> None:
+        """Хранилище историй в sqlite
+
+        Args:
+            path (str, optional): Путь к файлу базы. Defaults to ".aihistory.sqlite".
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS histories (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)")
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM histories WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def saveMany(self, records: dict[str, dict[str, Any]]):
+        now = time.time()
+        rows = [(key, json.dumps(record, ensure_ascii=False), now) for key, record in records.items()]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO histories (key, value, updated) VALUES (?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM histories WHERE key = ?", (key,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class TinyDbHistoryStore(HistoryStore):
+    """Истории в базе tinydb (один JSON файл)"""
+    def __init__(self, path: str = ".aihistory.json") -> None:
+        """Хранилище историй в tinydb
+
+        Args:
+            path (str, optional): Путь к файлу базы. Defaults to ".aihistory.json".
+        """
+        from tinydb import Query, TinyDB
+
+        self.path = path
+        self._query = Query()
+        self._lock = threading.Lock()
+        self._db = TinyDB(path, ensure_ascii=False)
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._db.get(self._query.key == key)
+        return row["record"] if row is not None else None # type: ignore
+
+    def saveMany(self, records: dict[str, dict[str, Any]]):
+        with self._lock:
+            for key, record in records.items():
+                self._db.upsert({"key": key, "record": record}, self._query.key == key)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.remove(self._query.key == key)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class WriteBehindStore(HistoryStore):
+    """Обертка, откладывающая запись: `save` только запоминает последнюю версию истории, а фоновый поток
+    записывает накопленные изменения пачкой раз в `flushInterval` секунд. Несколько изменений одной истории
+    между сбросами превращаются в одну запись.
+    """
+    def __init__(self, store: HistoryStore, flushInterval: float = 2.0) -> None:
+        """Отложенная запись историй
+
+        Args:
+            store (HistoryStore): Хранилище, в которое пишутся изменения
+            flushInterval (float, optional): Как часто сбрасывать изменения на диск, в секундах. Defaults to 2.0.
+        """
+        self.store = store
+        self.flushInterval = flushInterval
+        self._pending: dict[str, dict[str, Any] | None] = {}
+        """Ключ -> последняя несохраненная запись (`None` - историю нужно удалить)"""
+        self._lock = threading.Lock()
+        self._flushLock = threading.Lock()
+        self._stopEvent = threading.Event()
+
+        self.flushes: int = 0
+        self.written: int = 0
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+        return self.store.load(key)
+
+    def save(self, key: str, record: dict[str, Any]):
+        with self._lock:
+            self._pending[key] = record
+
+    def saveMany(self, records: dict[str, dict[str, Any]]):
+        with self._lock:
+            self._pending.update(records)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._pending[key] = None
+
+    @property
+    def pending(self) -> int:
+        """Сколько историй ждут записи"""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Записать все накопленные изменения сейчас"""
+        with self._flushLock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            records = {key: record for key, record in pending.items() if record is not None}
+            try:
+                if records:
+                    self.store.saveMany(records)
+                for key, record in pending.items():
+                    if record is None:
+                        self.store.delete(key)
+            except Exception as e:
+                log.warning("history flush failed", error=str(e), records=len(pending))
+                # несохраненное возвращается в очередь, если за это время не появилось более новой версии
+                with self._lock:
+                    for key, record in pending.items():
+                        self._pending.setdefault(key, record)
+                return
+            self.flushes += 1
+            self.written += len(pending)
+
+    def _run(self):
+        while not self._stopEvent.wait(self.flushInterval):
+            self.flush()
+
+    def close(self):
+        """Остановить фоновую запись, сбросив оставшиеся изменения"""
+        self._stopEvent.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        self.store.close()
+
+
+HISTORY_STORES = {
+    "file": FileHistoryStore,
+    "sqlite": SqliteHistoryStore,
+    "tinydb": TinyDbHistoryStore,
+}
+
+
+def createHistoryStore(kind: str = "file", path: str | None = None, flushInterval: float | None = 2.0) -> HistoryStore:
+    """Создать хранилище историй по названию
+
+    Args:
+        kind (str, optional): `file`, `sqlite` или `tinydb`. Defaults to "file".
+        path (str | None, optional): Путь к папке или файлу. По умолчанию - свой для каждого вида. Defaults to None.
+        flushInterval (float | None, optional): Интервал отложенной записи. `None` - писать сразу. Defaults to 2.0.
+
+    Returns:
+        HistoryStore: Хранилище
+    """
+    if kind not in HISTORY_STORES:
+        raise ValueError(f"Неизвестное хранилище историй `{kind}`. Доступны: {', '.join(HISTORY_STORES)}")
+    store = HISTORY_STORES[kind](path) if path else HISTORY_STORES[kind]()
+    return WriteBehindStore(store, flushInterval) if flushInterval is not None else store
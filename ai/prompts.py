@@ -2,6 +2,17 @@
 
 Для каждой группы промптов (класс, вложенный в Prompts), есть обязательные поля - PROMPT_SYSTEM и PROMPT_USER
 """
+import random
+import re
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from ai.utils import RequestBodyTemplate, createMessageBody
+
+if TYPE_CHECKING:
+    from ai.backends import LLMBackend
+
 
 class Prompts(object):
     """При написании промптов можно использовать форматирование строки, что полезно для метода `str.format()`
@@ -27,4 +38,176 @@ class Prompts(object):
     """Вторая версия стартового промпта. В отличие от первой версии здесь задается сразу промпт для сравнения команд, и промпт предыстория бота.
     """
 
+    SYSTEM_PROMPT_BATCH = '''Тебе дан перечень слов: {commands}. В запросе несколько пронумерованных сообщений от разных игроков, каждое с новой строки в виде `номер: текст`. Для каждого сообщения отдельно либо найди то слово из перечня, которое наиболее близко по смыслу к тексту сообщения, либо, если подходящего по смыслу слова в перечне нет - дай короткий креативный ответ на сообщение. Представь ответ в виде JSON массива, в котором для каждого сообщения есть ровно один элемент:
+```
+[ { "id": номер_сообщения, "result": слово_из_перечня_или_null_если_похожего_слова_нет_в_перечне, "creative": твой_креативный_ответ_на_сообщение_в_одно_предложение } ]
+```'''
+    """Пакетный вариант `SYSTEM_PROMPT_2`: несколько команд разных игроков распознаются одним запросом, а перечень команд передается один раз
+    """
+
+    SYSTEM_PROMPT_INTENT = '''Тебе дан перечень команд: {commands}. Ответь только той командой из перечня, которая совпадает по смыслу с сообщением игрока, без кавычек и пояснений. Если подходящей команды в перечне нет, ответь словом null.'''
+    """Промпт только для распознавания команды, без креативного ответа. Рассчитан на небольшую локальную модель
+    """
+
+    CANNED_COMMAND_REPLIES = ["Хорошо!", "Сейчас сделаю.", "Уже выполняю.", "Понял тебя."]
+    """Заготовленные ответы на распознанную команду, пока языковая модель недоступна"""
+
+    COMMAND_CONFIRMATION = 'Понял как команду "{command}".'
+    """Ответ на команду, распознанную только по похожим фразам, чтобы игрок видел, как бот его понял"""
+
+    COMMAND_CANCEL_HINT = ' Если я ошибся, напиши "стоп".'
+    """Подсказка, как отменить ошибочно распознанную команду"""
+
+    CANNED_REPLIES = [
+        "Прости, я сейчас плохо соображаю. Простые команды вроде \"стоп\" и \"за мной\" по-прежнему выполняю.",
+        "Не могу сейчас поговорить, напиши мне чуть позже.",
+        "Что-то я задумался... Давай вернемся к этому через минуту.",
+    ]
+    """Заготовленные ответы на сообщения, которые нельзя обработать без языковой модели"""
+
+
+def cannedReply(recognized: bool = False) -> str:
+    """Заготовленный ответ игроку на время недоступности языковой модели
+
+    Args:
+        recognized (bool, optional): Команда игрока распознана и выполняется. Defaults to False.
+
+    Returns:
+        str: Текст ответа
+    """
+    return random.choice(Prompts.CANNED_COMMAND_REPLIES if recognized else Prompts.CANNED_REPLIES)
+
+
+def confirmCommand(command: str, cancellable: bool = True) -> str:
+    """Подтверждение команды, распознанной классификатором по похожим фразам
+
+    Args:
+        command (str): Распознанная команда
+        cancellable (bool, optional): Добавить подсказку, как отменить команду. Defaults to True.
+
+    Returns:
+        str: Текст ответа
+    """
+    return Prompts.COMMAND_CONFIRMATION.format(command=command) + (Prompts.COMMAND_CANCEL_HINT if cancellable else "")
+
+
+class CompiledPrompt:
+    """Шаблон промпта, разобранный один раз. Подстановка значений - это склейка готовых кусков строки.
+
+    В отличие от `str.format` понимает только поля вида `{name}`, поэтому JSON-примеры в фигурных скобках
+    (как в `SYSTEM_PROMPT_2`) не ломают подстановку. Поля, для которых значение не передано, остаются как есть.
+    """
+    FIELD = re.compile(r"\{(\w+)\}")
+
+    def __init__(self, template: str) -> None:
+        self.template = template
+        self.parts: list[str] = self.FIELD.split(template)
+        """Чередование: текст, имя поля, текст, имя поля, ..., текст"""
+        self.fields: set[str] = set(self.parts[1::2])
+
+    def render(self, **values: str) -> str:
+        """Подставить значения в шаблон
+
+        Returns:
+            str: Готовый промпт
+        """
+        return "".join(
+            part if i % 2 == 0 else str(values[part]) if part in values else f"{{{part}}}"
+            for i, part in enumerate(self.parts)
+        )
+
+
+class PromptRegistry:
+    """Кэш скомпилированных шаблонов, готовых системных сообщений и заготовок тела запроса.
+
+    Системное сообщение для одного и того же шаблона и значений (например, для одной версии списка команд)
+    создается один раз и дальше переиспользуется, поэтому его нельзя изменять. Реестр общий для потоков
+    обработчиков, поэтому все обращения к кэшам идут под одной блокировкой.
+    """
+    def __init__(self, maxSize: int = 256) -> None:
+        """Кэш промптов
+
+        Args:
+            maxSize (int, optional): Сколько готовых промптов и заготовок тела хранить. Defaults to 256.
+        """
+        self.maxSize = maxSize
+        self._compiled: dict[str, CompiledPrompt] = {}
+        self._messages: OrderedDict[tuple, dict[str, str]] = OrderedDict()
+        self._bodies: OrderedDict[tuple, RequestBodyTemplate] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _remember(self, cache: OrderedDict, key: tuple, value):
+        with self._lock:
+            cache[key] = value
+            if len(cache) > self.maxSize:
+                cache.popitem(last=False)
+            return value
+
+    def compile(self, template: str) -> CompiledPrompt:
+        """Вернуть скомпилированный шаблон
+
+        Args:
+            template (str): Текст шаблона
+
+        Returns:
+            CompiledPrompt: Скомпилированный шаблон
+        """
+        with self._lock:
+            compiled = self._compiled.get(template)
+            if compiled is None:
+                compiled = self._compiled[template] = CompiledPrompt(template)
+            return compiled
+
+    def render(self, template: str, **values: str) -> str:
+        """Подставить значения в шаблон
+
+        Returns:
+            str: Готовый промпт
+        """
+        return self.systemMessage(template, **values)["text"]
+
+    def systemMessage(self, template: str, **values: str) -> dict[str, str]:
+        """Системное сообщение с подставленными значениями. Для одинаковых аргументов возвращается один и тот же объект
+
+        Returns:
+            dict[str, str]: Тело системного сообщения
+        """
+        key = (template, *sorted(values.items()))
+        with self._lock:
+            message = self._messages.get(key)
+            if message is None:
+                return self._remember(self._messages, key, createMessageBody(self.compile(template).render(**values), "system"))
+            self._messages.move_to_end(key)
+            return message
+
+    def bodyTemplate(
+                        self,
+                        model_uri: str,
+                        stream: bool,
+                        temperature: float,
+                        maxTokens: int,
+                        systemMessage: dict[str, str],
+                        backend: "LLMBackend | None" = None,
+                    ) -> RequestBodyTemplate:
+        """Заготовка тела запроса с уже сериализованной неизменной частью
+
+        Args:
+            backend (LLMBackend | None, optional): Бэкенд, в формате API которого собирается тело. По умолчанию - формат YandexGPT. Defaults to None.
+
+        Returns:
+            RequestBodyTemplate: Заготовка тела запроса
+        """
+        schema = backend.schema if backend is not None else "yandex"
+        key = (schema, model_uri, stream, temperature, maxTokens, systemMessage["role"], systemMessage["text"])
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is None:
+                template = backend.createBodyTemplate(model_uri, stream, temperature, maxTokens, systemMessage) if backend is not None \
+                    else RequestBodyTemplate(model_uri, stream, temperature, maxTokens, systemMessage)
+                return self._remember(self._bodies, key, template)
+            self._bodies.move_to_end(key)
+            return body
+
 
+REGISTRY = PromptRegistry()
+"""Общий реестр промптов приложения"""
@@ -0,0 +1,265 @@
+"""Планировщик запросов к языковой модели: ограничение частоты (token bucket), приоритеты,
+повторы с экспоненциальной задержкой и дедлайн на запрос.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+
+
+class PRIORITIES(object):
+    """Приоритеты запросов. Чем меньше число - тем раньше запрос уйдет в сеть"""
+    ACTION = 0
+    """Распознавание команд для бота (`CommandsComparator`)"""
+    CHAT = 10
+    """Обычная беседа с игроком (`ask`)"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Запрос не успел выполниться до своего дедлайна"""
+
+
+RETRYABLE_ERRORS = (OSError, asyncio.TimeoutError, aiohttp.ClientError)
+"""Сетевые ошибки, после которых запрос повторяется: сбои соединения (`requests` и `aiohttp`) и таймауты"""
+
+
+class TokenBucket:
+    """Ограничитель частоты: в ведро со скоростью `rate` в секунду добавляются токены, но не больше `capacity`.
+    Каждый запрос забирает один токен.
+    """
+    def __init__(self, rate: float, capacity: float) -> None:
+        """Ограничитель частоты запросов
+
+        Args:
+            rate (float): Сколько запросов в секунду разрешено в среднем
+            capacity (float): Сколько запросов можно отправить разом после простоя
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Забрать токен, если он есть. Не потокобезопасно - вызывается под блокировкой планировщика
+
+        Returns:
+            float: 0, если токен забран, иначе - сколько секунд ждать следующего токена
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RequestScheduler:
+    """Очередь перед отправкой запросов. Запросы ждут токен из `TokenBucket` в порядке приоритета,
+    а ответы 429/5xx и сетевые ошибки повторяются с экспоненциальной задержкой со случайным разбросом.
+
+    Один планировщик можно разделить между несколькими сессиями, чтобы они вместе укладывались в квоту каталога.
+    """
+    def __init__(
+                    self,
+                    rate: float = 10,
+                    burst: float = 10,
+                    maxRetries: int = 4,
+                    baseDelay: float = 0.5,
+                    maxDelay: float = 8,
+                    defaultDeadline: float | None = 30,
+                ) -> None:
+        """Очередь перед отправкой запросов
+
+        Args:
+            rate (float, optional): Сколько запросов в секунду разрешено квотой. Defaults to 10.
+            burst (float, optional): Сколько запросов можно отправить разом. Defaults to 10.
+            maxRetries (int, optional): Сколько раз повторять запрос после 429/5xx или сетевой ошибки. Defaults to 4.
+            baseDelay (float, optional): Базовая задержка перед повтором в секундах. Defaults to 0.5.
+            maxDelay (float, optional): Максимальная задержка перед повтором в секундах. Defaults to 8.
+            defaultDeadline (float | None, optional): Сколько секунд запрос может ждать и повторяться. `None` - без ограничения. Defaults to 30.
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.defaultDeadline = defaultDeadline
+
+        self._cond = threading.Condition()
+        self._waiting: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+
+        self.stats: dict[str, int] = {"sent": 0, "retries": 0, "expired": 0}
+        """Сколько запросов отправлено, сколько раз повторено и сколько не успело до дедлайна"""
+
+    @staticmethod
+    def isRetryable(status: int | None) -> bool:
+        """Стоит ли повторять запрос с таким HTTP статусом
+
+        Args:
+            status (int | None): HTTP статус ответа
+
+        Returns:
+            bool: True для 429 и 5xx
+        """
+        return status is not None and (status == 429 or status >= 500)
+
+    def retryDelay(self, attempt: int) -> float:
+        """Задержка перед повтором с номером `attempt` (с нуля): экспонента с полным случайным разбросом
+
+        Returns:
+            float: Задержка в секундах
+        """
+        return random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** attempt))
+
+    def deadlineAt(self, deadline: float | None = None) -> float | None:
+        """Перевести дедлайн в секундах от текущего момента в значение `time.monotonic()`
+
+        Args:
+            deadline (float | None, optional): Дедлайн в секундах. По умолчанию - `defaultDeadline`. Defaults to None.
+
+        Returns:
+            float | None: Момент дедлайна или `None`, если его нет
+        """
+        deadline = self.defaultDeadline if deadline is None else deadline
+        return None if deadline is None else time.monotonic() + deadline
+
+    def _tryAcquire(self, ticket: tuple[int, int], deadlineAt: float | None) -> float | None:
+        # вызывается под self._cond; None - токен получен, иначе сколько можно ждать до следующей проверки
+        now = time.monotonic()
+        wait = float("inf")
+        if self._waiting[0] == ticket:
+            wait = self.bucket.take()
+            if wait == 0:
+                heapq.heappop(self._waiting)
+                self._cond.notify_all()
+                self.stats["sent"] += 1
+                return None
+        if deadlineAt is not None:
+            if now >= deadlineAt:
+                self.stats["expired"] += 1
+                raise DeadlineExceeded("Запрос к языковой модели не дождался своей очереди")
+            wait = min(wait, deadlineAt - now)
+        return wait
+
+    def _discard(self, ticket: tuple[int, int]):
+        # вызывается под self._cond, когда ожидающий запрос отменен или не дождался дедлайна
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            self._cond.notify_all()
+
+    def acquire(self, priority: int = PRIORITIES.CHAT, deadlineAt: float | None = None):
+        """Дождаться разрешения на отправку запроса
+
+        Args:
+            priority (int, optional): Приоритет запроса. Defaults to PRIORITIES.CHAT.
+            deadlineAt (float | None, optional): Момент дедлайна из `deadlineAt()`. Defaults to None.
+
+        Raises:
+            DeadlineExceeded: Если дедлайн наступил раньше, чем подошла очередь
+        """
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while (wait := self._tryAcquire(ticket, deadlineAt)) is not None:
+                    self._cond.wait(None if wait == float("inf") else wait)
+            except BaseException:
+                self._discard(ticket)
+                raise
+
+    async def acquireAsync(self, priority: int = PRIORITIES.CHAT, deadlineAt: float | None = None, pollInterval: float = 0.02):
+        """Асинхронный вариант `acquire`. Не блокирует цикл событий, пока запрос ждет очереди
+
+        Args:
+            priority (int, optional): Приоритет запроса. Defaults to PRIORITIES.CHAT.
+            deadlineAt (float | None, optional): Момент дедлайна из `deadlineAt()`. Defaults to None.
+            pollInterval (float, optional): Как часто проверять очередь, если запрос не первый в ней. Defaults to 0.02.
+        """
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._tryAcquire(ticket, deadlineAt)
+                if wait is None:
+                    return
+                await asyncio.sleep(min(wait, pollInterval))
+        except BaseException:
+            with self._cond:
+                self._discard(ticket)
+            raise
+
+    def _nextRetryDelay(self, attempt: int, deadlineAt: float | None) -> float | None:
+        delay = self.retryDelay(attempt)
+        if attempt >= self.maxRetries or (deadlineAt is not None and time.monotonic() + delay >= deadlineAt):
+            return None
+        self.stats["retries"] += 1
+        return delay
+
+    def run(self, send: Callable[[], Any], statusOf: Callable[[Any], int], priority: int = PRIORITIES.CHAT, deadline: float | None = None) -> Any:
+        """Отправить запрос через очередь с повторами
+
+        Args:
+            send (Callable[[], Any]): Функция, выполняющая запрос
+            statusOf (Callable[[Any], int]): Функция, достающая HTTP статус из результата `send`
+            priority (int, optional): Приоритет запроса. Defaults to PRIORITIES.CHAT.
+            deadline (float | None, optional): Дедлайн в секундах. По умолчанию - `defaultDeadline`. Defaults to None.
+
+        Returns:
+            Any: Результат последней попытки `send`
+        """
+        deadlineAt = self.deadlineAt(deadline)
+        attempt = 0
+        while True:
+            self.acquire(priority, deadlineAt)
+            try:
+                result = send()
+            except DeadlineExceeded:
+                raise
+            except RETRYABLE_ERRORS:
+                delay = self._nextRetryDelay(attempt, deadlineAt)
+                if delay is None:
+                    raise
+            else:
+                if not self.isRetryable(statusOf(result)):
+                    return result
+                delay = self._nextRetryDelay(attempt, deadlineAt)
+                if delay is None:
+                    return result
+            attempt += 1
+            time.sleep(delay)
+
+    async def runAsync(self, send: Callable[[], Awaitable[Any]], statusOf: Callable[[Any], int], priority: int = PRIORITIES.CHAT, deadline: float | None = None) -> Any:
+        """Асинхронный вариант `run`
+
+        Returns:
+            Any: Результат последней попытки `send`
+        """
+        deadlineAt = self.deadlineAt(deadline)
+        attempt = 0
+        while True:
+            await self.acquireAsync(priority, deadlineAt)
+            try:
+                result = await send()
+            except DeadlineExceeded:
+                raise
+            except RETRYABLE_ERRORS:
+                delay = self._nextRetryDelay(attempt, deadlineAt)
+                if delay is None:
+                    raise
+            else:
+                if not self.isRetryable(statusOf(result)):
+                    return result
+                delay = self._nextRetryDelay(attempt, deadlineAt)
+                if delay is None:
+                    return result
+            attempt += 1
+            await asyncio.sleep(delay)
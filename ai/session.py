@@ -1,11 +1,41 @@
-"""Класс для работы с YandexGPT
+"""Класс для работы с YandexGPT и другими языковыми моделями (см. `ai.backends`)
 """
-from typing import Any
+import json
+from typing import Any, Iterator
 from requests import Response
 import requests
 
 from ai import prompts
-from ai.utils import createMessageBody, createRequestBody
+from ai.backends import LLMBackend, LLMError, YandexBackend
+from ai.breaker import CircuitBreaker
+from ai.cache import ResponseCache
+from ai.context import ContextWindow
+from ai.history import ChatHistory
+from ai.scheduler import PRIORITIES, RequestScheduler
+from ai.singleflight import SingleFlight, requestKey
+from ai.utils import IAMTokenProvider, RequestBodyTemplate, createMessageBody
+from utils.logs import getLogger
+from utils.metrics import REGISTRY
+
+
+log = getLogger(__name__)
+
+REQUEST_SECONDS = REGISTRY.histogram("ai_request_seconds", "Время запроса к языковой модели")
+REQUESTS = REGISTRY.counter("ai_requests_total", "Запросы к языковой модели по HTTP статусу")
+
+
+
+YaGPTError = LLMError
+"""Прежнее имя `ai.backends.LLMError`"""
+
+
+def localResponse(status: int, payload: dict) -> requests.Response:
+    """Ответ бэкенда без сети (`LLMBackend.complete`) в виде `requests.Response`, как у настоящего запроса"""
+    r = requests.Response()
+    r.status_code = status
+    r._content = json.dumps(payload, ensure_ascii=False).encode()
+    r.encoding = "utf-8"
+    return r
 
 
 
@@ -13,9 +43,9 @@ class YaGPTSession:
     """Клиент для общения с нейронной сетью YaGPT. Подробнее читайте [здесь](https://yandex.cloud/ru/docs/foundation-models/operations/yandexgpt/create-prompt)"""
     def __init__(
                     self,
-                    # авторизация
-                    folder_id: str,
-                    iam_token: str,
+                    # авторизация (только для YandexGPT)
+                    folder_id: str = "",
+                    iam_token: str | IAMTokenProvider = "",
                     # имя бота в игре
                     model: str = "yandexgpt",
                     data_logging_enabled: bool = False,
@@ -27,13 +57,26 @@ class YaGPTSession:
                     generation_segment: str | None = None,
 
                     systemPrompt: str = prompts.Prompts.SYSTEM_PROMPT_2,
-                    formatMapForSystemPrompt: dict[str, str] = {}
+                    formatMapForSystemPrompt: dict[str, str] = {},
+
+                    maxHistoryMessages: int | None = None,
+                    maxHistoryTokens: int | None = None,
+                    maxInputTokens: int | None = None,
+
+                    responseCache: ResponseCache | None = None,
+                    scheduler: RequestScheduler | None = None,
+                    coalesceRequests: bool = True,
+                    breaker: CircuitBreaker | None = None,
+                    timeout: float = 30,
+
+                    backend: LLMBackend | None = None,
+                    api_url: str = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion",
                 ):
         """Клиент для общения с нейронной сетью YaGPT. Подробнее читайте [здесь](https://yandex.cloud/ru/docs/foundation-models/operations/yandexgpt/create-prompt)
 
         Args:
-            folder_id (str): идентификатор каталога, на который у вашего аккаунта есть роль ai.languageModels.user или выше.
-            iam_token (str): IAM-токен, полученный перед началом работы.
+            folder_id (str, optional): идентификатор каталога, на который у вашего аккаунта есть роль ai.languageModels.user или выше.
+            iam_token (str | IAMTokenProvider, optional): IAM-токен, полученный перед началом работы, либо провайдер, который обновляет токен сам.
             model (str, optional): Наименование языковой модели. Defaults to "yandexgpt".
             data_logging_enabled (bool, optional): Определяет, будут ли сообщения логироваться на строне Яндекса. Defaults to False.
             stream (bool, optional): включает потоковую передачу частично сгенерированного текста. Принимает значения true или false. Defaults to False.
@@ -42,29 +85,46 @@ class YaGPTSession:
             generation_segment (str | None, optional): Сегменты `/latest`, `/rc` и `/deprecated` указывают версию модели. Defaults to None.
             systemPrompt (str, optional): позволяет задать контекст запроса и определить поведение модели.
             formatMapForSystemPrompt (dict[str, str], optional): Словарь с дополнительными значениями для форматирования промпта. Позволяет на этапе инициализации сессии создать корректный системный промпт.
+            maxHistoryMessages (int | None, optional): Сколько реплик хранить в общей истории сессии. `None` - без ограничения. Defaults to None.
+            maxHistoryTokens (int | None, optional): Сколько примерно токенов могут занимать реплики общей истории. `None` - без ограничения. Defaults to None.
+            maxInputTokens (int | None, optional): Бюджет входных токенов запроса с историей (см. `ai.context.ContextWindow`). `None` - отправлять всю историю. Defaults to None.
+            responseCache (ResponseCache | None, optional): Кэш ответов для `customAsk`. Одинаковые тела запросов не будут повторно отправляться в сеть. Defaults to None.
+            scheduler (RequestScheduler | None, optional): Планировщик с ограничением частоты, приоритетами и повторами. Без него запросы уходят сразу и не повторяются. Defaults to None.
+            coalesceRequests (bool, optional): Объединять одинаковые одновременные запросы в один сетевой вызов. Defaults to True.
+            breaker (CircuitBreaker | None, optional): Предохранитель: при частых ошибках или медленных ответах запросы сразу отклоняются с `CircuitOpenError`. Defaults to None.
+            timeout (float, optional): Таймаут запроса в секундах (для потока - ожидание каждого фрагмента). Defaults to 30.
+            backend (LLMBackend | None, optional): API языковой модели (`ai.backends`), например OpenAI-совместимый локальный сервер. Тогда `folder_id`, `iam_token`, `model`, `generation_segment` и `api_url` не используются. Defaults to None - YandexGPT.
+            api_url (str, optional): Адрес метода completion. Можно указать локальный mock-сервер из `bench.mockServer`. Defaults to адрес Yandex Foundation Models.
         """
 
-        self.api_url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
-        self.model_uri = f"gpt://{folder_id}/{model}/{generation_segment}" if generation_segment else f"gpt://{folder_id}/{model}"
+        model_uri = f"gpt://{folder_id}/{model}/{generation_segment}" if generation_segment else f"gpt://{folder_id}/{model}"
+        self.backend: LLMBackend = backend or YandexBackend(folder_id, iam_token, model_uri, data_logging_enabled, api_url)
+        """Формат запросов и ответов конкретного API"""
+        self.api_url = self.backend.url
+        self.model_uri = self.backend.model
 
         self.folder_id: str = folder_id
-        self.iam_token: str = iam_token
+        self.iam_token: str | IAMTokenProvider = iam_token
         self.data_logging_enabled: bool = data_logging_enabled
         self.stream: bool = stream
         self.temperature: float = temperature
         self.maxTokens: int = maxTokens
         self.generation_segment: str | None = generation_segment
+        self.responseCache: ResponseCache | None = responseCache
+        self.scheduler: RequestScheduler | None = scheduler
+        self.singleFlight = self._createSingleFlight() if coalesceRequests else None
+        self.breaker: CircuitBreaker | None = breaker
+        self.timeout: float = timeout
+        self._attachProbe()
         
-        self.systemPrompt = systemPrompt
-        
-        for k in formatMapForSystemPrompt.keys():
-            try:
-                self.systemPrompt = self.systemPrompt.format(**{f"{k}": formatMapForSystemPrompt[k]})
-            except Exception:
-                pass
-        
+        # шаблон компилируется один раз, а готовое системное сообщение переиспользуется во всех запросах
+        self.systemMessage: dict[str, str] = prompts.REGISTRY.systemMessage(systemPrompt, **formatMapForSystemPrompt)
+        self.systemPrompt: str = self.systemMessage["text"]
         
-        self.messages = [self._createMessageBody(self.systemPrompt, "system")]
+        self.history = ChatHistory(self.systemPrompt, maxMessages=maxHistoryMessages, maxTokens=maxHistoryTokens)
+        """Общая история сессии. Используется, если в `ask` не передана история конкретного игрока"""
+        self.contextWindow: ContextWindow | None = ContextWindow(maxInputTokens) if maxInputTokens is not None else None
+        """Подбор реплик истории под бюджет входных токенов. Старые реплики заменяются кратким содержанием"""
         self.completion = None
         
         self.DEFAULT_MESSAGE_HISTORY = [self._createMessageBody(self.systemPrompt, "system")]
@@ -79,35 +139,51 @@ class YaGPTSession:
         ```
         """
 
-    def _appendMessage(self, text: str, role: str = "user") -> list[dict]:
-        """Сохраняет сообщение в историю чата
+    @property
+    def messages(self) -> list[dict[str, str]]:
+        """Сообщения общей истории сессии, начиная с системного промпта"""
+        return self.history.messages
 
-        Args:
-            text (str): Текст сообщения
-            role (str, optional): Роль автора сообщения: `user`, `system` или `assistant`. Defaults to "user".
+    def _commitTurns(self, messageText: str, typeUser: str, response: str, history: ChatHistory | None = None):
+        """Сохранить в историю сообщение и ответ модели на него одной операцией, после успешного ответа"""
+        (history if history is not None else self.history).extend([(messageText, typeUser), (response, "assistant")])
+
+    def _bodyTemplate(self, systemMessage: dict[str, str], stream: bool | None = None, **kwargs) -> RequestBodyTemplate:
+        """Заготовка тела запроса из общего реестра промптов. Параметры модели можно переопределить через `kwargs`
 
         Returns:
-            list[dict]: Список словарей, содержащих текст сообщения и роль автора сообщения
+            RequestBodyTemplate: Заготовка тела запроса
         """
-        self.messages.append(self._createMessageBody(text, role))
-        return self.messages
+        return prompts.REGISTRY.bodyTemplate(
+            model_uri=kwargs.get("model_uri", self.model_uri),
+            stream=self.stream if stream is None else stream,
+            temperature=kwargs.get("temperature", self.temperature),
+            maxTokens=kwargs.get("maxTokens", self.maxTokens),
+            systemMessage=systemMessage,
+            backend=self.backend,
+        )
 
-    def _createRequestBody(self, useChatHistory: bool = True) -> dict:
+    def _createRequestBody(self, useChatHistory: bool = True, history: ChatHistory | None = None, stream: bool | None = None, pending: list[dict[str, str]] | None = None) -> dict:
         """Создать тело для POST запроса на сервер
 
         Args:
-            useChatHistory (bool, optional): Использовать ли историю чата для сохранения контекста беседы. Defaults to True.
+            useChatHistory (bool, optional): Использовать ли историю чата для сохранения контекста беседы. Если `False` - отправляется только последнее сообщение. Defaults to True.
+            history (ChatHistory | None, optional): История беседы. По умолчанию - общая история сессии. Defaults to None.
+            stream (bool | None, optional): Потоковая передача ответа. По умолчанию - как в сессии. Defaults to None.
+            pending (list[dict[str, str]] | None, optional): Сообщения после истории, которые еще не сохранены в нее. Defaults to None.
 
         Returns:
             dict: Словарь-тело для запроса
         """
-        return createRequestBody(
-            model_uri=self.model_uri,
-            maxTokens=self.maxTokens,
-            messages=self.messages if useChatHistory else [self._createMessageBody(self.systemPrompt, "system")],
-            stream=self.stream,
-            temperature=self.temperature,
-        )
+        history = history if history is not None else self.history
+        pending = pending or []
+        if not useChatHistory:
+            turns = pending[-1:] or list(history.turns)[-1:]
+        elif self.contextWindow is not None:
+            turns = self.contextWindow.fit(history, pending)
+        else:
+            turns = history.contextTurns() + pending
+        return self._bodyTemplate(history.systemMessage, stream).build(turns)
 
     def _createMessageBody(self, text: str, role: str = "user") -> dict:
         return createMessageBody(text, role)
@@ -119,75 +195,275 @@ class YaGPTSession:
         Returns:
             dict: Словарь-тело для системного сообщения
         """
-        return self._createMessageBody(self.systemPrompt, "system")
+        return self.systemMessage
+
+    def _headers(self) -> dict[str, str]:
+        """Заголовки для запроса к модели
+
+        Returns:
+            dict[str, str]: Словарь с заголовками авторизации (для YandexGPT - и настройками логирования)
+        """
+        return self.backend.headers()
 
     def _post(self, request_body: dict[str, Any]) -> requests.Response:
-        return requests.post(self.api_url, json=request_body, headers={
-            "Authorization": f"Bearer {self.iam_token}",
-            "Content-Type": "application/json",
-            "x-folder-id": f"{self.folder_id}",
-            "x-data-logging-enabled": f"{self.data_logging_enabled}".lower()
-        })
+        local = self.backend.complete(request_body)
+        if local is not None:
+            REQUESTS.inc(status=local[0])
+            return localResponse(*local)
+        with REQUEST_SECONDS.time(mode="sync"):
+            if getattr(request_body, "serialized", None) is not None:
+                r = requests.post(self.api_url, data=request_body.serialized, headers=self._headers(), timeout=self.timeout) # type: ignore
+            else:
+                r = requests.post(self.api_url, json=request_body, headers=self._headers(), timeout=self.timeout)
+        REQUESTS.inc(status=r.status_code)
+        return r
+
+    def _postStream(self, request_body: dict[str, Any]) -> requests.Response:
+        REQUESTS.inc(status="stream")
+        if getattr(request_body, "serialized", None) is not None:
+            return requests.post(self.api_url, data=request_body.serialized, headers=self._headers(), stream=True, timeout=self.timeout) # type: ignore
+        return requests.post(self.api_url, json=request_body, headers=self._headers(), stream=True, timeout=self.timeout)
+
+    def _streamLines(self, request_body: dict[str, Any]) -> Iterator[bytes]:
+        """Строки потокового ответа. Через предохранитель, если он задан"""
+        def lines() -> Iterator[bytes]:
+            local = self.backend.completeStream(request_body)
+            if local is not None:
+                yield from local
+                return
+            with self._postStream(request_body) as r:
+                r.raise_for_status()
+                yield from r.iter_lines()
+        return self.breaker.guardStream(lines()) if self.breaker is not None else lines()
+
+    def _probeBody(self) -> dict:
+        # самый дешевый запрос: одно короткое сообщение и один токен ответа
+        return self._prepareCustomAsk([createMessageBody("ping", "user")], stream=False, temperature=0, maxTokens=1)
+
+    def probe(self) -> bool:
+        """Проверить, отвечает ли модель (для фоновой проверки предохранителя)
+
+        Returns:
+            bool: True, если модель ответила без ошибки
+        """
+        return self._post(self._probeBody()).ok
+
+    def _attachProbe(self):
+        if self.breaker is not None and self.breaker.probe is None:
+            self.breaker.probe = self.probe
+
+    def _createSingleFlight(self) -> Any:
+        return SingleFlight()
+
+    def _send(self, request_body: dict[str, Any], priority: int = PRIORITIES.CHAT, deadline: float | None = None) -> requests.Response:
+        """Отправить запрос. Одинаковые одновременные запросы (например, одна и та же команда от нескольких игроков)
+        объединяются в один сетевой вызов, и все ожидающие получают один и тот же ответ
+        """
+        if self.singleFlight is None:
+            return self._schedule(request_body, priority, deadline)
+        return self.singleFlight.do(requestKey(request_body), lambda: self._schedule(request_body, priority, deadline))
+
+    def _schedule(self, request_body: dict[str, Any], priority: int = PRIORITIES.CHAT, deadline: float | None = None) -> requests.Response:
+        """Отправить запрос через планировщик, если он задан
+
+        Args:
+            request_body (dict[str, Any]): Тело запроса
+            priority (int, optional): Приоритет запроса в очереди планировщика. Defaults to PRIORITIES.CHAT.
+            deadline (float | None, optional): Сколько секунд запрос может ждать очереди и повторяться. Defaults to None.
+
+        Returns:
+            requests.Response: Ответ сервера
+        """
+        send = lambda: self._post(request_body)
+        if self.breaker is not None:
+            # каждая попытка учитывается отдельно, а отказ разомкнутого предохранителя планировщик не повторяет
+            send = self.breaker.wrap(send, lambda r: r.status_code)
+        if self.scheduler is None:
+            return send()
+        return self.scheduler.run(send, lambda r: r.status_code, priority, deadline)
         
     def _responseValidation(self, r: Response):
-        if r.status_code:
-            response_message: str = r.json()["result"]["alternatives"][0]["message"]["text"]
-            self._appendMessage(response_message, "assistant")
-            return response_message
-        else:
-            return "!Ошибка в языковой модели"
+        try:
+            payload = r.json()
+        except ValueError:
+            if not r.ok:
+                return self._parseResponse(r.status_code, {"message": r.text})
+            # при `stream=True` тело состоит из нескольких JSON строк, итоговый текст - в последней
+            return self.backend.collectStream(r.text)
+        return self._parseResponse(r.status_code, payload)
+
+    def _parseResponse(self, status: int, payload: dict) -> str:
+        """Достать текст ответа модели из JSON тела ответа
+
+        Args:
+            status (int): HTTP статус ответа
+            payload (dict): Разобранное JSON тело ответа
+
+        Returns:
+            str: Текст ответа модели
+
+        Raises:
+            YaGPTError: Если сервер ответил ошибкой (например, 429 при превышении квоты)
+        """
+        return self.backend.parseResponse(status, payload)
+
+    def _cacheKey(self, request_body: dict) -> str | None:
+        """Ключ кэша для тела запроса или `None`, если кэш не задан
+
+        Returns:
+            str | None: Ключ для `ResponseCache`
+        """
+        if self.responseCache is None:
+            return None
+        return requestKey(request_body)
 
     def clearChatHistory(self):
         """Очищает историю сообщений
         """
-        self.messages.clear()
-        self.messages.append(self._createSystemMessageBody())
+        self.history.clear()
+
+    def _prepareAsk(self, messageText: str, typeUser: str = "user", useChatHistory: bool = True, history: ChatHistory | None = None, stream: bool | None = None, **kwargs) -> dict:
+        """Собрать тело запроса для `ask`. Сообщение попадает в запрос, но в историю сохраняется только вместе
+        с ответом (`_commitTurns`), поэтому неудачный запрос не оставляет в истории вопрос без ответа
 
-    def ask(self, messageText: str, typeUser: str = "user", useChatHistory: bool = True, **kwargs) -> str:
+        Returns:
+            dict: Словарь-тело для запроса
+        """
+        request_body: dict = self._createRequestBody(useChatHistory, history, stream, [self._createMessageBody(messageText, typeUser)])
+        
+        # переопределение тела запроса
+        for kwarg in kwargs.keys():
+            request_body[kwarg] = kwargs[kwarg]
+            
+        # только размер запроса: полная история на каждом запросе слишком дорога для вывода
+        log.debug("ask request", messages=len(request_body["messages"]), bytes=len(getattr(request_body, "serialized", None) or b""))
+        return request_body
+
+    def _prepareCustomAsk(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        """Собрать тело запроса для `customAsk`
+
+        Returns:
+            dict: Словарь-тело для запроса
+        """
+        if messages and messages[0]["role"] == "system":
+            # системное сообщение из реестра промптов уже сериализовано, дописываются только остальные
+            return self._bodyTemplate(messages[0], **kwargs).build(messages[1:])
+        return self.backend.createBody(
+            model=kwargs["model_uri"] if "model_uri" in kwargs.keys() else self.model_uri,
+            stream=kwargs["stream"] if "stream" in kwargs.keys() else self.stream,
+            temperature=kwargs["temperature"] if "temperature" in kwargs.keys() else self.temperature,
+            maxTokens=kwargs["maxTokens"] if "maxTokens" in kwargs.keys() else self.maxTokens,
+            messages=messages
+        )
+
+    def ask(
+            self,
+            messageText: str,
+            typeUser: str = "user",
+            useChatHistory: bool = True,
+            history: ChatHistory | None = None,
+            priority: int = PRIORITIES.CHAT,
+            deadline: float | None = None,
+            **kwargs
+        ) -> str:
         """Выполнить запрос к нейросети YaGPT
 
         Args:
             messageText (str): Текст сообщения для выполнения запроса
             typeUser (str, optional): Тип пользователя. Defaults to "user".
             useChatHistory (bool, optional): Сделать запрос с учетом истории предыдущих сообщений. Если `False` - отправленное сообщение будет считаться первым в диалоге. Defaults to True.
+            history (ChatHistory | None, optional): История конкретной беседы (например, из `ChatSessionManager`). По умолчанию - общая история сессии. Defaults to None.
+            priority (int, optional): Приоритет запроса в очереди планировщика. Defaults to PRIORITIES.CHAT.
+            deadline (float | None, optional): Сколько секунд запрос может ждать очереди и повторяться. По умолчанию - как в планировщике. Defaults to None.
             kwargs (dict[str, Any], optional): Необязательно. Ручное переопределение тела запроса. Можно переопределить такие параметры, как `temperature`, `maxTokens`, `messages` и т.д. для конкретного запроса.
 
         Returns:
             str: Строка с ответом нейронной сети
         """
-        self._appendMessage(messageText, typeUser)
-        request_body: dict = self._createRequestBody(useChatHistory)
+        request_body = self._prepareAsk(messageText, typeUser, useChatHistory, history, **kwargs)
+        r = self._send(request_body, priority, deadline)
+        response_message = self._responseValidation(r)
+        self._commitTurns(messageText, typeUser, response_message, history)
+        return response_message
         
-        # переопределение тела запроса
-        for kwarg in kwargs.keys():
-            request_body[kwarg] = kwargs[kwarg]
-            
-        print(f"{request_body =}")
 
-        r = self._post(request_body)
-        return self._responseValidation(r)
-        
+    def askStream(
+            self,
+            messageText: str,
+            typeUser: str = "user",
+            useChatHistory: bool = True,
+            history: ChatHistory | None = None,
+            priority: int = PRIORITIES.CHAT,
+            deadline: float | None = None,
+            **kwargs
+        ) -> Iterator[str]:
+        """Выполнить потоковый запрос к нейросети YaGPT. Аргументы такие же, как у `ask`.
+
+        Текст ответа отдается фрагментами по мере генерации, а в историю вместе с сообщением сохраняется целиком,
+        когда поток закончится. Оборванный поток не меняет историю.
+
+        Yields:
+            Iterator[str]: Новые фрагменты ответа нейронной сети
+        """
+        request_body = self._prepareAsk(messageText, typeUser, useChatHistory, history, stream=True, **kwargs)
+        if self.scheduler is not None:
+            # начатый поток не повторяется, поэтому планировщик здесь только выдерживает частоту и приоритет
+            self.scheduler.acquire(priority, self.scheduler.deadlineAt(deadline))
+
+        parser = self.backend.streamParser()
+        for line in self._streamLines(request_body):
+            delta = parser.feed(line)
+            if delta:
+                yield delta
+        self._commitTurns(messageText, typeUser, parser.text, history)
 
     def customAsk(
             self,
             messages: list[dict[str, str]],
+            priority: int = PRIORITIES.CHAT,
+            deadline: float | None = None,
             **kwargs
         ) -> str:
         """Выполнить кастомный запрос к нейросети YaGPT
 
         Args:
+            messages (list[dict[str, str]]): Сообщения для запроса
+            priority (int, optional): Приоритет запроса в очереди планировщика. Defaults to PRIORITIES.CHAT.
+            deadline (float | None, optional): Сколько секунд запрос может ждать очереди и повторяться. По умолчанию - как в планировщике. Defaults to None.
             kwargs (dict[str, Any], optional): Необязательно. Ручное переопределение тела запроса. Можно переопределить такие параметры, как `temperature`, `maxTokens`, `messages` и т.д. для конкретного запроса.
 
         Returns:
             str: Строка с ответом нейронной сети
         """
-        request_body: dict = createRequestBody(
-            model_uri=kwargs["model_uri"] if "model_uri" in kwargs.keys() else self.model_uri,
-            stream=kwargs["stream"] if "stream" in kwargs.keys() else self.stream,
-            temperature=kwargs["temperature"] if "temperature" in kwargs.keys() else self.temperature,
-            maxTokens=kwargs["maxTokens"] if "maxTokens" in kwargs.keys() else self.maxTokens,
-            messages=messages
-        )
-        
-        r = self._post(request_body)
-        return self._responseValidation(r)
\ No newline at end of file
+        request_body = self._prepareCustomAsk(messages, **kwargs)
+        cacheKey = self._cacheKey(request_body)
+        if cacheKey is not None and (cached := self.responseCache.get(cacheKey)) is not None: # type: ignore
+            return cached
+
+        r = self._send(request_body, priority, deadline)
+        response_message = self._responseValidation(r)
+        if cacheKey is not None:
+            self.responseCache.set(cacheKey, response_message) # type: ignore
+        return response_message
+
+    def customAskStream(
+            self,
+            messages: list[dict[str, str]],
+            priority: int = PRIORITIES.CHAT,
+            deadline: float | None = None,
+            **kwargs
+        ) -> Iterator[str]:
+        """Потоковый вариант `customAsk`. Аргументы такие же. Ответ отдается фрагментами и не кэшируется
+
+        Yields:
+            Iterator[str]: Новые фрагменты ответа нейронной сети
+        """
+        request_body = self._prepareCustomAsk(messages, stream=True, **kwargs)
+        if self.scheduler is not None:
+            self.scheduler.acquire(priority, self.scheduler.deadlineAt(deadline))
+
+        parser = self.backend.streamParser()
+        for line in self._streamLines(request_body):
+            delta = parser.feed(line)
+            if delta:
+                yield delta
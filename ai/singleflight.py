@@ -0,0 +1,109 @@
+"""Объединение одинаковых одновременных запросов (single-flight).
+
+Если несколько игроков одновременно прислали одно и то же, в сеть уходит только первый запрос,
+а остальные ждут и получают его результат.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable
+
+
+def requestKey(request_body: dict[str, Any]) -> str:
+    """Ключ тела запроса после нормализации: порядок полей и пробелы по краям текстов сообщений не важны
+
+    Args:
+        request_body (dict[str, Any]): Тело запроса
+
+    Returns:
+        str: sha256 от нормализованного тела
+    """
+    # у тела из `RequestBodyTemplate` ключ уже посчитан
+    if getattr(request_body, "key", None) is not None:
+        return request_body.key # type: ignore
+    normalized = dict(request_body)
+    if "messages" in normalized:
+        # текст сообщения лежит в `text` (YandexGPT) или в `content` (OpenAI-совместимые API)
+        field = lambda m: "text" if "text" in m else "content"
+        normalized["messages"] = [{**m, field(m): " ".join(str(m.get(field(m), "")).split())} for m in normalized["messages"]]
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных вызовов из разных потоков"""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        self.stats: dict[str, int] = {"calls": 0, "shared": 0}
+        """Сколько вызовов выполнено и сколько получили результат чужого вызова"""
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Выполнить `fn`, если вызов с таким ключом еще не идет, иначе дождаться результата идущего вызова
+
+        Args:
+            key (str): Ключ вызова (например, из `requestKey`)
+            fn (Callable[[], Any]): Функция, выполняющая запрос
+
+        Returns:
+            Any: Результат `fn`, общий для всех ожидающих
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["calls"] += 1
+            else:
+                self.stats["shared"] += 1
+
+        if leader:
+            try:
+                call.result = fn() # type: ignore
+            except BaseException as e:
+                call.error = e # type: ignore
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set() # type: ignore
+        else:
+            call.done.wait() # type: ignore
+
+        if call.error is not None: # type: ignore
+            raise call.error # type: ignore
+        return call.result # type: ignore
+
+
+class AsyncSingleFlight:
+    """Объединение одинаковых одновременных вызовов внутри одного цикла событий"""
+    def __init__(self) -> None:
+        self._tasks: dict[str, asyncio.Future] = {}
+        self.stats: dict[str, int] = {"calls": 0, "shared": 0}
+        """Сколько вызовов выполнено и сколько получили результат чужого вызова"""
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнить `fn`, если вызов с таким ключом еще не идет, иначе дождаться результата идущего вызова
+
+        Args:
+            key (str): Ключ вызова (например, из `requestKey`)
+            fn (Callable[[], Awaitable[Any]]): Корутина-функция, выполняющая запрос
+
+        Returns:
+            Any: Результат `fn`, общий для всех ожидающих
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            self.stats["calls"] += 1
+        else:
+            self.stats["shared"] += 1
+        # отмена одного из ожидающих не должна отменять общий запрос для остальных
+        return await asyncio.shield(task)
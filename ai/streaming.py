@@ -0,0 +1,122 @@
+"""Разбор потоковых ответов YandexGPT.
+
+При `"stream": true` сервер присылает ответ частями: каждая строка - отдельный JSON с тем же форматом, что и
+обычный ответ, но текст в `alternatives[0].message.text` накапливается от строки к строке, а статус
+альтернативы равен `ALTERNATIVE_STATUS_PARTIAL` до последней части (`ALTERNATIVE_STATUS_FINAL`).
+
+OpenAI-совместимые серверы (llama.cpp, Ollama, vLLM) присылают Server-Sent Events: строки `data: {...}`, в которых
+`choices[0].delta.content` содержит только новый фрагмент, а поток заканчивается строкой `data: [DONE]`.
+"""
+import json
+from typing import Iterable, Iterator
+
+
+class StreamDeltaParser:
+    """Превращает строки потокового ответа в новые фрагменты текста"""
+    def __init__(self) -> None:
+        self.text: str = ""
+        """Весь текст, полученный на текущий момент"""
+        self.finished: bool = False
+        """Пришла ли финальная часть ответа"""
+
+    def feed(self, line: bytes | str) -> str:
+        """Разобрать очередную строку ответа
+
+        Args:
+            line (bytes | str): Строка потокового ответа
+
+        Returns:
+            str: Текст, добавившийся с предыдущей строки. Пустая строка, если ничего нового нет
+        """
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            return ""
+
+        payload = json.loads(line)
+        if "error" in payload:
+            raise RuntimeError(f"Ошибка в потоке языковой модели: {payload['error']}")
+
+        alternative = payload["result"]["alternatives"][0]
+        text: str = alternative["message"]["text"]
+        self.finished = alternative.get("status") == "ALTERNATIVE_STATUS_FINAL"
+
+        # текст накапливается, поэтому новый фрагмент - это все, что длиннее уже полученного
+        delta = text[len(self.text):] if text.startswith(self.text) else text
+        self.text = text
+        return delta
+
+
+class ChatCompletionDeltaParser:
+    """Превращает строки потокового ответа OpenAI-совместимого API в новые фрагменты текста.
+    Интерфейс такой же, как у `StreamDeltaParser`"""
+    def __init__(self) -> None:
+        self.text: str = ""
+        """Весь текст, полученный на текущий момент"""
+        self.finished: bool = False
+        """Пришла ли финальная часть ответа"""
+
+    def feed(self, line: bytes | str) -> str:
+        """Разобрать очередную строку ответа
+
+        Args:
+            line (bytes | str): Строка потокового ответа
+
+        Returns:
+            str: Текст, добавившийся с предыдущей строки. Пустая строка, если ничего нового нет
+        """
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        # пустые строки разделяют события, а строки с `:` - комментарии для поддержания соединения
+        if not line or line.startswith(":"):
+            return ""
+        if line.startswith("data:"):
+            line = line[len("data:"):].strip()
+        if line == "[DONE]":
+            self.finished = True
+            return ""
+
+        payload = json.loads(line)
+        if "error" in payload:
+            raise RuntimeError(f"Ошибка в потоке языковой модели: {payload['error']}")
+
+        choices = payload.get("choices") or [{}]
+        # без потоковой передачи сервер присылает целое сообщение вместо фрагмента
+        delta: str = (choices[0].get("delta") or choices[0].get("message") or {}).get("content") or ""
+        self.finished = self.finished or choices[0].get("finish_reason") is not None
+        self.text += delta
+        return delta
+
+
+def iterStreamDeltas(lines: Iterable[bytes | str]) -> Iterator[str]:
+    """Получить новые фрагменты текста из строк потокового ответа
+
+    Args:
+        lines (Iterable[bytes | str]): Строки ответа (например, `requests.Response.iter_lines()`)
+
+    Yields:
+        Iterator[str]: Непустые фрагменты текста по мере их поступления
+    """
+    parser = StreamDeltaParser()
+    for line in lines:
+        delta = parser.feed(line)
+        if delta:
+            yield delta
+
+
+def collectStream(body: str, parser: StreamDeltaParser | ChatCompletionDeltaParser | None = None) -> str:
+    """Собрать итоговый текст из полного тела потокового ответа
+
+    Args:
+        body (str): Тело ответа целиком
+        parser (StreamDeltaParser | ChatCompletionDeltaParser | None, optional): Разборщик строк в формате API. Defaults to `StreamDeltaParser`.
+
+    Returns:
+        str: Итоговый текст ответа модели
+    """
+    parser = parser if parser is not None else StreamDeltaParser()
+    for line in body.splitlines():
+        parser.feed(line)
+    return parser.text
@@ -0,0 +1,317 @@
+"""Разбор структурированных ответов модели, устойчивый к обрамлению и обрывам.
+
+Модель не всегда возвращает чистый JSON: ответ бывает обернут в ``` или дополнен пояснениями. Вместо повторного
+запроса из текста извлекается первый JSON объект (или массив для пакетных запросов) и проверяется через pydantic. `StreamingObjectParser` делает то же
+самое по мере прихода фрагментов потокового ответа и сообщает о каждом поле верхнего уровня, как только оно
+полностью сгенерировано.
+"""
+import json
+import re
+from typing import Any, Callable
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+
+FENCE = re.compile(r"```[a-zA-Z]*\s*(.*?)\s*```", re.DOTALL)
+
+
+class CommandResponse(BaseModel):
+    """Ответ модели на сравнение команды: `{"result": команда_или_null, "creative": ответ_или_null}`"""
+    result: str | None = None
+    creative: str | None = None
+
+    @field_validator("result", "creative", mode="before")
+    @classmethod
+    def _emptyToNone(cls, value: Any) -> Any:
+        # модель иногда пишет null строкой
+        if isinstance(value, str) and value.strip().lower() in ("", "null", "none"):
+            return None
+        if isinstance(value, str):
+            return value.strip()
+        return value
+
+
+class BatchCommandResponse(CommandResponse):
+    """Элемент ответа на пакетное сравнение команд: `{"id": номер_сообщения, "result": ..., "creative": ...}`"""
+    id: int
+
+
+def stripFences(text: str) -> str:
+    """Убрать обрамление ``` (в том числе ```json), если оно есть
+
+    Returns:
+        str: Содержимое первого блока в ``` или исходный текст
+    """
+    match = FENCE.search(text)
+    return match.group(1) if match else text.strip()
+
+
+def extractJsonObject(text: str) -> str | None:
+    """Найти в тексте первый сбалансированный JSON объект `{...}` с учетом строк и экранирования
+
+    Returns:
+        str | None: Текст объекта или `None`, если объекта нет или он не закрыт
+    """
+    return _extractBalanced(text, "{", "}")
+
+
+def extractJsonArray(text: str) -> str | None:
+    """Найти в тексте первый сбалансированный JSON массив `[...]` с учетом строк и экранирования
+
+    Returns:
+        str | None: Текст массива или `None`, если массива нет или он не закрыт
+    """
+    return _extractBalanced(text, "[", "]")
+
+
+def _extractBalanced(text: str, opening: str, closing: str) -> str | None:
+    start = text.find(opening)
+    while start != -1:
+        depth = 0
+        inString = False
+        escaped = False
+        for i in range(start, len(text)):
+            char = text[i]
+            if inString:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    inString = False
+            elif char == '"':
+                inString = True
+            elif char == opening:
+                depth += 1
+            elif char == closing:
+                depth -= 1
+                if depth == 0:
+                    candidate = text[start:i + 1]
+                    try:
+                        json.loads(candidate)
+                        return candidate
+                    except ValueError:
+                        break
+        start = text.find(opening, start + 1)
+    return None
+
+
+def parseCommandResponse(text: str) -> CommandResponse:
+    """Разобрать ответ модели на сравнение команды
+
+    Порядок: JSON как есть, JSON внутри ```, первый JSON объект в тексте, поля из незакрытого (оборванного) объекта.
+    Если JSON в ответе нет совсем, весь текст считается креативным ответом.
+
+    Args:
+        text (str): Сырой текст ответа модели
+
+    Returns:
+        CommandResponse: Проверенный ответ
+    """
+    for candidate in (text, stripFences(text)):
+        try:
+            return CommandResponse.model_validate(json.loads(candidate))
+        except (ValueError, ValidationError, TypeError):
+            pass
+
+    candidate = extractJsonObject(text)
+    if candidate is not None:
+        try:
+            return CommandResponse.model_validate(json.loads(candidate))
+        except ValidationError:
+            pass
+
+    # оборванный ответ: берем те поля, что успели сгенерироваться
+    parser = StreamingObjectParser()
+    parser.feed(text)
+    if parser.started:
+        fields = dict(parser.fields)
+        partial = parser.partial
+        if partial is not None and partial[0] not in fields:
+            fields[partial[0]] = partial[1]
+        try:
+            return CommandResponse.model_validate(fields)
+        except ValidationError:
+            pass
+    return CommandResponse(creative=stripFences(text) or None)
+
+
+def parseBatchResponse(text: str) -> dict[int, CommandResponse]:
+    """Разобрать ответ модели на пакетное сравнение команд
+
+    Элементы, которые не прошли проверку, пропускаются: вызывающий сам решает, что делать с сообщениями без ответа.
+    Если вместо массива модель вернула один объект с `id`, он считается массивом из одного элемента.
+
+    Args:
+        text (str): Сырой текст ответа модели
+
+    Returns:
+        dict[int, CommandResponse]: Номер сообщения -> ответ на него
+    """
+    items: Any = None
+    for candidate in (text, stripFences(text), extractJsonArray(text), extractJsonObject(text)):
+        if candidate is None:
+            continue
+        try:
+            items = json.loads(candidate)
+            break
+        except ValueError:
+            pass
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, list):
+        return {}
+
+    responses: dict[int, CommandResponse] = {}
+    for item in items:
+        try:
+            parsed = BatchCommandResponse.model_validate(item)
+        except ValidationError:
+            continue
+        responses.setdefault(parsed.id, CommandResponse(result=parsed.result, creative=parsed.creative))
+    return responses
+
+
+class StreamingObjectParser:
+    """Потоковый разбор первого JSON объекта в тексте, приходящем фрагментами.
+
+    Текст до `{` (пояснения, ```json) пропускается. Каждое поле верхнего уровня передается в `onField`
+    сразу, как только его значение закончилось, не дожидаясь конца объекта.
+    """
+    def __init__(self, onField: Callable[[str, Any], Any] | None = None) -> None:
+        """Потоковый разбор JSON объекта
+
+        Args:
+            onField (Callable[[str, Any], Any] | None, optional): Вызывается с именем и значением каждого готового поля. Defaults to None.
+        """
+        self.onField = onField
+        self.fields: dict[str, Any] = {}
+        self.started = False
+        self.done = False
+
+        self._state = "seek"
+        """`seek` - ищем `{`, `key` - ждем ключ, `colon` - ждем `:`, `value` - ждем значение, `string`/`nested`/`literal` - читаем его"""
+        self._buffer: list[str] = []
+        self._key: str | None = None
+        self._readingKey = False
+        self._escaped = False
+        self._depth = 0
+        self._inString = False
+
+    @property
+    def partial(self) -> tuple[str, str] | None:
+        """Незаконченное строковое значение текущего поля, например креативный ответ, который еще генерируется"""
+        if self._state != "string" or self._readingKey or self._key is None:
+            return None
+        raw = "".join(self._buffer)
+        # висящий обратный слеш - начало еще не пришедшей escape-последовательности
+        if raw.endswith("\\") and not raw.endswith("\\\\"):
+            raw = raw[:-1]
+        try:
+            return self._key, json.loads(f'"{raw}"')
+        except ValueError:
+            return self._key, raw
+
+    def feed(self, delta: str) -> list[tuple[str, Any]]:
+        """Передать следующий фрагмент текста
+
+        Returns:
+            list[tuple[str, Any]]: Поля, которые закончились в этом фрагменте
+        """
+        completed: list[tuple[str, Any]] = []
+        for char in delta:
+            if self.done:
+                break
+            self._step(char, completed)
+        for key, value in completed:
+            if self.onField is not None:
+                self.onField(key, value)
+        return completed
+
+    def _finishValue(self, raw: str, completed: list[tuple[str, Any]]):
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw.strip()
+        self.fields[self._key] = value # type: ignore
+        completed.append((self._key, value)) # type: ignore
+        self._key = None
+        self._state = "key"
+
+    def _step(self, char: str, completed: list[tuple[str, Any]]):
+        state = self._state
+        if state == "seek":
+            if char == "{":
+                self.started = True
+                self._state = "key"
+        elif state == "key":
+            if char == '"':
+                self._buffer = []
+                self._readingKey = True
+                self._state = "string"
+            elif char == "}":
+                self.done = True
+        elif state == "colon":
+            if char == ":":
+                self._state = "value"
+        elif state == "value":
+            if char.isspace():
+                return
+            self._buffer = []
+            if char == '"':
+                self._readingKey = False
+                self._state = "string"
+            elif char in "{[":
+                self._buffer.append(char)
+                self._depth = 1
+                self._inString = False
+                self._escaped = False
+                self._state = "nested"
+            else:
+                self._buffer.append(char)
+                self._state = "literal"
+        elif state == "string":
+            if self._escaped:
+                self._escaped = False
+                self._buffer.append(char)
+            elif char == "\\":
+                self._escaped = True
+                self._buffer.append(char)
+            elif char == '"':
+                raw = "".join(self._buffer)
+                if self._readingKey:
+                    try:
+                        self._key = json.loads(f'"{raw}"')
+                    except ValueError:
+                        # испорченная escape-последовательность в ключе: оставляем ключ как есть
+                        self._key = raw
+                    self._readingKey = False
+                    self._state = "colon"
+                else:
+                    self._finishValue(f'"{raw}"', completed)
+            else:
+                self._buffer.append(char)
+        elif state == "nested":
+            self._buffer.append(char)
+            if self._inString:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._inString = False
+            elif char == '"':
+                self._inString = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finishValue("".join(self._buffer), completed)
+        elif state == "literal":
+            if char in ",}":
+                self._finishValue("".join(self._buffer), completed)
+                if char == "}":
+                    self.done = True
+            else:
+                self._buffer.append(char)
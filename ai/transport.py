@@ -0,0 +1,163 @@
+"""Общий асинхронный транспорт для запросов к языковым моделям.
+
+Держит пул keep-alive соединений и фоновый цикл событий, чтобы синхронный код бота
+(обработчики JSPyBridge) мог отправлять запросы, не открывая каждый раз новое TLS-соединение.
+"""
+import asyncio
+import concurrent.futures
+import json
+import threading
+from typing import Any, AsyncIterator, Coroutine
+
+import aiohttp
+
+
+class EventLoopThread:
+    """Цикл событий asyncio, работающий в отдельном фоновом потоке"""
+    def __init__(self, name: str = "ai-loop") -> None:
+        """Цикл событий asyncio, работающий в отдельном фоновом потоке
+
+        Args:
+            name (str, optional): Имя фонового потока. Defaults to "ai-loop".
+        """
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Запланировать корутину в фоновом цикле событий
+
+        Args:
+            coro (Coroutine): Корутина для выполнения
+
+        Returns:
+            concurrent.futures.Future: Future, который можно ждать из любого потока
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: float | None = None) -> Any:
+        """Выполнить корутину в фоновом цикле и дождаться результата
+
+        Args:
+            coro (Coroutine): Корутина для выполнения
+            timeout (float | None, optional): Максимальное время ожидания в секундах. Defaults to None.
+
+        Returns:
+            Any: Результат выполнения корутины
+        """
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        """Остановить цикл событий и дождаться завершения потока"""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+class PooledTransport:
+    """HTTP-транспорт с пулом keep-alive соединений и ограничением числа одновременных запросов"""
+    def __init__(
+                    self,
+                    maxConcurrency: int = 16,
+                    connectionLimit: int = 32,
+                    keepAliveTimeout: float = 30,
+                    requestTimeout: float = 60,
+                    connectTimeout: float = 10,
+                    readTimeout: float | None = None,
+                ) -> None:
+        """HTTP-транспорт с пулом keep-alive соединений и ограничением числа одновременных запросов
+
+        Args:
+            maxConcurrency (int, optional): Сколько запросов может одновременно ожидать ответа модели. Defaults to 16.
+            connectionLimit (int, optional): Максимальный размер пула TCP-соединений. Defaults to 32.
+            keepAliveTimeout (float, optional): Сколько секунд держать простаивающее соединение открытым. Defaults to 30.
+            requestTimeout (float, optional): Общий таймаут одного обычного запроса в секундах. На потоковые ответы не действует. Defaults to 60.
+            connectTimeout (float, optional): Таймаут установки соединения для потокового ответа в секундах. Defaults to 10.
+            readTimeout (float | None, optional): Сколько секунд потоковый ответ может молчать между строками. По умолчанию - `requestTimeout`. Defaults to None.
+        """
+        self.maxConcurrency = maxConcurrency
+        self.connectionLimit = connectionLimit
+        self.keepAliveTimeout = keepAliveTimeout
+        self.requestTimeout = requestTimeout
+        # длинный ответ модели может идти дольше `requestTimeout`, поэтому поток ограничен только паузами между строками
+        self.streamTimeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connectTimeout,
+            sock_read=requestTimeout if readTimeout is None else readTimeout,
+        )
+
+        self._http: aiohttp.ClientSession | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self.inFlight: int = 0
+        """Количество запросов, которые прямо сейчас ожидают ответа"""
+
+    def _getHttp(self) -> aiohttp.ClientSession:
+        # aiohttp и семафор привязываются к циклу событий, поэтому создаются лениво внутри него
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connectionLimit, keepalive_timeout=self.keepAliveTimeout),
+                timeout=aiohttp.ClientTimeout(total=self.requestTimeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.maxConcurrency)
+        return self._http
+
+    @staticmethod
+    def _payload(body: dict[str, Any]) -> dict[str, Any]:
+        # тело из `RequestBodyTemplate` уже сериализовано, повторно его не кодируем
+        serialized = getattr(body, "serialized", None)
+        return {"data": serialized} if serialized is not None else {"json": body}
+
+    async def post(self, url: str, body: dict[str, Any], headers: dict[str, str]) -> tuple[int, dict]:
+        """Отправить POST запрос с JSON телом
+
+        Args:
+            url (str): Адрес запроса
+            body (dict[str, Any]): JSON тело запроса
+            headers (dict[str, str]): Заголовки запроса
+
+        Returns:
+            tuple[int, dict]: HTTP статус и разобранное JSON тело ответа. Если тело не JSON (например, страница ошибки прокси) - `{"message": текст}`
+        """
+        http = self._getHttp()
+        async with self._semaphore: # type: ignore
+            self.inFlight += 1
+            try:
+                async with http.post(url, **self._payload(body), headers=headers) as r:
+                    text = await r.text()
+            finally:
+                self.inFlight -= 1
+        try:
+            return r.status, json.loads(text)
+        except ValueError:
+            return r.status, {"message": text}
+
+    async def postStream(self, url: str, body: dict[str, Any], headers: dict[str, str]) -> AsyncIterator[bytes]:
+        """Отправить POST запрос и отдавать тело ответа построчно по мере поступления
+
+        Args:
+            url (str): Адрес запроса
+            body (dict[str, Any]): JSON тело запроса
+            headers (dict[str, str]): Заголовки запроса
+
+        Yields:
+            AsyncIterator[bytes]: Строки тела ответа
+        """
+        http = self._getHttp()
+        async with self._semaphore: # type: ignore
+            self.inFlight += 1
+            try:
+                async with http.post(url, **self._payload(body), headers=headers, timeout=self.streamTimeout) as r:
+                    r.raise_for_status()
+                    async for line in r.content:
+                        yield line
+            finally:
+                self.inFlight -= 1
+
+    async def close(self):
+        """Закрыть все соединения пула"""
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
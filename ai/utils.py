@@ -3,14 +3,79 @@ AI functionality to play in Minecraft
 """
 
 from datetime import datetime, timezone
+import hashlib
 import pathlib
-import requests
 import os
 import json
+import threading
+from typing import Callable
 
 from utils.dotenvLoader import loadDotEnv
+from utils.logs import getLogger
 loadDotEnv()
 
+log = getLogger(__name__)
+
+
+IAM_TOKENS_URL = "https://iam.api.cloud.yandex.net/iam/v1/tokens"
+
+
+def requestIAMToken(oauthToken: str, iamUrl: str = IAM_TOKENS_URL) -> dict[str, str]:
+    """Обменять OAuth-токен на IAM-токен
+
+    Returns:
+        dict[str, str]: JSON структура с полями `iamToken` и `expiresAt`
+    """
+    # requests нужен только здесь, поэтому не замедляет импорт модуля ради шаблонов запросов и промптов
+    import requests
+
+    r = requests.post(iamUrl, json={
+        "yandexPassportOauthToken": oauthToken
+    })
+    return r.json()
+
+
+def parseExpiresAt(expiresAt: str) -> datetime:
+    """Разобрать поле `expiresAt` из ответа IAM
+
+    Returns:
+        datetime: Момент истечения токена в UTC
+    """
+    # IAM отдает наносекунды, а `fromisoformat` понимает не больше микросекунд
+    value = expiresAt.rstrip('Z')
+    if "." in value:
+        head, fraction = value.split(".", 1)
+        value = f"{head}.{fraction[:6]}"
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def writeTokenCache(path: pathlib.Path, response: dict[str, str]):
+    """Атомарно записать ответ IAM в файл кэша: сначала во временный файл, затем заменить им старый
+
+    Args:
+        path (pathlib.Path): Путь к файлу кэша
+        response (dict[str, str]): JSON структура с полями `iamToken` и `expiresAt`
+    """
+    tmpPath = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmpPath, "w") as file:
+        json.dump(response, file)
+    os.replace(tmpPath, path)
+
+
+def readTokenCache(path: pathlib.Path) -> dict[str, str] | None:
+    """Прочитать ответ IAM из файла кэша
+
+    Returns:
+        dict[str, str] | None: JSON структура с полями `iamToken` и `expiresAt` или `None`, если кэша нет или он поврежден
+    """
+    try:
+        with open(path, "r") as file:
+            r = json.load(file)
+        parseExpiresAt(r["expiresAt"])
+        return r
+    except (OSError, ValueError, KeyError):
+        return None
+
 
 def getIAMToken(oauthToken: str = str(os.environ.get("YAGPT_OAUTH_TOKEN")), cacheFilename: str = ".iamcache.json") -> dict[str, str]:
     """Вернуть JSON структуру с полями `iamToken` и `expiresAt`. Кэшируется в файл  `.iamcache.json`
@@ -22,32 +87,129 @@ def getIAMToken(oauthToken: str = str(os.environ.get("YAGPT_OAUTH_TOKEN")), cach
     Returns:
         dict[str, str]: _description_
     """
-    def req() -> dict[str, str]:
-        r = requests.post("https://iam.api.cloud.yandex.net/iam/v1/tokens", json={
-            "yandexPassportOauthToken": oauthToken
-        })
-        return r.json()
-    
-    def cache(response: dict[str, str]):
-        with open(pathlib.Path(cwd, cacheFilename).absolute(), "w") as file:
-            json.dump(response, file)
-    
-    cwd = pathlib.Path().cwd().absolute()
-    
-    if cacheFilename in os.listdir(cwd):
-        with open(pathlib.Path(cwd, cacheFilename).absolute(), "r") as file:
-            r = json.load(file)
-            
-        if datetime.fromisoformat(r["expiresAt"].rstrip('Z')).replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
-            response = req()
-            cache(response)
-            return response
-        else:
-            return r
-    else:
-        r = req()
-        cache(r)
+    path = pathlib.Path().cwd().absolute() / cacheFilename
+    r = readTokenCache(path)
+    if r is not None and parseExpiresAt(r["expiresAt"]) > datetime.now(timezone.utc):
         return r
+
+    response = requestIAMToken(oauthToken)
+    writeTokenCache(path, response)
+    return response
+
+
+class IAMTokenProvider:
+    """Держит IAM-токен в памяти и обновляет его в фоне заранее, до истечения срока действия.
+
+    `YaGPTSession` обращается к `token` на каждом запросе, поэтому после `start()` запросы не ждут ни диска, ни IAM.
+    Одновременные обновления из разных потоков объединяются в один запрос к IAM.
+    """
+    def __init__(
+                    self,
+                    oauthToken: str = str(os.environ.get("YAGPT_OAUTH_TOKEN")),
+                    cacheFilename: str = ".iamcache.json",
+                    refreshMargin: float = 3600,
+                    retryDelay: float = 30,
+                    iamUrl: str = IAM_TOKENS_URL,
+                ) -> None:
+        """Держит IAM-токен в памяти и обновляет его в фоне
+
+        Args:
+            oauthToken (str, optional): OAuth-токен для получения IAM-токена. Defaults to str(os.environ.get("YAGPT_OAUTH_TOKEN")).
+            cacheFilename (str, optional): Имя файла для кеширования токена. Defaults to ".iamcache.json".
+            refreshMargin (float, optional): За сколько секунд до `expiresAt` обновлять токен. Defaults to 3600.
+            retryDelay (float, optional): Через сколько секунд повторить неудачное фоновое обновление. Defaults to 30.
+            iamUrl (str, optional): Адрес сервиса IAM. Defaults to IAM_TOKENS_URL.
+        """
+        self.oauthToken = oauthToken
+        self.cachePath = pathlib.Path().cwd().absolute() / cacheFilename
+        self.refreshMargin = refreshMargin
+        self.retryDelay = retryDelay
+        self.iamUrl = iamUrl
+
+        self._token: str | None = None
+        self.expiresAt: datetime | None = None
+        self.refreshCount: int = 0
+        """Сколько раз токен был получен из IAM"""
+
+        self._refreshLock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        cached = readTokenCache(self.cachePath)
+        if cached is not None:
+            self._set(cached)
+
+    def _set(self, response: dict[str, str]):
+        self.expiresAt = parseExpiresAt(response["expiresAt"])
+        self._token = response["iamToken"]
+
+    def _needsRefresh(self, margin: float = 0) -> bool:
+        if self._token is None or self.expiresAt is None:
+            return True
+        return (self.expiresAt - datetime.now(timezone.utc)).total_seconds() <= margin
+
+    @property
+    def expired(self) -> bool:
+        """Токена еще нет или он уже истек: обращение к `token` будет ждать ответа IAM"""
+        return self._needsRefresh()
+
+    @property
+    def token(self) -> str:
+        """Актуальный IAM-токен. Ждет сеть только если токена еще нет или он уже истек"""
+        if self._needsRefresh():
+            self.refresh()
+        return self._token # type: ignore
+
+    def refresh(self) -> str:
+        """Получить новый IAM-токен. Если обновление уже идет в другом потоке - дождаться его и вернуть тот же токен
+
+        Returns:
+            str: Новый IAM-токен
+        """
+        generation = self.refreshCount
+        with self._refreshLock:
+            # пока ждали блокировку, токен мог обновить другой поток
+            if self.refreshCount != generation and not self._needsRefresh():
+                return self._token # type: ignore
+            response = requestIAMToken(self.oauthToken, self.iamUrl)
+            self._set(response)
+            self.refreshCount += 1
+            writeTokenCache(self.cachePath, response)
+            return self._token # type: ignore
+
+    def _secondsUntilRefresh(self) -> float:
+        if self.expiresAt is None:
+            return 0
+        return max(0.0, (self.expiresAt - datetime.now(timezone.utc)).total_seconds() - self.refreshMargin)
+
+    def _run(self):
+        while not self._stopEvent.is_set():
+            if self._needsRefresh(self.refreshMargin):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    log.warning("iam refresh failed", error=str(e))
+                    self._stopEvent.wait(self.retryDelay)
+                    continue
+            self._stopEvent.wait(max(self._secondsUntilRefresh(), self.retryDelay))
+
+    def start(self) -> "IAMTokenProvider":
+        """Запустить фоновое обновление токена
+
+        Returns:
+            IAMTokenProvider: Этот же провайдер
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stopEvent.clear()
+            self._thread = threading.Thread(target=self._run, name="iam-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановить фоновое обновление токена"""
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
     
 
 def createRequestBody(model_uri: str, stream: bool, temperature: float, maxTokens: int, messages: list) -> dict:
@@ -66,6 +228,103 @@ def createRequestBody(model_uri: str, stream: bool, temperature: float, maxToken
         "messages": messages
     }
 
+
+def createOpenAIRequestBody(model: str, stream: bool, temperature: float, maxTokens: int, messages: list) -> dict:
+    """Создает тело для POST запроса к OpenAI-совместимому методу `/chat/completions` (llama.cpp, Ollama, vLLM и т.д.)
+
+    Returns:
+        dict: Словарь, являющийся JSON телом запроса
+    """
+    return {
+        "model": model,
+        "stream": stream,
+        "temperature": temperature,
+        "max_tokens": maxTokens,
+        "messages": [toOpenAIMessage(m) for m in messages]
+    }
+
+
+def toOpenAIMessage(message: dict[str, str]) -> dict[str, str]:
+    """Сообщение `{"role": ..., "text": ...}` в формате OpenAI: `{"role": ..., "content": ...}`"""
+    return {"role": message["role"], "content": message["text"]}
+
+
+class PreparedRequestBody(dict):
+    """Тело запроса, для которого JSON и ключ уже посчитаны. Если поле тела переопределить после сборки,
+    готовый JSON сбрасывается и тело сериализуется обычным образом.
+    """
+    serialized: bytes | None = None
+    """Готовое JSON тело запроса"""
+    key: str | None = None
+    """sha256 от тела запроса (см. `ai.singleflight.requestKey`)"""
+
+    def __setitem__(self, key, value):
+        self.serialized = None
+        self.key = None
+        super().__setitem__(key, value)
+
+
+class RequestBodyTemplate:
+    """Тело запроса с неизменной частью (модель, параметры генерации, системное сообщение), сериализованной один раз.
+
+    На каждый запрос сериализуются только новые сообщения, поэтому стоимость сборки не зависит от размера системного промпта.
+    """
+    def __init__(
+                    self,
+                    model_uri: str,
+                    stream: bool,
+                    temperature: float,
+                    maxTokens: int,
+                    systemMessage: dict[str, str],
+                    createBody: Callable[..., dict] = createRequestBody,
+                    formatMessage: Callable[[dict[str, str]], dict[str, str]] | None = None,
+                ) -> None:
+        """Тело запроса с заранее сериализованной неизменной частью
+
+        Args:
+            model_uri (str): URI модели
+            stream (bool): Потоковая передача ответа
+            temperature (float): Температура генерации
+            maxTokens (int): Ограничение на выход модели в токенах
+            systemMessage (dict[str, str]): Системное сообщение, с которого начинается каждый запрос
+            createBody (Callable[..., dict], optional): Сборка тела в формате API. Поле `messages` должно быть в теле последним. Defaults to createRequestBody.
+            formatMessage (Callable[[dict[str, str]], dict[str, str]] | None, optional): Перевод сообщения в формат API. `None` - сообщения уходят как есть. Defaults to None.
+        """
+        self.systemMessage = systemMessage
+        self.formatMessage = formatMessage
+        self.static = createBody(model_uri, stream, temperature, maxTokens, [])
+        # `{"modelUri": ..., "completionOptions": {...}, "messages": [<system>` - дальше дописываются только новые сообщения
+        head = json.dumps(self.static, ensure_ascii=False)
+        self._prefix = (head[:head.rindex("[") + 1] + json.dumps(self._format(systemMessage), ensure_ascii=False)).encode()
+        self._prefixHash = hashlib.sha256(self._prefix).hexdigest()
+
+    def _format(self, message: dict[str, str]) -> dict[str, str]:
+        return self.formatMessage(message) if self.formatMessage is not None else message
+
+    def build(self, messages: list[dict[str, str]]) -> PreparedRequestBody:
+        """Собрать тело запроса: системное сообщение и переданные сообщения
+
+        Args:
+            messages (list[dict[str, str]]): Сообщения после системного
+
+        Returns:
+            PreparedRequestBody: Тело запроса с готовым JSON
+        """
+        formatted = [self._format(m) for m in messages]
+        tail = "".join(f", {json.dumps(m, ensure_ascii=False)}" for m in formatted).encode()
+        body = PreparedRequestBody(self.static)
+        for key, value in self.static.items():
+            # вложенные параметры (например, `completionOptions`) копируются, чтобы переопределение не портило заготовку
+            if isinstance(value, dict):
+                dict.__setitem__(body, key, dict(value))
+        dict.__setitem__(body, "messages", [self._format(self.systemMessage), *formatted])
+        body.serialized = self._prefix + tail + b"]}"
+        # ключ не зависит от лишних пробелов, как и `ai.singleflight.requestKey`
+        keyTail = json.dumps([[m["role"], " ".join(m["text"].split())] for m in messages], ensure_ascii=False).encode()
+        body.key = hashlib.sha256(self._prefixHash.encode() + keyTail).hexdigest()
+        return body
+
+
 def createMessageBody(text: str, role: str = "user") -> dict[str, str]:
     return {
         "role": role,
@@ -79,3 +338,17 @@ class ROLES(object):
     ASSISTANT = "assistant"
     SYSTEM = "system"
 
+
+
+def estimateTokens(text: str) -> int:
+    """Грубо оценить количество токенов в тексте без обращения к токенизатору модели.
+
+    Для русского текста YandexGPT в среднем тратит один токен на 3-4 символа, поэтому берется оценка сверху.
+
+    Args:
+        text (str): Текст сообщения
+
+    Returns:
+        int: Примерное количество токенов
+    """
+    return len(text) // 3 + 1
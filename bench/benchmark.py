@@ -0,0 +1,223 @@
+"""Бенчмарк AI-части бота на локальном mock-сервере.
+
+N игроков одновременно пишут боту: часть сообщений - команды (через `CommandsComparator`), часть - беседа
+(тот же путь, что и в `whisperHandler` из `main.py`: потоковый ответ в `ChatLineSink`). В конце печатаются
+p50/p95/p99 задержки, пропускная способность и память.
+
+```
+python -m bench.benchmark --players=30 --messages=10 --latency=lognormal:0.8:0.5 --errorRate=0.02
+```
+"""
+import json
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from ai.asyncSession import PooledYaGPTSession
+from ai.cache import ResponseCache
+from ai.history import ChatSessionManager
+from ai.scheduler import RequestScheduler
+from bench.mockServer import LatencyModel, MockYandexServer
+from utils import cli
+from utils.botUtils import ChatLineSink, CommandsComparator
+
+
+COMMAND_PHRASES = ["стоп", "Стоп!", "стой", "за мной", "иди за мной", "найди алмазы", "добудь дерева", "хватит уже", "пойдем со мной"]
+CHAT_PHRASES = ["привет", "как скрафтить верстак?", "где найти алмазы?", "что ты умеешь?", "расскажи про эндер-дракона"]
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Перцентиль без numpy (ближайший ранг)
+
+    Args:
+        values (list[float]): Значения
+        p (float): Перцентиль от 0 до 100
+
+    Returns:
+        float: Значение перцентиля или 0, если значений нет
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+class FakeBot:
+    """Заменитель бота mineflayer, который только запоминает отправленные сообщения"""
+    def __init__(self) -> None:
+        self.whispers: list[tuple[float, str, str]] = []
+        self._lock = threading.Lock()
+
+    def whisper(self, username: str, message: str):
+        with self._lock:
+            self.whispers.append((time.perf_counter(), username, message))
+
+
+class Benchmark:
+    """Прогон сценария: `players` игроков, каждый отправляет `messages` сообщений и ждет ответа на каждое"""
+    def __init__(
+                    self,
+                    apiUrl: str,
+                    players: int = 20,
+                    messages: int = 10,
+                    commandShare: float = 0.5,
+                    useCache: bool = False,
+                    rate: float = 50,
+                    batchWindow: float | None = None,
+                ) -> None:
+        self.players = players
+        self.messages = messages
+        self.commandShare = commandShare
+
+        self.bot = FakeBot()
+        self.session = PooledYaGPTSession(
+            folder_id="bench",
+            iam_token="bench",
+            api_url=apiUrl,
+            maxConcurrency=max(16, players),
+            scheduler=RequestScheduler(rate=rate, burst=rate),
+        )
+        self.chatSessions = ChatSessionManager(self.session.systemPrompt)
+        noop = lambda: None
+        self.comparator = CommandsComparator(
+            {"стоп": noop, "за мной": noop, "найди алмазы": noop, "добудь дерево": noop},
+            aiSession=self.session, # type: ignore
+            cache=ResponseCache(":memory:") if useCache else None,
+            batchWindow=batchWindow,
+        )
+
+        self.latencies: dict[str, list[float]] = {"compare": [], "firstLine": [], "reply": []}
+        self.errors: int = 0
+        self._lock = threading.Lock()
+
+    def _record(self, name: str, value: float):
+        with self._lock:
+            self.latencies[name].append(value)
+
+    def _command(self, text: str):
+        start = time.perf_counter()
+        self.comparator.compare(text)()
+        self._record("compare", time.perf_counter() - start)
+
+    def _chat(self, username: str, text: str):
+        # повторяет whisperHandler из main.py
+        start = time.perf_counter()
+        firstLine: list[float] = []
+
+        def send(line: str):
+            if not firstLine:
+                firstLine.append(time.perf_counter() - start)
+            self.bot.whisper(username, line)
+
+        sink = ChatLineSink(send, maxLength=256 - len(f"/tell {username} "))
+        self.session.askStreamFuture(text, sink.feed, history=self.chatSessions.get(username)).result()
+        sink.flush()
+        self._record("reply", time.perf_counter() - start)
+        if firstLine:
+            self._record("firstLine", firstLine[0])
+
+    def _player(self, index: int):
+        username = f"player{index}"
+        rnd = random.Random(index)
+        for _ in range(self.messages):
+            try:
+                if rnd.random() < self.commandShare:
+                    self._command(rnd.choice(COMMAND_PHRASES))
+                else:
+                    self._chat(username, rnd.choice(CHAT_PHRASES))
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+
+    def run(self) -> dict:
+        """Выполнить сценарий
+
+        Returns:
+            dict: Отчет с задержками, пропускной способностью и памятью
+        """
+        tracemalloc.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.players) as pool:
+            list(pool.map(self._player, range(self.players)))
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        total = self.players * self.messages
+        report: dict = {
+            "players": self.players,
+            "messages": total,
+            "errors": self.errors,
+            "seconds": round(elapsed, 3),
+            "throughput": round(total / elapsed, 2) if elapsed else 0,
+            "latency": {
+                name: {
+                    "count": len(values),
+                    "p50": round(percentile(values, 50), 4),
+                    "p95": round(percentile(values, 95), 4),
+                    "p99": round(percentile(values, 99), 4),
+                }
+                for name, values in self.latencies.items()
+            },
+            "memory": {
+                "tracedCurrentBytes": current,
+                "tracedPeakBytes": peak,
+                "historyBytes": sum(r["bytes"] for r in self.chatSessions.memoryReport().values()),
+            },
+            "comparator": dict(self.comparator.stats),
+            "batches": dict(self.comparator.batcher.stats) if self.comparator.batcher is not None else None,
+            "scheduler": dict(self.session.scheduler.stats),
+            "singleFlight": dict(self.session.singleFlight.stats),
+        }
+        self.comparator.close()
+        self.session.close()
+        return report
+
+
+def printReport(report: dict):
+    """Напечатать отчет в виде таблицы"""
+    print(f"Игроков: {report['players']}, сообщений: {report['messages']}, ошибок: {report['errors']}")
+    print(f"Время: {report['seconds']} с, пропускная способность: {report['throughput']} сообщ./с")
+    print(f"{'операция':<10} {'n':>5} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+    for name, row in report["latency"].items():
+        print(f"{name:<10} {row['count']:>5} {row['p50'] * 1000:>9.1f} {row['p95'] * 1000:>9.1f} {row['p99'] * 1000:>9.1f}")
+    memory = report["memory"]
+    print(f"Память: пик {memory['tracedPeakBytes'] / 1024:.0f} КБ, истории игроков {memory['historyBytes'] / 1024:.0f} КБ")
+    print(f"Компаратор: {report['comparator']}")
+    if report["batches"] is not None:
+        print(f"Пакеты команд: {report['batches']}")
+    print(f"Планировщик: {report['scheduler']}, объединение запросов: {report['singleFlight']}")
+
+
+if __name__ == "__main__":
+    CMD = cli.Cli(" ".join(sys.argv))
+
+    apiUrl = CMD.getOption("url")
+    server = None
+    if not apiUrl:
+        server = MockYandexServer(
+            port=int(CMD.getOption("port") or 8765),
+            latency=LatencyModel(CMD.getOption("latency") or "lognormal:0.8:0.5"),
+            errorRate=float(CMD.getOption("errorRate") or 0),
+        ).startInThread()
+        apiUrl = server.url
+
+    report = Benchmark(
+        apiUrl,
+        players=int(CMD.getOption("players") or 20),
+        messages=int(CMD.getOption("messages") or 10),
+        commandShare=float(CMD.getOption("commandShare") or 0.5),
+        useCache=bool(CMD.getOption("cache")),
+        rate=float(CMD.getOption("rate") or 50),
+        batchWindow=float(CMD.getOption("batchWindow")) if CMD.getOption("batchWindow") else None,
+    ).run()
+    if server is not None:
+        report["server"] = dict(server.stats)
+
+    printReport(report)
+    if CMD.getOption("json"):
+        with open(CMD.getOption("json"), "w") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,214 @@
+"""Локальный заменитель Yandex Foundation Models и IAM для замеров без облачного аккаунта.
+
+Запуск отдельным процессом:
+```
+python -m bench.mockServer --port=8765 --latency=lognormal:0.8:0.5 --errorRate=0.02
+```
+После этого в `YaGPTSession` можно передать `api_url="http://127.0.0.1:8765/foundationModels/v1/completion"`,
+а в `IAMTokenProvider` - `iamUrl="http://127.0.0.1:8765/iam/v1/tokens"`.
+"""
+import asyncio
+import json
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+from utils import cli
+
+
+class LatencyModel:
+    """Распределение задержки ответа модели.
+
+    Задается строкой `вид:параметры`:
+    - `constant:0.5` - всегда 0.5 с;
+    - `uniform:0.2:1.5` - равномерно от 0.2 до 1.5 с;
+    - `normal:0.8:0.2` - нормальное со средним 0.8 с и отклонением 0.2 с;
+    - `lognormal:0.8:0.5` - логнормальное с медианой 0.8 с и параметром разброса 0.5 (длинный хвост, как у настоящего API).
+    """
+    def __init__(self, spec: str = "lognormal:0.8:0.5") -> None:
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind not in ("constant", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Неизвестное распределение задержки '{kind}'")
+
+    def sample(self) -> float:
+        """Случайная задержка в секундах
+
+        Returns:
+            float: Задержка, не меньше нуля
+        """
+        if self.kind == "constant":
+            return self.params[0]
+        if self.kind == "uniform":
+            return random.uniform(self.params[0], self.params[1])
+        if self.kind == "normal":
+            return max(0.0, random.gauss(self.params[0], self.params[1]))
+        return random.lognormvariate(0, self.params[1]) * self.params[0]
+
+    def __str__(self) -> str:
+        return ":".join([self.kind, *map(str, self.params)])
+
+
+class MockYandexServer:
+    """HTTP-сервер с методами `/foundationModels/v1/completion` и `/iam/v1/tokens`.
+
+    На запросы с перечнем команд (`SYSTEM_PROMPT_2`) отвечает JSON вида `{"result": ..., "creative": ...}`,
+    выбирая команду, слова которой есть в тексте игрока, а на пакетные (`SYSTEM_PROMPT_BATCH`) - массивом таких
+    объектов с `id` для каждой строки `номер: текст`. На остальные запросы возвращает эхо последнего сообщения.
+    """
+    COMMANDS_PATTERN = re.compile(r"перечень слов: \[(.*?)\]")
+    BATCH_LINE_PATTERN = re.compile(r"^(\d+): (.*)$", re.MULTILINE)
+
+    def __init__(
+                    self,
+                    host: str = "127.0.0.1",
+                    port: int = 8765,
+                    latency: LatencyModel | None = None,
+                    errorRate: float = 0.0,
+                    streamChunkDelay: float = 0.05,
+                    streamChunkSize: int = 12,
+                ) -> None:
+        """HTTP-сервер, имитирующий YandexGPT и IAM
+
+        Args:
+            host (str, optional): Адрес для прослушивания. Defaults to "127.0.0.1".
+            port (int, optional): Порт. Defaults to 8765.
+            latency (LatencyModel | None, optional): Распределение задержки до ответа (до первого фрагмента при потоковой передаче). Defaults to `lognormal:0.8:0.5`.
+            errorRate (float, optional): Доля запросов, на которые сервер ответит 429 или 500. Defaults to 0.0.
+            streamChunkDelay (float, optional): Пауза между фрагментами потокового ответа в секундах. Defaults to 0.05.
+            streamChunkSize (int, optional): Сколько символов добавляется в каждом фрагменте потокового ответа. Defaults to 12.
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency or LatencyModel()
+        self.errorRate = errorRate
+        self.streamChunkDelay = streamChunkDelay
+        self.streamChunkSize = streamChunkSize
+
+        self.stats: dict[str, int] = {"completions": 0, "streams": 0, "errors": 0, "tokens": 0}
+
+        self.app = web.Application()
+        self.app.router.add_post("/foundationModels/v1/completion", self.completion)
+        self.app.router.add_post("/iam/v1/tokens", self.iamTokens)
+
+    @property
+    def url(self) -> str:
+        """Адрес метода completion"""
+        return f"http://{self.host}:{self.port}/foundationModels/v1/completion"
+
+    @property
+    def iamUrl(self) -> str:
+        """Адрес метода получения IAM-токена"""
+        return f"http://{self.host}:{self.port}/iam/v1/tokens"
+
+    def answer(self, messages: list[dict[str, str]]) -> str:
+        """Сформировать текст ответа модели
+
+        Args:
+            messages (list[dict[str, str]]): Сообщения из тела запроса
+
+        Returns:
+            str: Текст ответа
+        """
+        userText = messages[-1]["text"] if messages else ""
+        system = next((m["text"] for m in messages if m["role"] == "system"), "")
+        match = self.COMMANDS_PATTERN.search(system)
+        if match is None:
+            return f"Ты написал: {userText}. Это ответ тестового сервера, он нужен для замеров задержки."
+
+        commands = [c.strip() for c in match.group(1).split(",") if c.strip()]
+
+        def compare(text: str) -> dict:
+            words = set(text.lower().split())
+            result = next((c for c in commands if words & set(c.split())), None)
+            return {"result": result, "creative": f"Хорошо, {text}!"}
+
+        if '"id"' in system:
+            lines = self.BATCH_LINE_PATTERN.findall(userText)
+            return json.dumps([{"id": int(number), **compare(text)} for number, text in lines], ensure_ascii=False)
+        return json.dumps(compare(userText), ensure_ascii=False)
+
+    @staticmethod
+    def _payload(text: str, final: bool = True) -> dict:
+        return {
+            "result": {
+                "alternatives": [{
+                    "message": {"role": "assistant", "text": text},
+                    "status": "ALTERNATIVE_STATUS_FINAL" if final else "ALTERNATIVE_STATUS_PARTIAL",
+                }],
+                "usage": {"inputTextTokens": "0", "completionTokens": str(len(text) // 3 + 1), "totalTokens": "0"},
+                "modelVersion": "mock",
+            }
+        }
+
+    async def completion(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        await asyncio.sleep(self.latency.sample())
+
+        if random.random() < self.errorRate:
+            self.stats["errors"] += 1
+            status = random.choice((429, 500))
+            return web.json_response({"error": {"grpcCode": 8, "httpCode": status, "message": "mock error"}}, status=status)
+
+        text = self.answer(body.get("messages", []))
+        self.stats["tokens"] += len(text) // 3 + 1
+        if not body.get("completionOptions", {}).get("stream"):
+            self.stats["completions"] += 1
+            return web.json_response(self._payload(text))
+
+        self.stats["streams"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        for end in range(self.streamChunkSize, len(text), self.streamChunkSize):
+            await response.write((json.dumps(self._payload(text[:end], final=False), ensure_ascii=False) + "\n").encode())
+            await asyncio.sleep(self.streamChunkDelay)
+        await response.write((json.dumps(self._payload(text), ensure_ascii=False) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    async def iamTokens(self, request: web.Request) -> web.Response:
+        expiresAt = datetime.now(timezone.utc) + timedelta(hours=12)
+        return web.json_response({
+            "iamToken": f"mock-{int(time.time())}",
+            "expiresAt": expiresAt.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        })
+
+    def startInThread(self) -> "MockYandexServer":
+        """Запустить сервер в фоновом потоке (для бенчмарков внутри одного процесса)
+
+        Returns:
+            MockYandexServer: Этот же сервер
+        """
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            runner = web.AppRunner(self.app, access_log=None)
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, self.host, self.port).start())
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name="mock-yandex", daemon=True).start()
+        started.wait(5)
+        return self
+
+
+if __name__ == "__main__":
+    CMD = cli.Cli(" ".join(sys.argv))
+    server = MockYandexServer(
+        host=CMD.getOption("host") or "127.0.0.1",
+        port=int(CMD.getOption("port") or 8765),
+        latency=LatencyModel(CMD.getOption("latency") or "lognormal:0.8:0.5"),
+        errorRate=float(CMD.getOption("errorRate") or 0),
+        streamChunkDelay=float(CMD.getOption("streamChunkDelay") or 0.05),
+    )
+    print(f"Mock YandexGPT: {server.url} (задержка {server.latency}, ошибки {server.errorRate:.0%})")
+    web.run_app(server.app, host=server.host, port=server.port, access_log=None)
@@ -5,9 +5,11 @@ import json
 from typing import Any, Callable
 import os
 
+import ai.cache
 import ai.prompts
+import ai.scheduler
 import ai.utils
-import ai.session
+import ai.asyncSession
 from utils.botUtils import CommandsComparator
 from utils.dotenvLoader import loadDotEnv
 import difflib
@@ -40,11 +42,12 @@ BOT_ACTIONS = {
 }
 
 # инициализация беседы с YandexGPT
-yagpt = ai.session.YaGPTSession(
+yagpt = ai.asyncSession.PooledYaGPTSession(
     folder_id=os.environ.get("YAGPT_FOLDERID"), # type: ignore
-    iam_token=ai.utils.getIAMToken()["iamToken"],
+    iam_token=ai.utils.IAMTokenProvider().start(),
     temperature=0.1,
     maxTokens=1000,
+    scheduler=ai.scheduler.RequestScheduler(),
     formatMapForSystemPrompt={
         "name": "Alice",
         "commands": ", ".join(list(BOT_ACTIONS.keys()))
@@ -54,11 +57,12 @@ yagpt = ai.session.YaGPTSession(
 # команды для выполнения методов YaGPTSession (кроме `.ask()`)
 DEFAULT_COMMAND_PREFIX = "!"
 DEFAULT_COMMANDS: dict[str, Callable[[], tuple[Any, str]]] = { # type: ignore
-    "clear": lambda: (yagpt.clearChatHistory(), "История очищена")
+    "clear": lambda: (yagpt.clearChatHistory(), "История очищена"),
+    "stats": lambda: (None, f"Команды: {comparator.stats}, кэш: {comparator.cache.stats()}"), # type: ignore
 }
 
 # создание компаратора бота с возможными командами
-comparator = CommandsComparator(BOT_ACTIONS, aiSession=yagpt)
+comparator = CommandsComparator(BOT_ACTIONS, aiSession=yagpt, cache=ai.cache.ResponseCache())
 
 
 
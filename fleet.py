@@ -0,0 +1,47 @@
+"""Запуск нескольких ботов из одного процесса по файлу со списком ботов.
+
+    python fleet.py --roster=roster.json [--stagger=2] [--healthInterval=30] [--disableAi] [--aiBackend=yandex|openai|offline]
+"""
+import sys
+import time
+
+from utils.dotenvLoader import loadDotEnv
+from utils import cli
+from utils.dispatcher import EventDispatcher
+from utils.fleet import Fleet, SharedResources, loadRoster
+from utils.logs import getLogger
+from ai.factory import createAi
+
+loadDotEnv()
+
+CMD = cli.Cli(" ".join(sys.argv))
+roster = loadRoster(CMD.getOption("roster") or "roster.json")
+log = getLogger("fleet")
+
+yagpt = None
+chatSessions = None
+intentSession = None
+if not CMD.getOption("disableAi"):
+    # одна сессия на весь флот: один пул соединений, один цикл событий и один IAM-токен
+    yagpt, chatSessions, intentSession = createAi(CMD, maxSessions=256 * len(roster))
+else:
+    log.info("AI отключен")
+
+shared = SharedResources(
+    yagpt=yagpt,
+    chatSessions=chatSessions,
+    dispatcher=EventDispatcher(workers=int(CMD.getOption("handlerWorkers") or 8)),
+    intentSession=intentSession,
+)
+fleet = Fleet(
+    roster,
+    shared,
+    stagger=float(CMD.getOption("stagger") or 2.0),
+    chatInterval=float(CMD.getOption("chatInterval") or 0.0),
+)
+fleet.start()
+
+healthInterval = float(CMD.getOption("healthInterval") or 30)
+while True:
+    time.sleep(healthInterval)
+    log.info("health", **fleet.health())
@@ -1,57 +1,110 @@
+from utils.startup import StartupProfiler
+
 import os
 import sys
-from javascript import require, On
+import time
 
+from ai.breaker import CircuitOpenError
+from ai.factory import createAi
 from utils.dotenvLoader import loadDotEnv
 from utils import cli
-from utils.botUtils import BotActions, BotInventory
-import ai.utils, ai.session
-
-loadDotEnv()
+from utils.botUtils import BotActions, BotInventory, ChatLineSink
+from utils.actions import ActionExecutor
+from utils.commands import createComparator
+from utils.navigation import NavigationService
+from utils.worldSnapshot import WorldSnapshotter
+from utils.dispatcher import EventDispatcher, Outbox
+from utils.logs import getLogger
+from utils.metrics import REGISTRY
 
 CMD = cli.Cli(" ".join(sys.argv))
 USERNAME = CMD.getOption("name") or "_jeb"
 
-mineflayer = require("mineflayer")
-pathfinder = require("mineflayer-pathfinder")
-
-bot = mineflayer.createBot({
-    "host": os.environ.get("HOST") or CMD.getOption("host") or "127.0.0.1",
-    "port": os.environ.get("PORT") or CMD.getOption("port") or "25565",
-    "username": USERNAME,
-    "version": os.environ.get("VERSION") or CMD.getOption("version") or CMD.getOption("v") or "1.20.4"
-})
+profiler = StartupProfiler(enabled=bool(CMD.getOption("profile-startup")))
+profiler.mark("imports")
 
-mcData = require("minecraft-data")(bot.version)
+log = getLogger("main")
+# время, которое обработчики проводят в потоке моста; вся тяжелая работа должна уходить в пул
+JS_HANDLER_SECONDS = REGISTRY.histogram("js_handler_seconds", "Время обработчиков событий в потоке моста")
 
-bot.loadPlugin(pathfinder.pathfinder)
-movements = pathfinder.Movements(bot, mcData)
-movements.canDig = False
+if CMD.getOption("metricsPort"):
+    REGISTRY.serve(port=int(CMD.getOption("metricsPort")))
+if CMD.getOption("metricsDump"):
+    REGISTRY.startJsonDump(CMD.getOption("metricsDump"), interval=float(CMD.getOption("metricsInterval") or 30))
 
-botActions = BotActions(bot, movements)
-botInventory = BotInventory(bot, mcData)
+with profiler.phase("dotenv"):
+    loadDotEnv()
 
 
 if not CMD.getOption("disableAi"):
-    yagpt = ai.session.YaGPTSession(
-        folder_id=os.environ.get("YAGPT_FOLDERID"), # type: ignore
-        iam_token=ai.utils.getIAMToken()["iamToken"],
-        temperature=0.1,
-        maxTokens=1000,
-        generation_segment="latest"
-    )
+    # импорт клиента и создание сессий идут в фоне, пока бот подключается к серверу
+    aiReady = profiler.background("ai", lambda: createAi(CMD))
 else:
-    print("AI отключен")
+    aiReady = None
+    log.info("AI отключен")
+
+with profiler.phase("bridge"):
+    # импорт запускает процесс Node, поэтому он идет параллельно с созданием сессии YandexGPT
+    from javascript import require, On
+
+with profiler.phase("createBot"):
+    mineflayer = require("mineflayer")
+    pathfinder = require("mineflayer-pathfinder")
+
+    bot = mineflayer.createBot({
+        "host": os.environ.get("HOST") or CMD.getOption("host") or "127.0.0.1",
+        "port": os.environ.get("PORT") or CMD.getOption("port") or "25565",
+        "username": USERNAME,
+        "version": os.environ.get("VERSION") or CMD.getOption("version") or CMD.getOption("v") or "1.20.4"
+    })
+connectStarted = time.perf_counter()
+
+# подключение к серверу идет на стороне Node, пока здесь загружаются данные игры
+with profiler.phase("minecraft-data"):
+    mcData = require("minecraft-data")(bot.version)
+
+# снимок игроков, сущностей и состояния бота одним вызовом моста вместо десятков обращений к прокси
+world = WorldSnapshotter(bot, interval=float(CMD.getOption("snapshotInterval") or 1.0))
+
+with profiler.phase("navigation"):
+    bot.loadPlugin(pathfinder.pathfinder)
+    # один настроенный Movements на профиль; повторные цели не перестраивают путь, а "за мной" сверяется со снимком мира
+    navigation = NavigationService(bot, mcData, thinkTimeout=int(CMD.getOption("thinkTimeout") or 5000), world=world)
+    movements = navigation.movements("default")
+
+botActions = BotActions(bot, movements, navigation)
+# долгие действия выполняются в своем потоке, а "стоп" прерывает их сразу
+executor = ActionExecutor(botActions).start()
+botInventory: BotInventory | None = None
+
+# обработчики событий только ставят задачу в очередь, а сообщения в игру уходят из одного потока
+dispatcher = EventDispatcher(workers=int(CMD.getOption("handlerWorkers") or 8))
+outbox = Outbox(bot, minInterval=float(CMD.getOption("chatInterval") or 0.0))
+REGISTRY.gauge("outbox_depth", lambda: outbox.depth, "Сообщения бота, ждущие отправки")
+
+
+# команды распознаются только локально, все остальное уходит в беседу с YandexGPT
+with profiler.phase("intents"):
+    comparator = createComparator(botActions, executor)
 
 
 
 
 @On(bot, "spawn")
 def spawnHandler(*args):
+    # инвентарь появляется только после входа в мир; дальше его копия обновляется по событиям
+    global botInventory
+    if botInventory is None:
+        botInventory = BotInventory(bot, mcData)
+        world.start()
+        profiler.mark("spawn", since=connectStarted)
+        profiler.printReport()
+
     @On(bot, "chat")
     def chatHandler(this, username: str, message: str, *args):
-        if username != USERNAME:
-            bot.whisper(username, f"Напиши мне командой `/tell {USERNAME} <твое_сообщение>` и тогда я смогу помочь!")
+        with JS_HANDLER_SECONDS.time(event="chat"):
+            if username != USERNAME:
+                outbox.whisper(username, f"Напиши мне командой `/tell {USERNAME} <твое_сообщение>` и тогда я смогу помочь!")
 
     @On(bot, "whisper")
     def whisperHandler(this, username: str, message: str, *args):
@@ -82,13 +135,38 @@ def spawnHandler(*args):
         """
         
             
-        # запрос в YaGPT, если не включена опция `disableAi`
-        if CMD.getOption("disableAi"):
-            bot.chat("При запуске бота Вы отключили запросы к YandexGPT, указав необязательную опцию --disableAi.\n\nПожалуйста, перезапустите бота без использования этой опции")
-        else:
-            try:
-                r = yagpt.ask(message)
-                bot.whisper(username, f"{r}")
-            except Exception as e:
-                print(e)
-                bot.whisper(username, "Прости, не могу тебе ответить")
+        with JS_HANDLER_SECONDS.time(event="whisper"):
+            # известные команды сразу уходят исполнителю действий, не дожидаясь ответов нейросети на прошлые сообщения
+            reply = comparator.replyLocal(message, username=username)
+            if reply is not None:
+                outbox.whisper(username, reply)
+                return
+            dispatcher.submit(username, handleWhisper, username, message)
+
+
+def handleWhisper(username: str, message: str):
+    """Обработка личного сообщения игрока в пуле потоков. Сообщения одного игрока обрабатываются по очереди"""
+    # запрос в YaGPT, если не включена опция `disableAi`
+    if aiReady is None:
+        outbox.chat("При запуске бота Вы отключили запросы к YandexGPT, указав необязательную опцию --disableAi.\n\nПожалуйста, перезапустите бота без использования этой опции")
+        return
+
+    # ответ приходит по предложениям и сразу уходит в очередь отправки
+    sink = ChatLineSink.forWhisper(outbox, username)
+    try:
+        # сессия создается в фоне при запуске; первые сообщения ждут ее здесь, а не в потоке моста
+        yagpt, chatSessions, intentSession = aiReady.result()
+        if intentSession is not None:
+            # перефразированную команду распознает локальная модель, и запрос к основной не нужен
+            reply = comparator.compareIntent(message, intentSession, username=username)
+            if reply is not None:
+                outbox.whisper(username, reply())
+                return
+        yagpt.askStreamFuture(message, sink.feed, history=chatSessions.get(username)).result()
+        sink.flush()
+    except CircuitOpenError:
+        # модель недоступна: команда ищется с ослабленным порогом, а игрок сразу получает заготовленный ответ
+        outbox.whisper(username, comparator.compareDegraded(message, username=username)())
+    except Exception as e:
+        log.error("reply failed", username=username, error=str(e))
+        outbox.whisper(username, "Прости, не могу тебе ответить")
@@ -0,0 +1,103 @@
+"""Тесты исполнителя действий бота"""
+import threading
+import time
+
+from utils.actions import ACTION_PRIORITIES, ActionExecutor, CallableAction, FollowAction
+
+
+class FakeBotActions:
+    """Заглушка `BotActions`, которая только считает вызовы"""
+    def __init__(self) -> None:
+        self.follows: list[str] = []
+        self.stops = 0
+        self.resets = 0
+
+    def follow(self, username: str, distance: float = 1) -> bool:
+        self.follows.append(username)
+        return True
+
+    def stopMoving(self):
+        self.stops += 1
+
+    def reset(self):
+        self.resets += 1
+
+
+def waitRunning(action, timeout: float = 1.0):
+    deadline = time.monotonic() + timeout
+    while action.status != "running" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_repeatedFollowDoesNotPreempt():
+    botActions = FakeBotActions()
+    executor = ActionExecutor(botActions, tickInterval=0.01).start()
+    follow = lambda username: FollowAction(botActions, username)
+    try:
+        first = executor.submit(CallableAction("за мной", follow, username="Steve"))
+        waitRunning(first)
+        second = CallableAction("за мной", follow, username="Steve")
+        assert executor.submit(second) is first
+        assert second.status == "merged"
+        assert first.status == "running"
+        assert botActions.stops == 0
+        assert executor.stats["preempted"] == 0
+        # повтор только обновляет цель через навигацию, которая сама отбрасывает ту же сущность
+        assert botActions.follows == ["Steve", "Steve"]
+    finally:
+        executor.stop()
+
+
+def test_followForAnotherPlayerPreempts():
+    botActions = FakeBotActions()
+    executor = ActionExecutor(botActions, tickInterval=0.01).start()
+    follow = lambda username: FollowAction(botActions, username)
+    try:
+        first = executor.submit(CallableAction("за мной", follow, username="Steve"))
+        waitRunning(first)
+        second = executor.submit(CallableAction("за мной", follow, username="Alex"))
+        assert second is not first
+        assert first.status == "cancelled"
+        assert botActions.stops == 1
+        assert executor.stats["preempted"] == 1
+    finally:
+        executor.stop()
+
+
+def test_stopCommandRecordsLatency():
+    botActions = FakeBotActions()
+    executor = ActionExecutor(botActions, tickInterval=0.01).start()
+    try:
+        # "стоп" из таблицы команд приходит как `CallableAction`, а не `StopAction`
+        stop = executor.submit(CallableAction("стоп", lambda: botActions.reset(), priority=ACTION_PRIORITIES.STOP, exclusive=True))
+        deadline = time.monotonic() + 1.0
+        while stop.status != "done" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stop.status == "done"
+        assert executor.lastStopLatency is not None
+    finally:
+        executor.stop()
+
+
+def test_cancelRunsOutsideExecutorLock():
+    class ProbingBotActions(FakeBotActions):
+        """Во время отмены проверяет из другого потока, что очередь исполнителя доступна"""
+        lockFree: bool | None = None
+
+        def stopMoving(self):
+            super().stopMoving()
+            probe = threading.Thread(target=lambda: executor.pending)
+            probe.start()
+            probe.join(timeout=0.5)
+            self.lockFree = not probe.is_alive()
+
+    botActions = ProbingBotActions()
+    executor = ActionExecutor(botActions, tickInterval=0.01).start()
+    try:
+        first = executor.submit(CallableAction("за мной", lambda username: FollowAction(botActions, username), username="Steve"))
+        waitRunning(first)
+        executor.reset()
+        assert first.status == "cancelled"
+        assert botActions.lockFree is True
+    finally:
+        executor.stop()
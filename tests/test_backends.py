@@ -0,0 +1,82 @@
+"""Бэкенды языковых моделей `ai.backends`"""
+import pytest
+
+from ai.asyncSession import AsyncYaGPTSession
+from ai.backends import LLMBackend, OfflineBackend, OpenAICompatibleBackend, YandexBackend, createBackend
+from ai.session import YaGPTSession
+from ai.streaming import ChatCompletionDeltaParser
+
+
+def test_incompleteBackendFailsOnCreation():
+    class Incomplete(LLMBackend):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete("http://localhost", "m") # type: ignore
+
+
+@pytest.mark.parametrize("kind, cls", [("yandex", YandexBackend), ("openai", OpenAICompatibleBackend), ("offline", OfflineBackend)])
+def test_createBackend(kind, cls):
+    assert type(createBackend(kind, folder_id="f", iam_token="t")) is cls
+
+
+def test_createYandexBackend():
+    backend = createBackend("yandex", folder_id="f", iam_token=lambda: "t")
+    assert backend.model == "gpt://f/yandexgpt/latest"
+    assert backend.headers()["Authorization"] == "Bearer t"
+
+
+def test_unknownBackend():
+    with pytest.raises(ValueError):
+        createBackend("claude")
+
+
+def test_openAIBodyFromTemplate():
+    backend = OpenAICompatibleBackend("http://127.0.0.1:8080/v1/", model="m")
+    assert backend.url == "http://127.0.0.1:8080/v1/chat/completions"
+    body = backend.createBodyTemplate("m", False, 0.1, 16, {"role": "system", "text": "s"}).build([{"role": "user", "text": "u"}])
+    assert body["messages"] == [{"role": "system", "content": "s"}, {"role": "user", "content": "u"}]
+    assert body["max_tokens"] == 16
+
+
+def test_sseParser():
+    parser = ChatCompletionDeltaParser()
+    deltas = [parser.feed(line) for line in (": ping", 'data: {"choices": [{"delta": {"content": "При"}}]}', 'data: {"choices": [{"delta": {"content": "вет"}, "finish_reason": "stop"}]}', "data: [DONE]")]
+    assert "".join(deltas) == "Привет"
+    assert parser.finished
+
+
+def test_offlineSessionIsDeterministic():
+    session = YaGPTSession(backend=OfflineBackend())
+    assert session.customAsk([{"role": "user", "text": "привет"}]) == session.customAsk([{"role": "user", "text": "привет"}])
+    assert "".join(session.askStream("расскажи историю")) == session.backend.answer([{"role": "user", "text": "расскажи историю"}])
+
+
+def test_asyncSessionTransportUsesSessionTimeout():
+    session = AsyncYaGPTSession(backend=OfflineBackend(), timeout=7)
+    assert session.transport.requestTimeout == 7
+
+
+def test_expiredIamTokenIsFetchedOffTheLoop(tmp_path):
+    import asyncio
+    import threading
+    from ai.utils import IAMTokenProvider
+
+    class FakeProvider(IAMTokenProvider):
+        def refresh(self) -> str:
+            self.refreshThread = threading.current_thread()
+            self._set({"iamToken": "t1", "expiresAt": "2999-01-01T00:00:00Z"})
+            return self._token # type: ignore
+
+    provider = FakeProvider(oauthToken="oauth", cacheFilename=str(tmp_path / "iam.json"))
+    backend = YandexBackend("folder", provider, "gpt://folder/yandexgpt/latest")
+    session = AsyncYaGPTSession(backend=backend)
+    assert backend.headersBlock()
+
+    async def headers():
+        return threading.current_thread(), await session._headersAsync()
+
+    loopThread, result = asyncio.run(headers())
+    assert result["Authorization"] == "Bearer t1"
+    assert provider.refreshThread is not loopThread
+    # действующий токен берется прямо в цикле событий
+    assert not backend.headersBlock()
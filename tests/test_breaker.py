@@ -0,0 +1,76 @@
+"""Предохранитель `CircuitBreaker`"""
+import pytest
+
+from ai.breaker import BREAKER_STATES, CircuitBreaker, CircuitOpenError
+
+
+def trip(breaker: CircuitBreaker, count: int = 3):
+    for _ in range(count):
+        breaker.record(False, 0.01)
+
+
+def test_opensOnFailureRate():
+    breaker = CircuitBreaker(minRequests=3, failureRate=0.5)
+    breaker.record(True, 0.01)
+    breaker.record(False, 0.01)
+    assert breaker.state == BREAKER_STATES.CLOSED
+    breaker.record(False, 0.01)
+    assert breaker.state == BREAKER_STATES.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    assert breaker.stats["rejected"] == 1
+
+
+def test_opensOnSlowCalls():
+    breaker = CircuitBreaker(minRequests=2, slowCall=0.5, slowRate=0.5)
+    breaker.record(True, 1.0)
+    breaker.record(True, 1.0)
+    assert breaker.isOpen
+
+
+def test_halfOpenTrialCloses():
+    breaker = CircuitBreaker(minRequests=3, openFor=0)
+    trip(breaker)
+    breaker.before()
+    assert breaker.state == BREAKER_STATES.HALF_OPEN
+    # пока идет пробный запрос, остальные отклоняются
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.record(True, 0.01)
+    assert breaker.state == BREAKER_STATES.CLOSED
+
+
+def test_failedTrialBacksOff():
+    breaker = CircuitBreaker(minRequests=3, openFor=0.01, maxOpenFor=0.03)
+    trip(breaker)
+    breaker._openedAt -= 1
+    breaker.before()
+    breaker.record(False, 0.01)
+    assert breaker.state == BREAKER_STATES.OPEN
+    assert breaker._currentOpenFor == pytest.approx(0.02)
+
+
+def test_backgroundProbe():
+    breaker = CircuitBreaker(minRequests=3, openFor=60, probe=lambda: True)
+    trip(breaker)
+    breaker._timer.cancel() # type: ignore
+    breaker._runProbe()
+    assert breaker.state == BREAKER_STATES.CLOSED
+
+
+def test_wrapCountsServerErrors():
+    breaker = CircuitBreaker(minRequests=2)
+    guarded = breaker.wrap(lambda: 503, lambda status: status)
+    guarded()
+    guarded()
+    assert breaker.isOpen
+    assert breaker.stats["failures"] == 2
+
+
+def test_abandonedStreamIsNotFailure():
+    breaker = CircuitBreaker(minRequests=1)
+    stream = breaker.guardStream(iter([b"a", b"b"]))
+    next(stream)
+    stream.close()
+    assert breaker.stats == {**breaker.stats, "calls": 1, "failures": 0}
+    assert not breaker.isOpen
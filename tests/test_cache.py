@@ -0,0 +1,49 @@
+"""Кэш ответов `ai.cache.ResponseCache` и его использование асинхронной сессией"""
+from ai.asyncSession import PooledYaGPTSession
+from ai.backends import OfflineBackend
+from ai.cache import ResponseCache
+
+
+def test_evictsEveryNWrites():
+    cache = ResponseCache(":memory:", maxEntries=2, evictEvery=3)
+    for i in range(2):
+        cache.set(f"k{i}", "ответ")
+    assert cache.stats()["size"] == 2
+    cache.set("k2", "ответ")
+    # третья запись запускает чистку, и остаются только `maxEntries` записей
+    assert cache.stats()["size"] == 2
+    cache.set("k3", "ответ")
+    assert cache.stats()["size"] == 3
+    cache.evict()
+    assert cache.stats()["size"] == 2
+    assert cache.get("k3") == "ответ"
+
+
+def test_expiredEntryIsMiss():
+    cache = ResponseCache(":memory:", ttl=-1)
+    cache.set("k", "ответ")
+    assert cache.get("k") is None
+    assert cache.misses == 1
+
+
+class CountingBackend(OfflineBackend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    def complete(self, request_body):
+        self.calls += 1
+        return super().complete(request_body)
+
+
+def test_pooledSessionUsesCache():
+    backend = CountingBackend()
+    session = PooledYaGPTSession(backend=backend, responseCache=ResponseCache(":memory:"))
+    try:
+        messages = [{"role": "user", "text": "привет"}]
+        first = session.customAsk(messages)
+        assert session.customAsk(messages) == first
+        assert backend.calls == 1
+        assert session.responseCache.hits == 1
+    finally:
+        session.close()
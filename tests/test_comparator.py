@@ -0,0 +1,66 @@
+"""Каскад сравнения команд `CommandsComparator`"""
+from ai.cache import ResponseCache
+from utils.botUtils import CommandsComparator
+
+
+class FakeSession:
+    """Сессия модели, которая отвечает заданным текстом и считает запросы"""
+    model_uri = "fake"
+
+    def __init__(self, answer: str) -> None:
+        self.answer = answer
+        self.calls = 0
+
+    def customAsk(self, messages, **kwargs) -> str:
+        self.calls += 1
+        return self.answer
+
+    def customAskStream(self, messages, **kwargs):
+        self.calls += 1
+        yield self.answer
+
+
+def comparator(remote: FakeSession, intent: FakeSession | None = None, cache: ResponseCache | None = None):
+    done: list[str] = []
+    cases = {"стоп": lambda **context: done.append("стоп"), "за мной": lambda **context: done.append("за мной")}
+    return CommandsComparator(cases, aiSession=remote, cache=cache, intentSession=intent), done # type: ignore
+
+
+def test_streamCacheHitSkipsPipeline():
+    remote = FakeSession('{"result": "за мной", "creative": "Иду"}')
+    intent = FakeSession("null")
+    c, done = comparator(remote, intent, ResponseCache(":memory:"))
+    text = "расскажи, что видишь вокруг"
+    assert c.compare(text)() == "Иду"
+    assert (remote.calls, intent.calls) == (1, 1)
+
+    chunks: list[str] = []
+    assert c.compareStream(text, chunks.append)() == "Иду"
+    # при попадании в кэш локальная модель спрашивается один раз (как и в `compare`), а основная - ни разу
+    assert (remote.calls, intent.calls) == (1, 2)
+    assert chunks == ["Иду"]
+    assert done == ["за мной", "за мной"]
+    assert (c.stats["ai"], c.stats["cache"]) == (1, 1)
+
+
+def test_intentModelAvoidsRemote():
+    remote = FakeSession('{"result": null, "creative": "Привет"}')
+    c, done = comparator(remote, FakeSession(' "стоп".'))
+    c.compare("а ну-ка притормози")()
+    assert done == ["стоп"]
+    assert remote.calls == 0
+    assert c.stats["localModel"] == 1
+
+
+def test_promptChangeInvalidatesCache(monkeypatch):
+    from ai import prompts
+    cache = ResponseCache(":memory:")
+    remote = FakeSession('{"result": null, "creative": "Привет"}')
+    text = "расскажи, что видишь вокруг"
+    comparator(remote, cache=cache)[0].compare(text)()
+    comparator(remote, cache=cache)[0].compare(text)()
+    assert remote.calls == 1
+
+    monkeypatch.setattr(prompts.Prompts, "SYSTEM_PROMPT_2", prompts.Prompts.SYSTEM_PROMPT_2 + "\nОтвечай коротко.")
+    comparator(remote, cache=cache)[0].compare(text)()
+    assert remote.calls == 2
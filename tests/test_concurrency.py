@@ -0,0 +1,117 @@
+"""Объединение запросов: `SingleFlight` и `MicroBatcher`"""
+import json
+import threading
+import time
+
+import pytest
+
+from ai.singleflight import SingleFlight
+from utils.batching import MicroBatcher
+from utils.botUtils import CommandsComparator
+
+
+def test_singleFlightSharesResult():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "ответ"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    started.wait()
+    results.append(flight.do("k", slow))
+    leader.join()
+    assert results == ["ответ", "ответ"]
+    assert len(calls) == 1
+
+
+def test_microBatcherGroupsItems():
+    batches = []
+
+    def handler(items):
+        batches.append(list(items))
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(handler, window=0.1, maxSize=8)
+    futures = [batcher.submit(text) for text in ("а", "б", "в")]
+    assert [f.result(timeout=2) for f in futures] == ["А", "Б", "В"]
+    batcher.close()
+    assert batches == [["а", "б", "в"]]
+
+
+def test_microBatcherSendsFullBatchWithoutWaiting():
+    batches = []
+    batcher = MicroBatcher(lambda items: batches.append(list(items)) or items, window=5, maxSize=3)
+    started = time.perf_counter()
+    futures = [batcher.submit(i) for i in range(4)]
+    assert [f.result(timeout=2) for f in futures[:3]] == [0, 1, 2]
+    # пакет заполнился, поэтому окно в 5 секунд не ждали
+    assert time.perf_counter() - started < 1
+    batcher.close()
+    assert futures[3].result(timeout=2) == 3
+    assert batches == [[0, 1, 2], [3]]
+    assert batcher.stats["maxBatch"] == 3
+
+
+def test_microBatcherFailsWholeBatch():
+    def handler(items):
+        raise ValueError("модель недоступна")
+
+    batcher = MicroBatcher(handler, window=0.01)
+    future = batcher.submit("стоп")
+    with pytest.raises(ValueError):
+        future.result(timeout=2)
+    batcher.close()
+    assert batcher.stats["failed"] == 1
+
+
+def test_microBatcherRejectsShortAnswer():
+    batcher = MicroBatcher(lambda items: items[:1], window=0.05)
+    futures = [batcher.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=2)
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(3)
+
+
+def test_comparatorBatchesConcurrentMisses():
+    class BatchSession:
+        model_uri = "fake"
+
+        def __init__(self) -> None:
+            self.calls: list[str] = []
+
+        def customAsk(self, messages, **kwargs) -> str:
+            numbered = messages[-1]["text"]
+            self.calls.append(numbered)
+            ids = [int(line.split(":", 1)[0]) for line in numbered.splitlines()]
+            return json.dumps([{"id": i, "result": None, "creative": f"ответ {i}"} for i in ids])
+
+    session = BatchSession()
+    comparator = CommandsComparator({"стоп": lambda **context: None}, aiSession=session, batchWindow=0.1) # type: ignore
+    barrier = threading.Barrier(3)
+    answers: dict[str, str] = {}
+
+    def player(text: str):
+        barrier.wait()
+        answers[text] = comparator.compare(text)()
+
+    texts = ["расскажи анекдот", "что ты видишь", "расскажи анекдот"]
+    threads = [threading.Thread(target=player, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    comparator.close()
+    # три игрока, две разные фразы - один запрос к модели
+    assert len(session.calls) == 1
+    assert len(session.calls[0].splitlines()) == 2
+    assert sorted(set(answers.values())) == ["ответ 1", "ответ 2"]
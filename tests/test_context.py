@@ -0,0 +1,40 @@
+"""Подбор истории под бюджет входных токенов: `ContextWindow.fit`"""
+from ai.context import ContextWindow
+from ai.history import SUMMARY_PREFIX, ChatHistory
+
+
+def history(turns: int, length: int = 90) -> ChatHistory:
+    h = ChatHistory("системный промпт")
+    for i in range(turns):
+        h.append(f"{i:03d} " + "x" * length, "user" if i % 2 == 0 else "assistant")
+    return h
+
+
+def test_everythingFits():
+    h = history(4)
+    assert ContextWindow(maxInputTokens=10_000).fit(h) == list(h.turns)
+
+
+def test_keepsNewestTurnsAndSummarizes():
+    h = history(20)
+    window = ContextWindow(maxInputTokens=300, summaryChars=120)
+    messages = window.fit(h)
+    assert messages[0]["role"] == "system" and messages[0]["text"].startswith(SUMMARY_PREFIX)
+    kept = messages[1:]
+    assert kept == list(h.turns)[-len(kept):]
+    assert 0 < len(kept) < 20
+    assert sum(window.tokens(m) for m in messages) + window.tokens(h.systemMessage) <= 300
+
+
+def test_lastTurnAlwaysSent():
+    h = history(3, length=3000)
+    messages = ContextWindow(maxInputTokens=100, summarize=False).fit(h)
+    assert messages == [h.turns[-1]]
+
+
+def test_summaryIsReused():
+    h = history(20)
+    window = ContextWindow(maxInputTokens=300)
+    first = window.fit(h)
+    assert window.fit(h)[0] is first[0]
+    assert window.stats["summaryHits"] == 1
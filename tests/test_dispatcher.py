@@ -0,0 +1,124 @@
+"""Вынос обработчиков событий из потока моста: `EventDispatcher` и `Outbox`"""
+import threading
+import time
+
+from utils.dispatcher import EventDispatcher, Outbox
+
+
+class FakeBot:
+    """Бот, который запоминает отправленные сообщения и поток, из которого они отправлены"""
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.sent: list[tuple[str, ...]] = []
+        self.threads: set[str] = set()
+
+    def _record(self, *message: str):
+        time.sleep(self.delay)
+        self.threads.add(threading.current_thread().name)
+        self.sent.append(message)
+
+    def whisper(self, username: str, message: str):
+        self._record(username, message)
+
+    def chat(self, message: str):
+        self._record(message)
+
+
+def waitFor(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_submitDoesNotBlockCaller():
+    dispatcher = EventDispatcher(workers=2)
+    release = threading.Event()
+    try:
+        started = time.perf_counter()
+        dispatcher.submit("Steve", release.wait)
+        assert time.perf_counter() - started < 0.05
+        assert waitFor(lambda: dispatcher.running == 1)
+    finally:
+        release.set()
+        dispatcher.shutdown()
+    assert dispatcher.completed == 1
+
+
+def test_tasksOfOnePlayerRunInOrder():
+    dispatcher = EventDispatcher(workers=4)
+    order: list[int] = []
+    active: list[int] = []
+    overlaps: list[int] = []
+
+    def handler(i: int):
+        active.append(i)
+        overlaps.append(len(active))
+        time.sleep(0.005)
+        order.append(i)
+        active.remove(i)
+
+    for i in range(10):
+        dispatcher.submit("Steve", handler, i)
+    assert waitFor(lambda: dispatcher.completed == 10)
+    dispatcher.shutdown()
+    assert order == list(range(10))
+    assert max(overlaps) == 1
+    assert dispatcher.queueDepth("Steve") == 0
+
+
+def test_playersRunConcurrently():
+    dispatcher = EventDispatcher(workers=2)
+    barrier = threading.Barrier(2, timeout=1)
+    # оба обработчика должны встретиться на барьере, иначе второй игрок ждал бы первого
+    dispatcher.submit("Steve", barrier.wait)
+    dispatcher.submit("Alex", barrier.wait)
+    assert waitFor(lambda: dispatcher.completed == 2)
+    dispatcher.shutdown()
+    assert dispatcher.failed == 0
+
+
+def test_failedHandlerDoesNotStopQueue():
+    dispatcher = EventDispatcher(workers=1)
+    done: list[str] = []
+
+    def broken():
+        raise ValueError("oops")
+
+    dispatcher.submit("Steve", broken)
+    dispatcher.submit("Steve", done.append, "next")
+    assert waitFor(lambda: dispatcher.completed == 2)
+    dispatcher.shutdown()
+    assert done == ["next"]
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_outboxSendsInOrderFromOneThread():
+    bot = FakeBot(delay=0.002)
+    outbox = Outbox(bot)
+    threads = [
+        threading.Thread(target=lambda i=i: [outbox.whisper(f"player{i}", f"{n}") for n in range(5)])
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    outbox.chat("всем привет")
+    outbox.close()
+    assert len(bot.sent) == 21
+    assert bot.threads == {"outbox"}
+    assert bot.sent[-1] == ("всем привет",)
+    for i in range(4):
+        assert [message for username, message in bot.sent[:-1] if username == f"player{i}"] == [str(n) for n in range(5)] # type: ignore
+
+
+def test_outboxKeepsMinInterval():
+    bot = FakeBot()
+    outbox = Outbox(bot, minInterval=0.05)
+    started = time.perf_counter()
+    for n in range(3):
+        outbox.chat(str(n))
+    outbox.close()
+    assert time.perf_counter() - started >= 0.1
+    assert outbox.sent == 3
@@ -0,0 +1,66 @@
+"""Общая сборка сессий (`ai.factory`) и команд бота (`utils.commands`)"""
+from ai.backends import OfflineBackend
+from ai.factory import createAi
+from utils.commands import createComparator
+
+
+class FakeOptions:
+    """Заглушка `utils.cli.Cli` со словарем параметров"""
+    def __init__(self, **options: str) -> None:
+        self.options = options
+
+    def getOption(self, name: str) -> str | None:
+        return self.options.get(name)
+
+
+class FakeBotActions:
+    def __init__(self) -> None:
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+
+def test_createAiOffline():
+    yagpt, chatSessions, intentSession = createAi(
+        FakeOptions(aiBackend="offline", intentBackend="offline", historyStore="none", intentTimeout="2"),
+        maxSessions=10,
+    )
+    try:
+        assert isinstance(yagpt.backend, OfflineBackend)
+        assert intentSession.loopThread is yagpt.loopThread
+        assert intentSession.transport.requestTimeout == 2
+        assert chatSessions.maxSessions == 10
+        assert yagpt.customAsk([{"role": "user", "text": "привет"}])
+    finally:
+        chatSessions.close()
+        intentSession.close()
+        yagpt.close()
+
+
+def test_comparatorRunsBotCommandsLocally():
+    botActions = FakeBotActions()
+    comparator = createComparator(botActions) # type: ignore
+    result = comparator.compareLocal("остановись", username="Steve")
+    assert result is not None
+    result()
+    assert botActions.resets == 1
+    assert comparator.compareLocal("расскажи про эндер-дракона", username="Steve") is None
+
+
+def test_localReplyAcknowledgesCommand():
+    botActions = FakeBotActions()
+    comparator = createComparator(botActions) # type: ignore
+    assert comparator.replyLocal("стоп", username="Steve")
+    assert botActions.resets == 1
+    assert comparator.replyLocal("стол", username="Steve") is None
+    assert botActions.resets == 1
+
+
+def test_intentMatchIsConfirmed():
+    botActions = FakeBotActions()
+    comparator = createComparator(botActions) # type: ignore
+    reply = comparator.replyLocal("остановись уже", username="Steve")
+    assert reply is not None and '"стоп"' in reply
+    assert comparator.stats["intent"] == 1
+    assert comparator.replyLocal("не ходи за мной", username="Steve") is None
@@ -0,0 +1,100 @@
+"""История переписки `ai.history` и ее сохранение сессией"""
+import threading
+
+import pytest
+
+from ai.backends import LLMError, OfflineBackend
+from ai.history import ChatHistory, ChatSessionManager
+from ai.session import YaGPTSession
+
+
+class FlakyBackend(OfflineBackend):
+    """Заглушка, которая отвечает ошибкой, пока `failing` установлен"""
+    def __init__(self) -> None:
+        super().__init__()
+        self.failing = False
+
+    def complete(self, body):
+        if self.failing:
+            return 500, {"error": {"message": "internal"}}
+        return super().complete(body)
+
+
+def test_failedAskLeavesNoOrphanTurn():
+    backend = FlakyBackend()
+    session = YaGPTSession(backend=backend)
+    history = ChatHistory("система")
+    session.ask("привет", history=history)
+    backend.failing = True
+    with pytest.raises(LLMError):
+        session.ask("как дела?", history=history)
+    assert [turn["role"] for turn in history.turns] == ["user", "assistant"]
+
+    backend.failing = False
+    session.ask("как дела?", history=history)
+    assert [turn["text"] for turn in history.turns][2] == "как дела?"
+    assert [turn["role"] for turn in history.turns] == ["user", "assistant", "user", "assistant"]
+
+
+def test_concurrentAsksKeepTurnsPaired():
+    session = YaGPTSession(backend=OfflineBackend())
+    barrier = threading.Barrier(8)
+
+    def worker(i: int):
+        barrier.wait()
+        for n in range(10):
+            session.ask(f"вопрос {i}-{n}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    turns = list(session.history.turns)
+    assert len(turns) == 160
+    assert [turn["role"] for turn in turns] == ["user", "assistant"] * 80
+
+
+def test_systemPromptSurvivesTrim():
+    history = ChatHistory("система", maxMessages=3, summaryChars=200)
+    for i in range(5):
+        history.append(f"реплика {i}")
+    assert [turn["text"] for turn in history.turns] == ["реплика 2", "реплика 3", "реплика 4"]
+    messages = history.messages
+    assert messages[0] == history.systemMessage
+    # вытесненные реплики попадают в краткое содержание сразу после системного промпта
+    assert "реплика 0" in history.summary # type: ignore
+    assert messages[1]["role"] == "system" and "реплика 1" in messages[1]["text"]
+
+
+def test_tokenLimitKeepsLastTurn():
+    history = ChatHistory("система", maxTokens=5)
+    history.append("короткая")
+    history.append("очень длинная реплика, которая одна превышает лимит токенов истории")
+    assert len(history) == 1
+    assert history.turns[0]["text"].startswith("очень длинная")
+
+
+def test_managerEvictsLeastRecentlyUsed():
+    manager = ChatSessionManager("система", maxSessions=2, idleTtl=None)
+    steve = manager.get("Steve")
+    manager.get("Alex")
+    assert manager.get("Steve") is steve
+    manager.get("Notch")
+    assert list(manager.sessions) == ["Steve", "Notch"]
+
+
+def test_managerEvictsIdleSessions():
+    manager = ChatSessionManager("система", idleTtl=60)
+    manager.get("Steve")
+    manager.get("Alex")
+    manager.sessions["Steve"].lastUsed -= 120
+    assert manager.evictIdle() == 1
+    assert list(manager.sessions) == ["Alex"]
+
+
+def test_playersHaveSeparateHistories():
+    manager = ChatSessionManager("система")
+    manager.get("Steve").append("привет от Стива")
+    assert len(manager.get("Alex")) == 0
+    assert manager.memoryReport()["Steve"]["messages"] == 1
@@ -0,0 +1,98 @@
+"""Хранилища историй переписки `ai.historyStore`"""
+import pytest
+
+from ai.history import ChatSessionManager
+from ai.historyStore import HistoryStore, WriteBehindStore, createHistoryStore
+
+
+def test_incompleteStoreFailsAtConstruction():
+    class LoadOnlyStore(HistoryStore):
+        def load(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        LoadOnlyStore() # type: ignore
+
+
+RECORD = {"summary": None, "turns": [{"role": "user", "text": "привет"}], "updated": 0}
+
+
+@pytest.mark.parametrize("kind", ["file", "sqlite", "tinydb"])
+def test_storeRoundTrip(tmp_path, kind):
+    store = createHistoryStore(kind, str(tmp_path / "history"), flushInterval=None)
+    try:
+        store.save("Steve", RECORD)
+        assert store.load("Steve") == RECORD
+        assert store.load("Alex") is None
+        store.delete("Steve")
+        assert store.load("Steve") is None
+    finally:
+        store.close()
+
+
+class CountingStore(HistoryStore):
+    """Хранилище в памяти, которое считает пачки записи и может отказывать"""
+    def __init__(self) -> None:
+        self.records: dict = {}
+        self.batches: list[int] = []
+        self.failing = False
+
+    def load(self, key):
+        return self.records.get(key)
+
+    def saveMany(self, records):
+        if self.failing:
+            raise OSError("disk full")
+        self.batches.append(len(records))
+        self.records.update(records)
+
+    def delete(self, key):
+        self.records.pop(key, None)
+
+
+def test_writeBehindCoalescesChanges():
+    inner = CountingStore()
+    store = WriteBehindStore(inner, flushInterval=60)
+    try:
+        for i in range(5):
+            store.save("Steve", {**RECORD, "updated": i})
+        store.save("Alex", RECORD)
+        # до сброса запись читается из очереди, а не из хранилища
+        assert store.load("Steve")["updated"] == 4 # type: ignore
+        assert inner.records == {}
+        store.flush()
+        assert inner.batches == [2]
+        assert inner.records["Steve"]["updated"] == 4
+    finally:
+        store.close()
+
+
+def test_writeBehindRequeuesFailedFlush():
+    inner = CountingStore()
+    store = WriteBehindStore(inner, flushInterval=60)
+    try:
+        inner.failing = True
+        store.save("Steve", RECORD)
+        store.flush()
+        assert store.pending == 1
+        inner.failing = False
+        store.flush()
+        assert store.pending == 0
+        assert inner.records["Steve"] == RECORD
+    finally:
+        store.close()
+
+
+def test_managerRestoresHistoryAfterRestart(tmp_path):
+    path = str(tmp_path / "history.sqlite")
+    manager = ChatSessionManager("система", store=createHistoryStore("sqlite", path))
+    manager.get("Steve").extend([("привет", "user"), ("Привет, Стив!", "assistant")])
+    manager.close()
+
+    restarted = ChatSessionManager("система", store=createHistoryStore("sqlite", path))
+    try:
+        assert [turn["text"] for turn in restarted.get("Steve").turns] == ["привет", "Привет, Стив!"]
+        restarted.forget("Steve")
+    finally:
+        restarted.close()
+    assert createHistoryStore("sqlite", path, flushInterval=None).load("Steve") is None
@@ -0,0 +1,84 @@
+"""Фоновое обновление IAM-токена `ai.utils.IAMTokenProvider`"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ai import utils
+from ai.utils import IAMTokenProvider
+
+
+def iamResponse(token: str, seconds: float) -> dict[str, str]:
+    expiresAt = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+    return {"iamToken": token, "expiresAt": expiresAt.strftime("%Y-%m-%dT%H:%M:%S.%f123Z")}
+
+
+@pytest.fixture
+def iam(tmp_path, monkeypatch):
+    """Поддельный IAM: выдает токены `t1`, `t2`, ... со сроком `lifetime` секунд и считает запросы"""
+    monkeypatch.chdir(tmp_path)
+
+    class FakeIam:
+        lifetime = 12 * 3600
+        delay = 0.0
+        calls = 0
+
+        def __call__(self, oauthToken: str, iamUrl: str = utils.IAM_TOKENS_URL) -> dict[str, str]:
+            time.sleep(self.delay)
+            self.calls += 1
+            return iamResponse(f"t{self.calls}", self.lifetime)
+
+    fake = FakeIam()
+    monkeypatch.setattr(utils, "requestIAMToken", fake)
+    return fake
+
+
+def test_validTokenIsServedFromMemory(iam):
+    provider = IAMTokenProvider("oauth")
+    assert provider.expired
+    assert provider.token == "t1"
+    assert not provider.expired
+    assert provider.token == "t1"
+    assert iam.calls == 1
+
+
+def test_concurrentRefreshesShareOneRequest(iam):
+    iam.delay = 0.1
+    provider = IAMTokenProvider("oauth")
+    barrier = threading.Barrier(8)
+    tokens: list[str] = []
+
+    def worker():
+        barrier.wait()
+        tokens.append(provider.token)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tokens == ["t1"] * 8
+    assert iam.calls == 1
+
+
+def test_tokenCacheSurvivesRestart(iam):
+    IAMTokenProvider("oauth").refresh()
+    restarted = IAMTokenProvider("oauth")
+    assert not restarted.expired
+    assert restarted.token == "t1"
+    assert iam.calls == 1
+
+
+def test_backgroundRefreshBeforeExpiry(iam):
+    # токен живет меньше `refreshMargin`, поэтому фоновый поток обновляет его сразу, не дожидаясь обращения
+    iam.lifetime = 60
+    provider = IAMTokenProvider("oauth", refreshMargin=3600, retryDelay=0.05).start()
+    try:
+        deadline = time.monotonic() + 2
+        while provider.refreshCount < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        provider.stop()
+    assert provider.refreshCount >= 2
+    assert provider.token == f"t{iam.calls}"
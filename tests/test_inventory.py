@@ -0,0 +1,41 @@
+"""Копия инвентаря `InventoryMirror` без моста Node"""
+import threading
+
+from utils.botUtils import InventoryMirror
+
+
+def createMirror(monkeypatch) -> InventoryMirror:
+    monkeypatch.setattr(InventoryMirror, "sync", lambda self: None)
+    return InventoryMirror(bot=None, subscribe=False)
+
+
+def test_containsByIdNameAndPart(monkeypatch):
+    mirror = createMirror(monkeypatch)
+    mirror.updateSlot(36, {"name": "iron_pickaxe", "type": 1, "count": 1, "category": "pickaxe"})
+    assert 1 in mirror
+    assert "iron_pickaxe" in mirror
+    assert "pickaxe" in mirror
+    assert "iron" in mirror
+    mirror.updateSlot(36, None)
+    assert "pickaxe" not in mirror
+
+
+def test_containsWhileSlotsChange(monkeypatch):
+    mirror = createMirror(monkeypatch)
+    stop = threading.Event()
+
+    def churn():
+        i = 0
+        while not stop.is_set():
+            mirror.updateSlot(i % 36, {"name": f"item_{i}", "type": i, "count": 1})
+            mirror.updateSlot((i + 18) % 36, None)
+            i += 1
+
+    thread = threading.Thread(target=churn)
+    thread.start()
+    try:
+        for _ in range(2000):
+            "missing" in mirror
+    finally:
+        stop.set()
+        thread.join()
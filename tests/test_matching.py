@@ -0,0 +1,72 @@
+"""Локальное распознавание команд: `CommandMatcher` и `IntentClassifier`"""
+import pytest
+
+from utils.botUtils import CommandMatcher, IntentClassifier
+
+
+def test_matcherTiers():
+    matcher = CommandMatcher(["стоп", "за мной"])
+    assert matcher.match("стоп") == ("стоп", "exact")
+    assert matcher.match("  За мной!!")[0] == "за мной"
+    assert matcher.match("сделай что-нибудь другое") == (None, None)
+
+
+def test_matcherFuzzyOnlyForLongCommands():
+    matcher = CommandMatcher(["стоп", "за мной"])
+    for text in ("стол", "сто", "стопка", "сто пять"):
+        assert matcher.match(text) == (None, None), text
+    assert matcher.match("за мнй") == ("за мной", "fuzzy")
+    # лишнее слово меняет смысл, нечеткое совпадение требует того же числа слов
+    assert matcher.match("за мной домой") == (None, None)
+
+
+def test_classifierParaphrase():
+    pytest.importorskip("numpy")
+    classifier = IntentClassifier({
+        "стоп": ["стой", "остановись", "хватит", "замри"],
+        "за мной": ["иди за мной", "следуй за мной", "пошли со мной", "ко мне"],
+    })
+    assert classifier.classify("следуй за мной пожалуйста")[0] == "за мной"
+    assert classifier.classify("какая сегодня погода в городе")[0] is None
+
+
+def test_classifierDeduplicatesExamples():
+    pytest.importorskip("numpy")
+    classifier = IntentClassifier({"стоп": ["стой"], "за мной": ["стой"]})
+    # одна и та же фраза может быть примером разных команд, но для одной команды хранится один раз
+    assert classifier.add("стоп", ["Стой!", "стой", "замри"]) == 1
+    assert sorted(classifier.labels) == ["за мной", "за мной", "стоп", "стоп", "стоп"]
+
+
+def test_classifierLearnReportsOutcome():
+    pytest.importorskip("numpy")
+    classifier = IntentClassifier({"стоп": ["стой"], "за мной": ["иди за мной"]}, maxExamples=3)
+    assert classifier.learn("прекрати это делать", "стоп") is True
+    assert classifier.learn("прекрати это делать", "стоп") is False
+    # у команды уже `maxExamples` примеров: фраза не добавляется
+    assert classifier.learn("тормози немедленно", "стоп") is False
+    assert classifier.labels.count("стоп") == 3
+
+
+def test_classifierRejectsNegationsAndPartialPhrases():
+    pytest.importorskip("numpy")
+    from utils.commands import BOT_COMMAND_EXAMPLES
+    # без отрицательных примеров отсекают только отрицание и покрытие слов
+    classifier = IntentClassifier(BOT_COMMAND_EXAMPLES)
+    for text in ("не ходи за мной", "пойдем в шахту", "мне", "иди", "стоп игра", "не останавливайся"):
+        assert classifier.classify(text)[0] is None, text
+    assert classifier.classify("следуй за мной пожалуйста")[0] == "за мной"
+    assert classifier.classify("остановись уже")[0] == "стоп"
+
+
+def test_classifierCalibratesOnHeldOutNegatives():
+    pytest.importorskip("numpy")
+    examples = {"стоп": ["стой", "замри"], "за мной": ["иди за мной", "следуй за мной"]}
+    negatives = ["привет", "стой за мной в очереди", "как дела", "следуй за мной завтра"]
+    classifier = IntentClassifier(examples, negatives=negatives, minCoverage=0.5)
+    assert classifier.labels.count(IntentClassifier.NO_COMMAND) == 2
+    # отложенная фраза `следуй за мной завтра` иначе распознавалась бы как `за мной`
+    assert classifier.threshold > 0.55
+    assert classifier.classify("следуй за мной завтра")[0] is None
+    assert classifier.classify("следуй за мной")[0] == "за мной"
+    assert IntentClassifier.NO_COMMAND not in classifier.scores("привет")
@@ -0,0 +1,89 @@
+"""Реестр метрик `utils.metrics`"""
+import json
+import threading
+
+from utils.metrics import MetricsRegistry
+
+
+def test_counterLabelsAreSeparateSeries():
+    registry = MetricsRegistry()
+    requests = registry.counter("ai_requests_total", "Запросы")
+    requests.inc(status=200)
+    requests.inc(2, status=200)
+    requests.inc(status=429)
+    assert requests.value(status=200) == 3
+    assert requests.value(status=429) == 1
+    assert requests.value(status=500) == 0
+    assert registry.counter("ai_requests_total") is requests
+
+
+def test_concurrentIncrementsAreNotLost():
+    registry = MetricsRegistry()
+    counter = registry.counter("events_total")
+
+    def worker():
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value() == 8000
+
+
+def test_histogramRendersCumulativeBuckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("compare_seconds", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, tier="ai")
+    text = registry.render()
+    assert '# TYPE compare_seconds histogram' in text
+    assert 'compare_seconds_bucket{tier="ai",le="0.1"} 1' in text
+    assert 'compare_seconds_bucket{tier="ai",le="1.0"} 3' in text
+    assert 'compare_seconds_bucket{tier="ai",le="+Inf"} 4' in text
+    assert 'compare_seconds_count{tier="ai"} 4' in text
+    assert registry.snapshot()["metrics"]["compare_seconds"]['{tier="ai"}']["max"] == 3.0
+
+
+def test_histogramTimer():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("handler_seconds")
+
+    @histogram.timed(handler="whisper")
+    def handler():
+        return "ok"
+
+    assert handler() == "ok"
+    with histogram.time(handler="chat"):
+        pass
+    snapshot = histogram.snapshot()
+    assert snapshot['{handler="whisper"}']["count"] == 1
+    assert snapshot['{handler="chat"}']["count"] == 1
+
+
+def test_gaugeReadsCurrentValue():
+    registry = MetricsRegistry()
+    depth = [3]
+    registry.gauge("outbox_depth", lambda: depth[0])
+    depth[0] = 5
+    assert "outbox_depth 5.0" in registry.render()
+    # повторная регистрация (например, после переподключения бота) заменяет функцию, а сломанная функция не роняет сбор
+    registry.gauge("outbox_depth", lambda: 1 / 0)
+    assert registry.render().splitlines() == ["# TYPE outbox_depth gauge"]
+    assert registry.snapshot()["metrics"]["outbox_depth"] == {"": None}
+
+
+def test_labelValuesAreEscaped():
+    registry = MetricsRegistry()
+    registry.counter("errors_total").inc(error='bad "quote"\nline')
+    assert 'errors_total{error="bad \\"quote\\"\\nline"} 1' in registry.render()
+
+
+def test_dumpJson(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("events_total").inc()
+    path = tmp_path / "metrics.json"
+    registry.dumpJson(str(path))
+    assert json.loads(path.read_text(encoding="utf-8"))["metrics"]["events_total"] == {"": 1}
@@ -0,0 +1,35 @@
+"""Шаблоны и реестр промптов `ai.prompts`"""
+import threading
+
+from ai.prompts import CompiledPrompt, PromptRegistry
+
+
+def test_compiledPromptKeepsJsonBraces():
+    prompt = CompiledPrompt('Команды: {commands}. Ответ: { "result": null }, {missing}')
+    assert prompt.render(commands="[стоп]") == 'Команды: [стоп]. Ответ: { "result": null }, {missing}'
+
+
+def test_registryIsSharedBetweenThreads():
+    registry = PromptRegistry(maxSize=8)
+    barrier = threading.Barrier(8)
+    messages: list[dict] = []
+    errors: list[Exception] = []
+
+    def worker(i: int):
+        barrier.wait()
+        try:
+            for n in range(200):
+                # общий ключ и вытеснение старых записей другими ключами одновременно
+                messages.append(registry.systemMessage("Команды: {commands}", commands="[стоп]"))
+                registry.systemMessage("Поток {i}: {n}", i=str(i), n=str(n))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(registry._messages) <= registry.maxSize
+    assert all(message["text"] == "Команды: [стоп]" for message in messages)
@@ -0,0 +1,91 @@
+"""Планировщик запросов: `TokenBucket` и `RequestScheduler`"""
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+from ai.scheduler import DeadlineExceeded, RequestScheduler, TokenBucket
+
+
+def test_bucketBurstThenWait():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert 0 < bucket.take() <= 0.1
+
+
+def test_retriesUntilSuccess():
+    scheduler = RequestScheduler(baseDelay=0, maxRetries=4)
+    statuses = iter([429, 500, 200])
+    assert scheduler.run(lambda: next(statuses), lambda status: status) == 200
+    assert scheduler.stats["retries"] == 2
+
+
+def test_returnsLastResultAfterMaxRetries():
+    scheduler = RequestScheduler(baseDelay=0, maxRetries=2)
+    assert scheduler.run(lambda: 503, lambda status: status) == 503
+    assert scheduler.stats["retries"] == 2
+
+
+def test_clientErrorIsNotRetried():
+    scheduler = RequestScheduler(baseDelay=0)
+    assert scheduler.run(lambda: 400, lambda status: status) == 400
+    assert scheduler.stats["retries"] == 0
+
+
+def test_networkErrorIsRetried():
+    scheduler = RequestScheduler(baseDelay=0)
+    calls = []
+
+    def send():
+        calls.append(1)
+        if len(calls) < 2:
+            raise ConnectionError("reset")
+        return 200
+    assert scheduler.run(send, lambda status: status) == 200
+
+
+def test_deadlineWhileQueued():
+    scheduler = RequestScheduler(rate=0.01, burst=1)
+    scheduler.acquire()
+    with pytest.raises(DeadlineExceeded):
+        scheduler.acquire(deadlineAt=scheduler.deadlineAt(0.05))
+    assert scheduler.stats["expired"] == 1
+    assert scheduler._waiting == []
+
+
+def test_runAsync():
+    scheduler = RequestScheduler(baseDelay=0)
+    statuses = iter([429, 200])
+
+    async def send():
+        return next(statuses)
+    assert asyncio.run(scheduler.runAsync(send, lambda status: status)) == 200
+
+
+def test_aiohttpErrorsAreRetried():
+    scheduler = RequestScheduler(baseDelay=0)
+    errors = iter([aiohttp.ServerDisconnectedError(), asyncio.TimeoutError()])
+
+    async def send():
+        error = next(errors, None)
+        if error is not None:
+            raise error
+        return 200
+    assert asyncio.run(scheduler.runAsync(send, lambda status: status)) == 200
+    assert scheduler.stats["retries"] == 2
+
+
+def test_timeoutIsNotRetriedPastDeadline():
+    scheduler = RequestScheduler(baseDelay=0)
+    calls = []
+
+    def send():
+        calls.append(1)
+        time.sleep(0.06)
+        raise asyncio.TimeoutError()
+    with pytest.raises(asyncio.TimeoutError):
+        scheduler.run(send, lambda status: status, deadline=0.05)
+    assert len(calls) == 1
+    assert scheduler.stats["retries"] == 0
@@ -0,0 +1,77 @@
+"""Потоковые ответы: разбор строк `ai.streaming` и отправка в чат `ChatLineSink`"""
+import json
+
+import pytest
+
+from ai.streaming import ChatCompletionDeltaParser, StreamDeltaParser, collectStream, iterStreamDeltas
+from utils.botUtils import MINECRAFT_CHAT_LIMIT, ChatLineSink
+
+
+def yandexLine(text: str, final: bool = False) -> str:
+    status = "ALTERNATIVE_STATUS_FINAL" if final else "ALTERNATIVE_STATUS_PARTIAL"
+    return json.dumps({"result": {"alternatives": [{"message": {"role": "assistant", "text": text}, "status": status}]}})
+
+
+def test_yandexDeltasFromAccumulatedText():
+    lines = [yandexLine("При"), "", yandexLine("Привет"), yandexLine("Привет, Стив!", final=True)]
+    assert list(iterStreamDeltas(lines)) == ["При", "вет", ", Стив!"]
+    parser = StreamDeltaParser()
+    for line in lines:
+        parser.feed(line.encode())
+    assert parser.finished
+    assert collectStream("\n".join(lines)) == "Привет, Стив!"
+
+
+def test_yandexStreamError():
+    with pytest.raises(RuntimeError):
+        StreamDeltaParser().feed(json.dumps({"error": {"message": "quota"}}))
+
+
+def test_chatCompletionEvents():
+    parser = ChatCompletionDeltaParser()
+    body = "\n".join([
+        ": keep-alive",
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+        'data: {"choices": [{"delta": {"content": "При"}}]}',
+        "",
+        'data: {"choices": [{"delta": {"content": "вет"}, "finish_reason": "stop"}]}',
+        "data: [DONE]",
+    ])
+    assert [parser.feed(line) for line in body.splitlines()] == ["", "", "При", "", "вет", ""]
+    assert parser.finished
+    assert collectStream(body, ChatCompletionDeltaParser()) == "Привет"
+
+
+def test_sinkSendsFinishedSentences():
+    lines: list[str] = []
+    sink = ChatLineSink(lines.append)
+    for delta in ["Привет", ", Стив! Я", " иду к тебе.", " Жди"]:
+        sink.feed(delta)
+    assert lines == ["Привет, Стив!", "Я иду к тебе."]
+    sink.flush()
+    assert lines[-1] == "Жди"
+    assert sink.sentLines == 3
+
+
+def test_sinkSplitsLongSentenceOnSpaces():
+    lines: list[str] = []
+    sink = ChatLineSink(lines.append, maxLength=20)
+    sink.feed("очень длинное предложение без точки до самого конца потока")
+    sink.flush()
+    assert all(len(line) <= 20 for line in lines)
+    assert " ".join(lines) == "очень длинное предложение без точки до самого конца потока"
+
+
+def test_whisperSinkLeavesRoomForCommand():
+    class FakeOutbox:
+        def __init__(self) -> None:
+            self.sent: list[tuple[str, str]] = []
+
+        def whisper(self, username: str, text: str):
+            self.sent.append((username, text))
+
+    outbox = FakeOutbox()
+    sink = ChatLineSink.forWhisper(outbox, "Steve")
+    assert sink.maxLength == MINECRAFT_CHAT_LIMIT - len("/tell Steve ")
+    sink.feed("Готово.")
+    assert outbox.sent == [("Steve", "Готово.")]
@@ -0,0 +1,63 @@
+"""Разбор ответов модели: `parseCommandResponse`, `parseBatchResponse` и `StreamingObjectParser`"""
+from ai.structured import StreamingObjectParser, parseBatchResponse, parseCommandResponse
+
+
+def test_plainJson():
+    response = parseCommandResponse('{"result": "стоп", "creative": "Стою!"}')
+    assert response.result == "стоп"
+    assert response.creative == "Стою!"
+
+
+def test_fencedJsonWithExplanation():
+    response = parseCommandResponse('Вот ответ:\n```json\n{"result": "за мной", "creative": "Иду"}\n```\nГотово')
+    assert response.result == "за мной"
+
+
+def test_nullAsString():
+    assert parseCommandResponse('{"result": "null", "creative": "Привет"}').result is None
+
+
+def test_truncatedObject():
+    response = parseCommandResponse('{"result": "стоп", "creative": "Уже остана')
+    assert response.result == "стоп"
+    assert response.creative == "Уже остана"
+
+
+def test_noJsonIsCreative():
+    response = parseCommandResponse("Просто болтаю")
+    assert response.result is None
+    assert response.creative == "Просто болтаю"
+
+
+def test_batchResponse():
+    responses = parseBatchResponse('[{"id": 1, "result": "стоп", "creative": null}, {"id": 2, "oops": true}, {"id": 3, "creative": "Привет"}]')
+    assert responses[1].result == "стоп"
+    assert 2 in responses and responses[2].result is None
+    assert responses[3].creative == "Привет"
+
+
+def test_batchSingleObject():
+    assert parseBatchResponse('{"id": 4, "result": "стоп"}')[4].result == "стоп"
+
+
+def test_streamingFieldsInOrder():
+    fields = []
+    parser = StreamingObjectParser(lambda key, value: fields.append((key, value)))
+    for char in 'Ответ: {"result": "стоп", "creative": "Стою \\"тут\\"", "n": 1}':
+        parser.feed(char)
+    assert fields == [("result", "стоп"), ("creative", 'Стою "тут"'), ("n", 1)]
+    assert parser.done
+
+
+def test_streamingPartial():
+    parser = StreamingObjectParser()
+    parser.feed('{"result": null, "creative": "Привет, как')
+    assert parser.fields == {"result": None}
+    assert parser.partial == ("creative", "Привет, как")
+
+
+def test_malformedEscapeInKey():
+    assert parseCommandResponse('{"res\\x": "a", "result": "стоп"}').result == "стоп"
+    parser = StreamingObjectParser()
+    parser.feed('{"res\\q": 1, "creative": "ок"}')
+    assert parser.fields == {"res\\q": 1, "creative": "ок"}
@@ -0,0 +1,77 @@
+"""HTTP-транспорт `ai.transport` на локальном сервере aiohttp"""
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from ai.transport import PooledTransport
+
+
+async def slowStream(request: web.Request) -> web.StreamResponse:
+    response = web.StreamResponse()
+    await response.prepare(request)
+    for i in range(5):
+        await response.write(f"line {i}\n".encode())
+        await asyncio.sleep(0.1)
+    await response.write_eof()
+    return response
+
+
+async def slowUnary(request: web.Request) -> web.Response:
+    await asyncio.sleep(0.5)
+    return web.json_response({"ok": True})
+
+
+async def collect(transport: PooledTransport, url: str) -> list[bytes]:
+    return [line async for line in transport.postStream(url, {}, {})]
+
+
+def serve(check):
+    async def main():
+        app = web.Application()
+        app.router.add_post("/stream", slowStream)
+        app.router.add_post("/unary", slowUnary)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1] # type: ignore
+        try:
+            await check(f"http://127.0.0.1:{port}")
+        finally:
+            await runner.cleanup()
+    asyncio.run(main())
+
+
+def test_streamOutlivesRequestTimeout():
+    async def check(base: str):
+        # поток идет ~0.5 с, дольше общего таймаута, но паузы между строками короче его
+        transport = PooledTransport(requestTimeout=0.3)
+        try:
+            lines = await collect(transport, f"{base}/stream")
+        finally:
+            await transport.close()
+        assert len(lines) == 5
+    serve(check)
+
+
+def test_streamStopsWhenSilent():
+    async def check(base: str):
+        transport = PooledTransport(requestTimeout=5, readTimeout=0.05)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await collect(transport, f"{base}/stream")
+        finally:
+            await transport.close()
+    serve(check)
+
+
+def test_unaryRequestKeepsTotalTimeout():
+    async def check(base: str):
+        transport = PooledTransport(requestTimeout=0.2)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await transport.post(f"{base}/unary", {}, {})
+        finally:
+            await transport.close()
+    serve(check)
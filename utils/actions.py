@@ -0,0 +1,376 @@
+"""Долгие действия бота и их исполнитель.
+
+Действие - объект с методами `start`, `tick` и `cancel`. `ActionExecutor` выполняет действия по одному в своем потоке:
+берет из очереди самое приоритетное, запускает, периодически вызывает `tick` и снимает по истечении времени. Более
+приоритетное действие вытесняет текущее, а `reset()` (и действие `StopAction`) отменяет текущее действие и очищает
+очередь сразу в вызывающем потоке, не дожидаясь следующего тика.
+"""
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable
+
+from utils.logs import getLogger
+
+
+log = getLogger(__name__)
+
+
+class ACTION_PRIORITIES:
+    """Приоритеты действий. Чем меньше число - тем раньше выполняется действие"""
+    STOP = 0
+    COMMAND = 10
+    BACKGROUND = 20
+
+
+class Action:
+    """Базовое действие бота. Наследники переопределяют `start`, `tick` и `cancel`"""
+    name: str = "action"
+    priority: int = ACTION_PRIORITIES.COMMAND
+    timeout: float | None = None
+    """Сколько секунд действие может выполняться. `None` - без ограничения"""
+    exclusive: bool = False
+    """Отправка такого действия отменяет текущее и очищает очередь"""
+    interruptible: bool = False
+    """Бесконечное действие (например, следование), которое уступает место любой новой команде с тем же или более высоким приоритетом"""
+
+    def __init__(self) -> None:
+        self.status: str = "pending"
+        """`pending`, `running`, `done`, `cancelled`, `timeout`, `failed` или `merged` (повтор уже выполняющегося действия)"""
+        self.submittedAt: float = time.monotonic()
+        self.startedAt: float | None = None
+        self.finishedAt: float | None = None
+        self.error: Exception | None = None
+
+    def start(self):
+        """Начать действие. Вызывается один раз в потоке исполнителя"""
+
+    def tick(self) -> bool:
+        """Продолжить действие
+
+        Returns:
+            bool: True, если действие завершено
+        """
+        return True
+
+    def cancel(self):
+        """Прервать действие и вернуть бота в спокойное состояние"""
+
+    def sameAs(self, other: "Action") -> bool:
+        """Повторяет ли `other` это выполняющееся действие. Такой повтор не вытесняет действие, а обновляет его через `refresh`
+
+        Args:
+            other (Action): Новое действие
+
+        Returns:
+            bool: True, если `other` - то же действие с теми же аргументами
+        """
+        return False
+
+    def refresh(self):
+        """Обновить выполняющееся действие по повторной команде (например, заново найти цель)"""
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.name!r} {self.status}>"
+
+
+class CallableAction(Action):
+    """Действие из обычной функции. Если функция вернула `Action`, дальше выполняется оно"""
+    def __init__(
+                    self,
+                    name: str,
+                    f: Callable,
+                    priority: int = ACTION_PRIORITIES.COMMAND,
+                    timeout: float | None = None,
+                    exclusive: bool = False,
+                    **context: Any
+                ) -> None:
+        """Действие из обычной функции
+
+        Args:
+            name (str): Название действия (обычно - команда игрока)
+            f (Callable): Функция. Вызывается с аргументами `context`
+            priority (int, optional): Приоритет. Defaults to ACTION_PRIORITIES.COMMAND.
+            timeout (float | None, optional): Ограничение по времени в секундах. Defaults to None.
+            exclusive (bool, optional): Отменить текущее действие и очистить очередь при отправке. Defaults to False.
+        """
+        super().__init__()
+        self.name = name
+        self.f = f
+        self.context = context
+        self.priority = priority
+        self.timeout = timeout
+        self.exclusive = exclusive
+        self.delegate: Action | None = None
+
+    def start(self):
+        result = self.f(**self.context)
+        if isinstance(result, Action):
+            self.delegate = result
+            self.interruptible = result.interruptible
+            if result.timeout is not None and self.timeout is None:
+                self.timeout = result.timeout
+            result.start()
+
+    def tick(self) -> bool:
+        return self.delegate.tick() if self.delegate is not None else True
+
+    def cancel(self):
+        if self.delegate is not None:
+            self.delegate.cancel()
+
+    def sameAs(self, other: Action) -> bool:
+        # повтор разовой команды выполняется заново, а повтор бесконечного действия (следования) только обновляет его
+        return isinstance(other, CallableAction) and self.delegate is not None and self.delegate.interruptible \
+            and other.name == self.name and other.f is self.f and other.context == self.context
+
+    def refresh(self):
+        if self.delegate is not None:
+            self.delegate.refresh()
+
+
+class StopAction(Action):
+    """Остановить бота: отменяет текущее действие, очищает очередь и сбрасывает цели и копание"""
+    name = "стоп"
+    priority = ACTION_PRIORITIES.STOP
+    exclusive = True
+
+    def __init__(self, botActions) -> None:
+        """Остановить бота
+
+        Args:
+            botActions (`utils.botUtils.BotActions`): Действия бота
+        """
+        super().__init__()
+        self.botActions = botActions
+
+    def start(self):
+        self.botActions.reset()
+
+
+class FollowAction(Action):
+    """Следовать за игроком, пока действие не отменят"""
+    name = "за мной"
+    interruptible = True
+
+    def __init__(self, botActions, username: str, distance: float = 1, timeout: float | None = None) -> None:
+        """Следовать за игроком
+
+        Args:
+            botActions (`utils.botUtils.BotActions`): Действия бота
+            username (str): Ник игрока
+            distance (float, optional): На каком расстоянии держаться от игрока. Defaults to 1.
+            timeout (float | None, optional): Ограничение по времени в секундах. Defaults to None.
+        """
+        super().__init__()
+        self.botActions = botActions
+        self.username = username
+        self.distance = distance
+        self.timeout = timeout
+
+    def start(self):
+        self.botActions.follow(self.username, self.distance)
+
+    def tick(self) -> bool:
+        return False
+
+    def cancel(self):
+        self.botActions.stopMoving()
+
+    def sameAs(self, other: Action) -> bool:
+        return isinstance(other, FollowAction) and other.username == self.username and other.distance == self.distance
+
+    def refresh(self):
+        # навигация не перестраивает путь, если игрок тот же; после его возрождения цель сменится на новую сущность
+        self.botActions.follow(self.username, self.distance)
+
+
+class ActionExecutor:
+    """Выполняет действия бота по одному в отдельном потоке с приоритетами, вытеснением и ограничением по времени"""
+    def __init__(self, botActions, tickInterval: float = 0.05) -> None:
+        """Исполнитель действий бота
+
+        Args:
+            botActions (`utils.botUtils.BotActions`): Действия бота. Используются для полного сброса в `reset()`
+            tickInterval (float, optional): Как часто вызывать `tick` у текущего действия, в секундах. Defaults to 0.05.
+        """
+        self.botActions = botActions
+        self.tickInterval = tickInterval
+        self.current: Action | None = None
+        self._queue: list[tuple[int, int, Action]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._cancelling = 0
+        """Сколько снятых действий еще выполняют `cancel`. Пока они не закончат, новое действие не запускается"""
+        self._stopEvent = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.stats: dict[str, int] = {"done": 0, "cancelled": 0, "timeout": 0, "failed": 0, "preempted": 0, "merged": 0}
+        self.lastStopLatency: float | None = None
+        """Сколько секунд прошло от отправки последнего исключительного действия с приоритетом `STOP` (`StopAction`,
+        команда "стоп") до остановки бота"""
+
+    def start(self) -> "ActionExecutor":
+        """Запустить поток исполнителя
+
+        Returns:
+            ActionExecutor: Этот же исполнитель
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stopEvent.clear()
+            self._thread = threading.Thread(target=self._run, name="actions", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановить поток исполнителя, отменив текущее действие"""
+        self._stopEvent.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._condition:
+            cancelled = self._detachCurrent("cancelled")
+        self._cancel(cancelled)
+
+    def submit(self, action: Action) -> Action:
+        """Поставить действие в очередь
+
+        Более приоритетное действие вытесняет текущее (оно отменяется), а исключительное (`exclusive`) еще и очищает очередь.
+        Бесконечное текущее действие (`interruptible`) уступает место и действию с тем же приоритетом, а повтор
+        самого текущего действия (`sameAs`) не отменяет его и не ставится в очередь: текущее действие только обновляется.
+
+        Args:
+            action (Action): Действие
+
+        Returns:
+            Action: То же действие, по его `status` можно следить за выполнением. Для повтора - текущее действие
+        """
+        with self._condition:
+            current = self.current
+            if not action.exclusive and current is not None and current.sameAs(action):
+                action.status = "merged"
+                self.stats["merged"] += 1
+                try:
+                    current.refresh()
+                except Exception as e:
+                    log.warning("action refresh failed", action=current.name, error=str(e))
+                return current
+            cancelled = None
+            if action.exclusive:
+                self._clearQueue()
+                cancelled = self._detachCurrent("cancelled")
+            elif self.current is not None and (
+                action.priority < self.current.priority
+                or (self.current.interruptible and action.priority <= self.current.priority)
+            ):
+                self.stats["preempted"] += 1
+                cancelled = self._detachCurrent("cancelled")
+            heapq.heappush(self._queue, (action.priority, next(self._counter), action))
+            self._condition.notify_all()
+        self._cancel(cancelled)
+        return action
+
+    def reset(self):
+        """Отменить текущее действие, очистить очередь и сбросить бота. Выполняется сразу в вызывающем потоке"""
+        with self._condition:
+            self._clearQueue()
+            cancelled = self._detachCurrent("cancelled")
+        self._cancel(cancelled)
+        self.botActions.reset()
+
+    @property
+    def pending(self) -> list[Action]:
+        """Действия в очереди в порядке выполнения"""
+        with self._condition:
+            return [action for _, _, action in sorted(self._queue)]
+
+    def _clearQueue(self):
+        for _, _, action in self._queue:
+            action.status = "cancelled"
+            self.stats["cancelled"] += 1
+        self._queue.clear()
+
+    def _detachCurrent(self, status: str) -> Action | None:
+        # вызывается под `_condition`: действие снимается сразу, а его `cancel` (вызов моста) выполняет `_cancel`
+        # уже без блокировки, как `NavigationService._setGoal`
+        action = self.current
+        if action is None:
+            return None
+        self.current = None
+        self._finish(action, status)
+        self._cancelling += 1
+        return action
+
+    def _cancel(self, action: Action | None):
+        if action is None:
+            return
+        try:
+            action.cancel()
+        except Exception as e:
+            log.warning("action cancel failed", action=action.name, error=str(e))
+        finally:
+            with self._condition:
+                self._cancelling -= 1
+                self._condition.notify_all()
+
+    def _finish(self, action: Action, status: str):
+        action.status = status
+        action.finishedAt = time.monotonic()
+        self.stats[status] += 1
+        # "стоп" из таблицы команд - это `CallableAction`, поэтому учитывается любое исключительное действие приоритета STOP
+        if status == "done" and action.exclusive and action.priority <= ACTION_PRIORITIES.STOP:
+            self.lastStopLatency = action.finishedAt - action.submittedAt
+
+    def _run(self):
+        while not self._stopEvent.is_set():
+            with self._condition:
+                # пока снятое действие отменяется, новое не запускается, иначе отмена сбросила бы его цель
+                if self.current is None and self._queue and not self._cancelling:
+                    _, _, self.current = heapq.heappop(self._queue)
+                    self.current.status = "running"
+                    self.current.startedAt = time.monotonic()
+                    starting = True
+                else:
+                    starting = False
+                action = self.current
+                if action is None:
+                    self._condition.wait(self.tickInterval)
+                    continue
+
+            try:
+                if starting:
+                    action.start()
+                finished = action.tick()
+            except Exception as e:
+                action.error = e
+                log.error("action failed", action=action.name, error=str(e))
+                with self._condition:
+                    if self.current is action:
+                        self.current = None
+                        self._finish(action, "failed")
+                continue
+
+            timedOut = None
+            with self._condition:
+                # пока действие выполнялось, его могли вытеснить или отменить
+                if self.current is action:
+                    if finished:
+                        self.current = None
+                        self._finish(action, "done")
+                        continue
+                    if action.timeout is not None and time.monotonic() - action.startedAt > action.timeout: # type: ignore
+                        timedOut = self._detachCurrent("timeout")
+                    else:
+                        self._condition.wait(self.tickInterval)
+                        continue
+
+            if timedOut is not None:
+                self._cancel(timedOut)
+            elif starting:
+                # отмена могла прийти до конца `start`, тогда цель, выставленная в `start`, сбрасывается еще раз
+                try:
+                    action.cancel()
+                except Exception as e:
+                    log.warning("action cancel failed", action=action.name, error=str(e))
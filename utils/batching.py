@@ -0,0 +1,122 @@
+"""Микропакеты: объединение одновременных запросов в один вызов.
+
+Запросы, пришедшие в течение короткого окна, собираются в пакет и передаются обработчику одним списком,
+а его ответы раздаются вызывающим через `Future`. Окно открывается первым запросом пакета, поэтому одиночный
+запрос ждет не дольше `window` секунд, а пакет уходит сразу, как только набрал `maxSize` запросов.
+
+    batcher = MicroBatcher(lambda texts: [t.upper() for t in texts], window=0.05)
+    batcher.submit("стоп").result()
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from utils.logs import getLogger
+from utils.metrics import REGISTRY
+
+
+log = getLogger(__name__)
+
+BATCH_SIZE = REGISTRY.histogram("batch_size", "Размер отправленных микропакетов", buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32))
+
+
+class MicroBatcher:
+    """Собирает запросы в пакеты по времени и размеру и обрабатывает каждый пакет одним вызовом `handler`"""
+    def __init__(
+                    self,
+                    handler: Callable[[list[Any]], list[Any]],
+                    window: float = 0.05,
+                    maxSize: int = 8,
+                    workers: int = 8,
+                    name: str = "batch",
+                ) -> None:
+        """Сборщик микропакетов
+
+        Args:
+            handler (Callable[[list[Any]], list[Any]]): Обрабатывает пакет и возвращает ответы в том же порядке
+            window (float, optional): Сколько секунд собирать пакет после первого запроса. Defaults to 0.05.
+            maxSize (int, optional): Максимальный размер пакета. Defaults to 8.
+            workers (int, optional): Сколько пакетов может обрабатываться одновременно. Defaults to 8.
+            name (str, optional): Имя пакетов в метриках и префикс имени потоков. Defaults to "batch".
+        """
+        self.handler = handler
+        self.window = window
+        self.maxSize = maxSize
+        self.name = name
+
+        self._items: list[tuple[Any, Future]] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+        self.stats: dict[str, int] = {"batches": 0, "items": 0, "maxBatch": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._run, name=f"{name}-collector", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Добавить запрос в текущий пакет
+
+        Args:
+            item (Any): Запрос
+
+        Returns:
+            Future: Ответ обработчика на этот запрос
+        """
+        future: Future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Сборщик пакетов остановлен")
+            self._items.append((item, future))
+            # сборщик просыпается на первый запрос (открыть окно) и на заполненный пакет (отправить сразу)
+            if len(self._items) == 1 or len(self._items) >= self.maxSize:
+                self._condition.notify()
+        return future
+
+    @property
+    def pending(self) -> int:
+        """Сколько запросов ждут отправки"""
+        with self._condition:
+            return len(self._items)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._items and not self._closed:
+                    self._condition.wait()
+                if not self._items:
+                    return
+                deadline = time.monotonic() + self.window
+                while len(self._items) < self.maxSize and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch, self._items = self._items[:self.maxSize], self._items[self.maxSize:]
+            self._pool.submit(self._process, batch)
+
+    def _process(self, batch: list[tuple[Any, Future]]):
+        self.stats["batches"] += 1
+        self.stats["items"] += len(batch)
+        self.stats["maxBatch"] = max(self.stats["maxBatch"], len(batch))
+        BATCH_SIZE.observe(len(batch), batch=self.name)
+        try:
+            results = self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Обработчик вернул {len(results)} ответов на пакет из {len(batch)} запросов")
+        except Exception as e:
+            self.stats["failed"] += 1
+            log.warning("batch failed", batch=self.name, size=len(batch), error=str(e))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self):
+        """Отправить оставшиеся запросы и остановить сборщик"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout=5)
+        self._pool.shutdown(wait=True)
@@ -2,19 +2,34 @@
 """
 import difflib
 import json
-from typing import Callable
-from uu import Error
-
-from click import command
+import re
+import threading
+import time
+import zlib
+from typing import TYPE_CHECKING, Any, Callable
 
 from ai import prompts
+from ai.breaker import CircuitOpenError
+from ai.cache import ResponseCache
+from ai.scheduler import PRIORITIES
+from ai.structured import CommandResponse, StreamingObjectParser, parseBatchResponse, parseCommandResponse
 from ai.utils import createMessageBody
+from utils.actions import ACTION_PRIORITIES, ActionExecutor, CallableAction
+from utils.batching import MicroBatcher
+from utils.logs import getLogger
+from utils.metrics import REGISTRY
 
-try:
+if TYPE_CHECKING:
+    # клиент YandexGPT тянет за собой requests; компаратору он нужен только для аннотаций
     import ai.session
-    import ai.utils
-except ModuleNotFoundError:
-    pass
+
+
+log = getLogger(__name__)
+
+COMMANDS = REGISTRY.counter("commands_total", "Распознанные команды по уровню сравнения")
+COMPARE_SECONDS = REGISTRY.histogram("compare_seconds", "Время сравнения команды игрока")
+INVENTORY_LOOKUPS = REGISTRY.counter("inventory_lookups_total", "Проверки инвентаря по копии в Python")
+INVENTORY_SYNC_SECONDS = REGISTRY.histogram("inventory_sync_seconds", "Время получения инвентаря из Node")
 
 
 def findByBestItem(slots: list[dict], fieldByMax: str, fieldByName: str = "") -> dict:
@@ -28,116 +43,1229 @@ def findByBestItem(slots: list[dict], fieldByMax: str, fieldByName: str = "") ->
     """
     item: dict = {f"{fieldByMax}": -1}
     for slot in slots:
-        if slot and slot[fieldByMax] and (slot[fieldByMax] > item[fieldByMax] and (fieldByName.lower() in slot["name"].lower())):
+        if slot and slot.get(fieldByMax) and (slot[fieldByMax] > item[fieldByMax] and (fieldByName.lower() in slot["name"].lower())):
             item = slot
     return item
 
 
 
+_RU_ENDINGS = sorted([
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими", "ать", "ять", "ить", "еть", "уть",
+    "ешь", "ишь", "ете", "ите", "ай", "яй", "ей", "ой", "ый", "ий", "ая", "яя", "ое", "ее",
+    "ые", "ие", "ую", "юю", "ам", "ям", "ах", "ях", "ом", "ем", "ов", "ев", "и", "ы", "а",
+    "я", "о", "е", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+
+
+def stemWord(word: str) -> str:
+    """Отрезать у русского слова самое длинное типичное окончание. Это не полноценный стеммер, а дешевая
+    нормализация, которой достаточно для коротких игровых команд (`иди`/`иду`, `стой`/`стоять`).
+
+    Args:
+        word (str): Слово в нижнем регистре
+
+    Returns:
+        str: Основа слова
+    """
+    for ending in _RU_ENDINGS:
+        if len(word) - len(ending) >= 3 and word.endswith(ending):
+            return word[:-len(ending)]
+    return word
+
+
+def normalizeCommand(text: str, stem: bool = False) -> str:
+    """Привести команду игрока к каноническому виду: нижний регистр, `ё` -> `е`, без пунктуации и лишних пробелов.
+
+    Args:
+        text (str): Сообщение игрока
+        stem (bool, optional): Дополнительно отрезать окончания слов. Defaults to False.
+
+    Returns:
+        str: Нормализованная команда
+    """
+    words = re.sub(r"[^\w\s]|_", " ", text.lower().replace("ё", "е")).split()
+    if stem:
+        words = [stemWord(w) for w in words]
+    return " ".join(words)
+
+
+_NEGATIONS = {"не", "ни", "нет", "нельзя", "никуда", "никогда"}
+"""Слова отрицания: с ними сообщение значит обратное примеру команды"""
+
+_FILLER_WORDS = {stemWord(w) for w in ("пожалуйста", "плиз", "давай", "ну", "же", "уже", "эй", "быстрее", "быстро", "скорее")}
+"""Слова, которые не меняют смысла команды и не учитываются при сравнении слов сообщения и примера"""
+
+
+class CommandMatcher:
+    """Локальное сопоставление команды игрока с известными командами без обращения к нейросети.
+
+    Уровни проверяются по порядку, от самого дешевого к самому дорогому:
+    - `exact` - точное совпадение в нижнем регистре;
+    - `normalized` - совпадение после нормализации и отрезания окончаний;
+    - `fuzzy` - ближайшая команда по индексу триграмм и `difflib`, если уверенность не ниже `cutoff`.
+
+    Нечеткое совпадение проверяется только для команд длиной от `minFuzzyLength` букв и только при том же числе слов:
+    у коротких команд одна замененная буква дает другое слово (`стоп` и `стол`), а лишнее слово - другой смысл (`сто пять`).
+    """
+    def __init__(self, commands: list[str] = [], cutoff: float = 0.72, minFuzzyLength: int = 5) -> None:
+        """Локальное сопоставление команды игрока с известными командами
+
+        Args:
+            commands (list[str], optional): Список известных команд. Defaults to [].
+            cutoff (float, optional): Минимальная уверенность (от 0 до 1) для нечеткого совпадения. Defaults to 0.72.
+            minFuzzyLength (int, optional): Сколько букв (без пробелов) должно быть в нормализованной команде, чтобы искать ее нечетко. Defaults to 5.
+        """
+        self.cutoff = cutoff
+        self.minFuzzyLength = minFuzzyLength
+        self.commands: set[str] = set()
+        self.normalized: dict[str, str] = {}
+        """Нормализованная форма (с отрезанными окончаниями) -> команда"""
+        self.trigrams: dict[str, set[str]] = {}
+        """Триграмма -> нормализованные формы, в которых она встречается"""
+        for command in commands:
+            self.add(command)
+
+    @staticmethod
+    def _trigrams(text: str) -> set[str]:
+        padded = f" {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, command: str):
+        """Добавить команду в индекс
+
+        Args:
+            command (str): Команда в нижнем регистре
+        """
+        self.commands.add(command)
+        key = normalizeCommand(command, stem=True)
+        self.normalized.setdefault(key, command)
+        for gram in self._trigrams(key):
+            self.trigrams.setdefault(gram, set()).add(key)
+
+    def match(self, text: str, cutoff: float | None = None) -> tuple[str | None, str | None]:
+        """Найти команду, соответствующую сообщению игрока
+
+        Args:
+            text (str): Сообщение игрока в нижнем регистре
+            cutoff (float | None, optional): Порог нечеткого совпадения вместо `self.cutoff`. Defaults to None.
+
+        Returns:
+            tuple[str | None, str | None]: Найденная команда и уровень, на котором она найдена. `(None, None)`, если уверенного совпадения нет
+        """
+        if text in self.commands:
+            return text, "exact"
+
+        key = normalizeCommand(text, stem=True)
+        if key in self.normalized:
+            return self.normalized[key], "normalized"
+
+        candidates: set[str] = set()
+        for gram in self._trigrams(key):
+            candidates |= self.trigrams.get(gram, set())
+
+        best, bestScore = None, self.cutoff if cutoff is None else cutoff
+        words = len(key.split())
+        for candidate in candidates:
+            if len(candidate.replace(" ", "")) < self.minFuzzyLength or len(candidate.split()) != words:
+                continue
+            score = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if score >= bestScore:
+                best, bestScore = candidate, score
+        if best is not None:
+            return self.normalized[best], "fuzzy"
+        return None, None
+
+
+class IntentClassifier:
+    """Распознавание команды по банку примеров фраз без нейросети (только CPU и NumPy).
+
+    Фразы превращаются в векторы TF-IDF по символьным n-граммам, которые хешируются в `dim` признаков, поэтому
+    словарь не нужен и новые фразы не требуют перестройки признаков. Сравнение - одно умножение матрицы примеров
+    на вектор фразы; команда считается найденной, если лучшее косинусное сходство не ниже `threshold`, а отрыв
+    от ближайшей другой команды не меньше `margin`.
+
+    Похожие n-граммы еще не означают ту же команду (`не ходи за мной`, `пойдем в шахту`), поэтому найденная команда
+    дополнительно проверяется по ближайшим примерам: слова сообщения и одного из них должны покрывать друг друга хотя бы
+    на `minCoverage`, а отрицание в сообщении допускается, только если оно есть и в примере. Фразы `negatives`
+    (не команды) образуют отдельный класс `NO_COMMAND`: половина из них - его примеры, а по другой половине при
+    создании поднимается порог, чтобы ни одна из них не распознавалась как команда.
+    """
+    NO_COMMAND = "__none__"
+    """Класс фраз, которые не являются командой"""
+    def __init__(
+                    self,
+                    examples: dict[str, list[str]] | None = None,
+                    threshold: float = 0.55,
+                    margin: float = 0.05,
+                    dim: int = 4096,
+                    ngrams: tuple[int, ...] = (2, 3, 4),
+                    maxExamples: int = 64,
+                    negatives: list[str] | None = None,
+                    minCoverage: float = 0.6,
+                    maxThreshold: float = 0.9,
+                ) -> None:
+        """Классификатор команд по примерам фраз
+
+        Args:
+            examples (dict[str, list[str]] | None, optional): Команда -> примеры фраз. Defaults to None.
+            threshold (float, optional): Минимальное сходство (от 0 до 1) для уверенного ответа. Defaults to 0.55.
+            margin (float, optional): Минимальный отрыв лучшей команды от ближайшей другой. Defaults to 0.05.
+            dim (int, optional): Сколько признаков в векторе фразы. Defaults to 4096.
+            ngrams (tuple[int, ...], optional): Длины символьных n-грамм. Defaults to (2, 3, 4).
+            maxExamples (int, optional): Сколько примеров хранить на одну команду. Defaults to 64.
+            negatives (list[str] | None, optional): Фразы, которые не являются ни одной командой. Defaults to None.
+            minCoverage (float, optional): Какая доля слов сообщения и ближайшего примера должна совпадать. Defaults to 0.6.
+            maxThreshold (float, optional): Выше какого значения калибровка не поднимает порог. Defaults to 0.9.
+        """
+        import numpy as np
+
+        self.threshold = threshold
+        self.minCoverage = minCoverage
+        self.maxThreshold = maxThreshold
+        self.margin = margin
+        self.dim = dim
+        self.ngrams = ngrams
+        self.maxExamples = maxExamples
+
+        self.labels: list[str] = []
+        """Команда для каждой строки матрицы примеров"""
+        self.phrases: list[str] = []
+        """Нормализованная фраза для каждой строки матрицы примеров"""
+        self._known: set[tuple[str, str]] = set()
+        """Пары (команда, нормализованная фраза), уже добавленные в примеры"""
+        self._counts: dict[str, int] = {}
+        """Сколько примеров у каждой команды"""
+        self._tf = np.zeros((0, dim), dtype=np.float32)
+        """Частоты n-грамм примеров без весов IDF"""
+        self._df = np.zeros(dim, dtype=np.float32)
+        """В скольких примерах встречается каждый признак"""
+        self._idf = np.ones(dim, dtype=np.float32)
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        """Нормированные векторы TF-IDF примеров"""
+        self._labelIds = np.zeros(0, dtype=np.int32)
+        self._commands: list[str] = []
+        self._lock = threading.Lock()
+
+        for command, phrases in (examples or {}).items():
+            self.add(command, phrases)
+        if negatives:
+            self._add(self.NO_COMMAND, negatives[::2])
+            self.calibrate(negatives=negatives[1::2])
+
+    def _vector(self, text: str):
+        import numpy as np
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = f" {text} "
+        for n in self.ngrams:
+            for i in range(len(padded) - n + 1):
+                # crc32 в отличие от hash() одинаков во всех процессах, поэтому признаки воспроизводимы
+                vector[zlib.crc32(padded[i:i + n].encode()) % self.dim] += 1
+        # сублинейная частота: повтор n-граммы в длинной фразе весит меньше, чем новая n-грамма
+        np.log1p(vector, out=vector)
+        return vector
+
+    def _reweight(self):
+        import numpy as np
+
+        count = len(self.labels)
+        self._idf = (np.log((1 + count) / (1 + self._df)) + 1).astype(np.float32)
+        matrix = self._tf * self._idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._matrix = matrix / np.maximum(norms, 1e-9)
+
+    def add(self, command: str, phrases: list[str] | None = None) -> int:
+        """Добавить команду и ее примеры. Веса пересчитываются сразу, без обучения с нуля
+
+        Args:
+            command (str): Команда в нижнем регистре
+            phrases (list[str] | None, optional): Примеры фраз. Сама команда добавляется как пример всегда. Defaults to None.
+
+        Returns:
+            int: Сколько новых примеров добавлено (повторы и примеры сверх `maxExamples` пропускаются)
+        """
+        return len(self._add(command, [command, *(phrases or [])]))
+
+    def _add(self, command: str, phrases: list[str]) -> list[str]:
+        import numpy as np
+
+        with self._lock:
+            if command not in self._commands:
+                self._commands.append(command)
+            labelId = self._commands.index(command)
+
+            rows, added = [], []
+            for phrase in phrases:
+                key = normalizeCommand(phrase)
+                if not key or (command, key) in self._known:
+                    continue
+                if self._counts.get(command, 0) >= self.maxExamples:
+                    break
+                rows.append(self._vector(key))
+                added.append(key)
+                self._known.add((command, key))
+                self._counts[command] = self._counts.get(command, 0) + 1
+                self.phrases.append(key)
+                self.labels.append(command)
+            if not rows:
+                return added
+
+            tf = np.vstack(rows)
+            self._tf = np.vstack([self._tf, tf])
+            self._df += (tf > 0).sum(axis=0)
+            self._labelIds = np.append(self._labelIds, np.full(len(rows), labelId, dtype=np.int32))
+            self._reweight()
+            return added
+
+    def learn(self, text: str, command: str) -> bool:
+        """Запомнить фразу как пример команды (например, по решению нейросети), если классификатор еще не уверен в ней
+
+        Args:
+            text (str): Сообщение игрока
+            command (str): Команда, которой оно соответствует
+
+        Returns:
+            bool: True, если фраза добавлена в примеры. False, если классификатор уже уверен в ней,
+                она уже есть среди примеров команды или у команды уже `maxExamples` примеров
+        """
+        matched, _ = self.classify(text)
+        if matched == command:
+            return False
+        return normalizeCommand(text) in self._add(command, [command, text])
+
+    def scores(self, text: str) -> dict[str, float]:
+        """Лучшее сходство фразы с примерами каждой команды
+
+        Args:
+            text (str): Сообщение игрока
+
+        Returns:
+            dict[str, float]: Команда -> сходство от 0 до 1
+        """
+        import numpy as np
+
+        with self._lock:
+            if not self.labels:
+                return {}
+            vector = self._vector(normalizeCommand(text)) * self._idf
+            norm = np.linalg.norm(vector)
+            similarities = self._matrix @ (vector / norm) if norm > 0 else np.zeros(len(self.labels), dtype=np.float32)
+            best = np.full(len(self._commands), -1.0, dtype=np.float32)
+            np.maximum.at(best, self._labelIds, similarities)
+            return {command: float(best[i]) for i, command in enumerate(self._commands) if best[i] >= 0 and command != self.NO_COMMAND}
+
+    def _nearest(self, text: str, examples: int = 3) -> list[tuple[str, float, list[str]]]:
+        """Для каждой команды (и `NO_COMMAND`) лучшее сходство и `examples` ближайших примеров, по убыванию сходства"""
+        import numpy as np
+
+        with self._lock:
+            if not self.labels:
+                return []
+            vector = self._vector(normalizeCommand(text)) * self._idf
+            norm = np.linalg.norm(vector)
+            if norm == 0:
+                return []
+            similarities = self._matrix @ (vector / norm)
+            nearest = []
+            for i, command in enumerate(self._commands):
+                rows = np.flatnonzero(self._labelIds == i)
+                if len(rows):
+                    closest = rows[np.argsort(-similarities[rows])[:examples]]
+                    nearest.append((command, float(similarities[closest[0]]), [self.phrases[row] for row in closest]))
+        return sorted(nearest, key=lambda item: item[1], reverse=True)
+
+    def covers(self, text: str, example: str) -> bool:
+        """Достаточно ли слова сообщения и примера совпадают, чтобы считать их одной командой
+
+        Args:
+            text (str): Сообщение игрока
+            example (str): Пример фразы команды
+
+        Returns:
+            bool: False, если в сообщении есть отрицание, которого нет в примере, или слова покрывают друг друга меньше чем на `minCoverage`
+        """
+        words = [w for w in normalizeCommand(text, stem=True).split() if w not in _FILLER_WORDS]
+        exampleWords = [w for w in normalizeCommand(example, stem=True).split() if w not in _FILLER_WORDS]
+        if not words or not exampleWords:
+            return False
+        if any(w in _NEGATIONS and w not in exampleWords for w in words):
+            return False
+        same = lambda a, b: a == b or (len(a) >= 4 and len(b) >= 4 and a[:4] == b[:4])
+        textCoverage = sum(any(same(w, e) for e in exampleWords) for w in words) / len(words)
+        exampleCoverage = sum(any(same(e, w) for w in words) for e in exampleWords) / len(exampleWords)
+        return min(textCoverage, exampleCoverage) >= self.minCoverage
+
+    def classify(self, text: str, threshold: float | None = None) -> tuple[str | None, float]:
+        """Найти команду для сообщения игрока
+
+        Args:
+            text (str): Сообщение игрока
+            threshold (float | None, optional): Порог сходства вместо `self.threshold`. Defaults to None.
+
+        Returns:
+            tuple[str | None, float]: Команда (или `None`, если уверенности недостаточно, ближе всего `NO_COMMAND`
+                или сообщение не покрывает ни один из ближайших примеров) и ее сходство
+        """
+        ranked = self._nearest(text)
+        if not ranked:
+            return None, 0.0
+        command, score, examples = ranked[0]
+        runnerUp = ranked[1][1] if len(ranked) > 1 else 0.0
+        if command == self.NO_COMMAND or score < (self.threshold if threshold is None else threshold) or score - runnerUp < self.margin:
+            return None, score
+        if not any(self.covers(text, example) for example in examples):
+            return None, score
+        return command, score
+
+    def calibrate(self, precision: float = 0.95, negatives: list[str] | None = None) -> float:
+        """Подобрать порог. Если заданы `negatives`, порог поднимается выше сходства каждой из этих отложенных фраз,
+        которая иначе была бы распознана как команда. Иначе каждый пример классифицируется по остальным (leave-one-out),
+        и выбирается наименьший порог, при котором доля верных ответов не ниже `precision`
+
+        Args:
+            precision (float, optional): Требуемая доля верных ответов для leave-one-out. Defaults to 0.95.
+            negatives (list[str] | None, optional): Отложенные фразы, которые не являются командой. Defaults to None.
+
+        Returns:
+            float: Новый порог (не выше `maxThreshold`)
+        """
+        if not negatives:
+            self._calibrateExamples(precision)
+            return self.threshold
+        for phrase in negatives:
+            command, score = self.classify(phrase)
+            if command is not None:
+                if score >= self.maxThreshold:
+                    log.warning("negative example matches a command", phrase=phrase, command=command, score=round(score, 3))
+                self.threshold = min(self.maxThreshold, max(self.threshold, score + 0.01))
+        return self.threshold
+
+    def _calibrateExamples(self, precision: float):
+        import numpy as np
+
+        with self._lock:
+            if len(self.labels) < 4:
+                return
+            similarities = self._matrix @ self._matrix.T
+            np.fill_diagonal(similarities, -1.0)
+            nearest = similarities.argmax(axis=1)
+            best = similarities[np.arange(len(nearest)), nearest]
+            correct = self._labelIds[nearest] == self._labelIds
+
+        order = np.argsort(-best)
+        hits = np.cumsum(correct[order])
+        precisions = hits / np.arange(1, len(order) + 1)
+        passing = np.nonzero(precisions >= precision)[0]
+        if len(passing):
+            # не опускаем порог ниже исходного: отложенные фразы без команды проверяются отдельно
+            self.threshold = min(self.maxThreshold, max(self.threshold, float(best[order][passing[-1]])))
+
+
 class CommandsComparator:
-    def __init__(self, casesMap: dict[str, Callable], aiSession: ai.session.YaGPTSession, disableAi: bool = False) -> None:
+    def __init__(
+                    self,
+                    casesMap: dict[str, Callable],
+                    aiSession: "ai.session.YaGPTSession",
+                    disableAi: bool = False,
+                    fuzzyCutoff: float = 0.72,
+                    cache: ResponseCache | None = None,
+                    temperature: float = 0.35,
+                    executor: ActionExecutor | None = None,
+                    stopCommands: tuple[str, ...] = ("стоп",),
+                    batchWindow: float | None = None,
+                    batchSize: int = 8,
+                    examples: dict[str, list[str]] | None = None,
+                    intentThreshold: float = 0.55,
+                    learnFromAi: bool = False,
+                    degradedCutoff: float = 0.5,
+                    intentSession: "ai.session.YaGPTSession | None" = None,
+                    negatives: list[str] | None = None,
+                ) -> None:
     # def __init__(self, casesMap: dict[str, Callable], aiSession, disableAi: bool = False) -> None:
         self.casesMap = casesMap
         self.disableAi = disableAi
         self.aiSession = aiSession
+        self.temperature = temperature
+        self.matcher = CommandMatcher(list(casesMap.keys()), cutoff=fuzzyCutoff)
+        self.cache = cache
+        """Кэш ответов нейросети. Ключ зависит от нормализованной команды, списка команд, текста системного промпта и параметров модели"""
+        self.commandsHash = self._hashCommands()
+        self._systemMessage: dict[str, str] | None = None
+        self._batchSystemMessage: dict[str, str] | None = None
+        self.intents: IntentClassifier | None = None
+        """Классификатор по примерам фраз. Создается, только если переданы `examples`"""
+        if examples is not None:
+            self.intents = IntentClassifier({command: examples.get(command, []) for command in casesMap}, threshold=intentThreshold, negatives=negatives)
+        self.learnFromAi = learnFromAi
+        """Добавлять фразы, распознанные нейросетью, в примеры классификатора, чтобы в следующий раз обойтись без нее"""
+        self.degradedCutoff = degradedCutoff
+        """Порог локального сравнения, пока нейросеть недоступна (предохранитель сессии разомкнут)"""
+        self.intentSession = intentSession
+        """Сессия небольшой локальной модели (например, `ai.backends.OpenAICompatibleBackend` с llama.cpp или Ollama),
+        которая только распознает команду. Основная модель тогда получает лишь сообщения, на которые нужен креативный ответ"""
+        self._intentSystemMessage: dict[str, str] | None = None
+        self.stats: dict[str, int] = {"exact": 0, "normalized": 0, "fuzzy": 0, "intent": 0, "localModel": 0, "cache": 0, "ai": 0, "batchMisses": 0, "degraded": 0}
+        """Сколько команд разрешено на каждом уровне: локально (`exact`, `normalized`, `fuzzy`, `intent`), локальной моделью (`localModel`), из кэша (`cache`) и через нейросеть (`ai`).
+        `batchMisses` - сколько команд модель пропустила в пакетном ответе, и они были отправлены повторно по одной,
+        `degraded` - сколько команд обработано без нейросети, пока она была недоступна"""
+        self.executor = executor
+        """Исполнитель действий. Если задан, команды ставятся в его очередь, а не выполняются в потоке вызывающего"""
+        self.stopCommands = stopCommands
+        """Команды, которые отменяют текущее действие и очищают очередь исполнителя"""
+        self.batcher: MicroBatcher | None = None
+        """Сборщик пакетов. Если задан `batchWindow`, команды разных игроков, не распознанные локально, уходят в модель одним запросом"""
+        if batchWindow is not None and not disableAi:
+            self.batcher = MicroBatcher(self._resolveBatch, window=batchWindow, maxSize=batchSize, name="compare")
+
+    def _hashCommands(self) -> str:
+        return ResponseCache.makeKey(sorted(self.casesMap.keys()))
+
+    @property
+    def systemMessage(self) -> dict[str, str]:
+        """Системное сообщение с перечнем команд. Собирается один раз для каждой версии списка команд"""
+        if self._systemMessage is None:
+            strCommands = f'[{", ".join(self.casesMap.keys())}]'
+            self._systemMessage = prompts.REGISTRY.systemMessage(prompts.Prompts.SYSTEM_PROMPT_2, commands=strCommands)
+        return self._systemMessage
+
+    @property
+    def batchSystemMessage(self) -> dict[str, str]:
+        """Системное сообщение для пакетного сравнения команд"""
+        if self._batchSystemMessage is None:
+            strCommands = f'[{", ".join(self.casesMap.keys())}]'
+            self._batchSystemMessage = prompts.REGISTRY.systemMessage(prompts.Prompts.SYSTEM_PROMPT_BATCH, commands=strCommands)
+        return self._batchSystemMessage
+
+    @property
+    def intentSystemMessage(self) -> dict[str, str]:
+        """Системное сообщение для распознавания команды локальной моделью"""
+        if self._intentSystemMessage is None:
+            strCommands = f'[{", ".join(self.casesMap.keys())}]'
+            self._intentSystemMessage = prompts.REGISTRY.systemMessage(prompts.Prompts.SYSTEM_PROMPT_INTENT, commands=strCommands)
+        return self._intentSystemMessage
         
-    def add(self, command: str, f: Callable):
+    def add(self, command: str, f: Callable, examples: list[str] | None = None):
         """Добавляет действие в список действий
 
         Args:
             command (str): Словесное и краткое название команды (например: `за мной`, `стоп` и т.д.)
             aiSession (ai.AiSession): Экземпляр сессии с YandexGPT. От имени этой сессии будет осуществляться запрос к нейросети
             f (function): Функция, вызывающаяся при совпадении команды игрока в чате с заданной здесь командой
+            examples (list[str] | None, optional): Примеры фраз для классификатора `intents`. Defaults to None.
         """
         self.casesMap[command.lower()] = f
+        self.matcher.add(command.lower())
+        if self.intents is not None:
+            self.intents.add(command.lower(), examples)
+        # новый хеш списка команд делает недействительными все ответы, закэшированные для старого списка
+        self.commandsHash = self._hashCommands()
+        self._systemMessage = None
+        self._batchSystemMessage = None
+        self._intentSystemMessage = None
         
-    def compare(self, commandFromGame: str) -> Callable:
+    def _dispatch(self, command: str, context: dict) -> Callable:
+        f = self.casesMap[command]
+        if self.executor is None:
+            return (lambda: f(**context)) if context else f
+
+        stop = command in self.stopCommands
+        action = self.executor.submit(CallableAction(
+            command, f,
+            priority=ACTION_PRIORITIES.STOP if stop else ACTION_PRIORITIES.COMMAND,
+            exclusive=stop,
+            **context
+        ))
+        return lambda: action
+
+    def replyLocal(self, commandFromGame: str, **context) -> str | None:
+        """Распознать команду только локально, выполнить ее (или поставить в очередь) и вернуть короткий ответ игроку,
+        чтобы игрок видел, что команда понята. Команда, найденная только классификатором, подтверждается ответом
+        с ее названием, чтобы игрок мог сразу отменить ошибочно распознанное действие
+
+        Args:
+            commandFromGame (str): Сообщение игрока в чате игры
+            context: Именованные аргументы для функции команды (например, `username`)
+
+        Returns:
+            str | None: Ответ игроку или `None`, если команда не распознана
+        """
+        matched, tier = self._matchLocal(commandFromGame)
+        if matched is None or tier is None:
+            return None
+        runCase = self._dispatchLocal(matched, tier, context)
+        if self.executor is None:
+            runCase()
+        if tier == "intent":
+            return prompts.confirmCommand(matched, cancellable=matched not in self.stopCommands)
+        return prompts.cannedReply(recognized=True)
+
+    def _matchLocal(self, commandFromGame: str) -> tuple[str | None, str | None]:
+        matched, tier = self.matcher.match(commandFromGame.lower())
+        if matched is None and self.intents is not None:
+            matched, _ = self.intents.classify(commandFromGame)
+            tier = "intent" if matched is not None else None
+        return matched, tier
+
+    def _dispatchLocal(self, matched: str, tier: str, context: dict) -> Callable:
+        self.stats[tier] += 1
+        COMMANDS.inc(tier=tier)
+        return self._dispatch(matched, context)
+
+    def compareLocal(self, commandFromGame: str, **context) -> Callable | None:
+        """Сравнить команду только локально, без кэша и нейросети
+
+        Args:
+            commandFromGame (str): Сообщение игрока в чате игры
+            context: Именованные аргументы для функции команды (например, `username`)
+
+        Returns:
+            Callable | None: То же, что и `compare`, или `None`, если команда не распознана
+        """
+        matched, tier = self._matchLocal(commandFromGame)
+        if matched is None or tier is None:
+            return None
+        return self._dispatchLocal(matched, tier, context)
+
+    def compareIntent(self, commandFromGame: str, session: "ai.session.YaGPTSession | None" = None, **context) -> Callable | None:
+        """Распознать команду локальной моделью (`intentSession`), без креативного ответа.
+        Найденная команда выполняется (или ставится в очередь), а игроку возвращается заготовленный ответ.
+        Ошибка или таймаут локальной модели не мешают ответу: команда просто считается не распознанной
+
+        Args:
+            commandFromGame (str): Сообщение игрока в чате игры
+            session (ai.session.YaGPTSession | None, optional): Сессия локальной модели. По умолчанию - `intentSession`. Defaults to None.
+            context: Именованные аргументы для функции команды (например, `username`)
+
+        Returns:
+            Callable | None: Функция, возвращающая заготовленный ответ, или `None`, если команда не распознана
+        """
+        session = session if session is not None else self.intentSession
+        if session is None:
+            return None
+        started = time.perf_counter()
+        userCommand = commandFromGame.lower()
+        try:
+            answer = session.customAsk(
+                [self.intentSystemMessage, createMessageBody(userCommand, "user")],
+                temperature=0,
+                maxTokens=16,
+                priority=PRIORITIES.ACTION,
+            )
+        except Exception as e:
+            log.warning("intent model failed", error=str(e))
+            return None
+
+        # небольшие модели добавляют кавычки и точки, поэтому ответ сверяется с перечнем так же, как сообщение игрока
+        answer = answer.strip().strip("`\"'.!").lower()
+        matched = None if answer in ("", "null", "none") else self.matcher.match(answer)[0]
+        COMPARE_SECONDS.observe(time.perf_counter() - started, tier="localModel")
+        if matched is None:
+            return None
+        self.stats["localModel"] += 1
+        COMMANDS.inc(tier="localModel")
+        if self.learnFromAi and self.intents is not None:
+            self.intents.learn(userCommand, matched)
+        self._runResult(matched, context)
+        reply = prompts.cannedReply(recognized=True)
+        return lambda: reply
+
+    def compare(self, commandFromGame: str, **context) -> Callable:
         """Сравнивает полученную команду в чате игры с одним из заданных в компараторе кейсов. 
         
         Сравнение происходит через YandexGPT, поэтому бот должен быть запущен со включенными нейросетевыми возможностями (т.е. без опции `disableAi`).
+        При заданном `batchWindow` запрос к модели может быть объединен с командами других игроков.
+
+        Если задан `executor`, найденная команда сразу ставится в его очередь как действие, а возвращаемая функция отдает это действие.
+
+        Если задана `intentSession`, команда, не распознанная локально, сначала отправляется в локальную модель,
+        и только при ее промахе - в основную.
+
+        Если предохранитель сессии разомкнут (`CircuitOpenError`), команда ищется локально с порогом `degradedCutoff`,
+        а вместо креативного ответа возвращается заготовленная фраза.
 
         Args:
             commandFromGame (str): Сообщение игрока в чате игры с командой для бота
+            context: Именованные аргументы для функции команды (например, `username`)
 
         Returns:
             Callable: Функцию, вызывав которую бот начнет выполнять запрашиваемое действие
         """
+        started = time.perf_counter()
         userCommand = commandFromGame.lower()
-        if userCommand in self.casesMap.keys():
-            return self.casesMap[userCommand]
+        local = self.compareLocal(userCommand, **context)
+        if local is not None:
+            COMPARE_SECONDS.observe(time.perf_counter() - started, tier="local")
+            return local
+
+        intent = self.compareIntent(userCommand, **context)
+        if intent is not None:
+            return intent
         
         if self.disableAi:
-            raise Error("Отключены нейросетевые возможности, сравнение невозможно")
+            raise RuntimeError("Отключены нейросетевые возможности, сравнение невозможно")
         
-        commands = list(self.casesMap.keys())
-        strCommands = f'[{", ".join(commands)}]'
-        # matches = difflib.get_close_matches(userCommand, commands, n=1, cutoff=0.65)
-        
-        # if matches and matches[0] in commands:
-        #     return self.casesMap[matches[0]]
-        # else:
-        formattedSystemPrompt = prompts.Prompts.SYSTEM_PROMPT_2.replace("{commands}", strCommands)
-        messages = [
-            createMessageBody(formattedSystemPrompt, "system"),
-            createMessageBody(userCommand, "user"),
-        ]
-        print(messages)
-        aiResponse: dict[str, str] = json.loads(self.aiSession.customAsk(messages, temperature=0.35))
-        """Структура вида:
-        ```
-        {
-            "result": слово_из_перечня_либо_null, 
-            "creative": твой_креативный_ответ_либо_null
-        }
-        ```
+        cacheKey = None
+        rawResponse = None
+        if self.cache is not None:
+            cacheKey = self._cacheKey(userCommand, batch=self.batcher is not None)
+            rawResponse = self.cache.get(cacheKey)
+
+        fromCache = rawResponse is not None
+        if fromCache:
+            self.stats["cache"] += 1
+        else:
+            self.stats["ai"] += 1
+            try:
+                if self.batcher is not None:
+                    # одновременные промахи разных игроков уходят в модель одним запросом с общим перечнем команд
+                    rawResponse = self.batcher.submit(userCommand).result()
+                else:
+                    rawResponse = self._askOne(userCommand)
+            except CircuitOpenError:
+                return self.compareDegraded(userCommand, **context)
+
+        # ответ в ``` или с пояснениями разбирается без повторного запроса к модели
+        response = parseCommandResponse(rawResponse) # type: ignore
+        self._finish(userCommand, response, rawResponse, cacheKey, fromCache, started) # type: ignore
+
+        # возвращаем креативный ответ всегда, а кейс выполняем (или ставим в очередь) тут же, если это возможно
+        self._runResult(response.result, context)
+        return lambda: response.creative
+
+    def compareStream(self, commandFromGame: str, onCreative: Callable[[str], Any] | None = None, **context) -> Callable:
+        """Потоковый вариант `compare`. Команда выполняется (или ставится в очередь) сразу, как только модель
+        сгенерировала поле `result`, не дожидаясь креативного ответа. Креативный ответ передается в `onCreative`
+        фрагментами по мере генерации.
+
+        При сессии `PooledYaGPTSession` фрагменты разбираются в фоновом цикле событий, поэтому вместе с ней
+        стоит использовать `executor`, чтобы действие не выполнялось в этом цикле. Пакетный режим (`batchWindow`)
+        здесь не используется: поток ответа принадлежит одному игроку.
+
+        Args:
+            commandFromGame (str): Сообщение игрока в чате игры с командой для бота
+            onCreative (Callable[[str], Any] | None, optional): Получает новые фрагменты креативного ответа. Defaults to None.
+            context: Именованные аргументы для функции команды (например, `username`)
+
+        Returns:
+            Callable: То же, что и `compare`
         """
-        
-        # возвращаем креативный ответ всегда, а кейс выполняем тут же, если это возможно
-        print(aiResponse)
+        started = time.perf_counter()
+        userCommand = commandFromGame.lower()
+        local = self.compareLocal(userCommand, **context)
+        if local is not None:
+            COMPARE_SECONDS.observe(time.perf_counter() - started, tier="local")
+            return local
+
+        intent = self.compareIntent(userCommand, **context)
+        if intent is not None:
+            if onCreative is not None:
+                onCreative(intent())
+            return intent
+
+        if self.disableAi:
+            raise RuntimeError("Отключены нейросетевые возможности, сравнение невозможно")
+
+        cacheKey = None
+        if self.cache is not None:
+            cacheKey = self._cacheKey(userCommand)
+            cached = self.cache.get(cacheKey)
+            if cached is not None:
+                # закэшированный ответ разбирается сразу, без повторного локального сравнения и локальной модели
+                self.stats["cache"] += 1
+                response = parseCommandResponse(cached)
+                self._finish(userCommand, response, cached, cacheKey, True, started)
+                self._runResult(response.result, context)
+                if onCreative is not None and response.creative:
+                    onCreative(response.creative)
+                return lambda: response.creative
+        self.stats["ai"] += 1
+
+        dispatched: list[str | None] = []
+        emitted = [0]
+
+        def emitCreative(text: str):
+            if onCreative is not None and len(text) > emitted[0]:
+                onCreative(text[emitted[0]:])
+                emitted[0] = len(text)
+
+        def onField(key: str, value: Any):
+            if key == "result":
+                dispatched.append(value if isinstance(value, str) else None)
+                self._runResult(dispatched[0], context)
+            elif key == "creative" and isinstance(value, str):
+                emitCreative(value)
+
+        parser = StreamingObjectParser(onField)
+
+        def onDelta(delta: str):
+            parser.feed(delta)
+            partial = parser.partial
+            if partial is not None and partial[0] == "creative":
+                emitCreative(partial[1])
+
+        messages = self._messages(userCommand)
         try:
-            print("Выполнил кейс", aiResponse["result"])
-            self.casesMap[aiResponse["result"]]()
-        except KeyError:
-            pass
-        return lambda: aiResponse["creative"]
+            if hasattr(self.aiSession, "customAskStreamFuture"):
+                rawResponse = self.aiSession.customAskStreamFuture(messages, onDelta, temperature=self.temperature, priority=PRIORITIES.ACTION).result() # type: ignore
+            else:
+                chunks = []
+                for delta in self.aiSession.customAskStream(messages, temperature=self.temperature, priority=PRIORITIES.ACTION):
+                    chunks.append(delta)
+                    onDelta(delta)
+                rawResponse = "".join(chunks)
+        except CircuitOpenError:
+            creative = self.compareDegraded(userCommand, **context)()
+            if onCreative is not None:
+                onCreative(creative)
+            return lambda: creative
+
+        # потоковый разбор мог не сработать (например, ответ без JSON) - тогда разбирается полный текст
+        response = parseCommandResponse(rawResponse)
+        self._finish(userCommand, response, rawResponse, cacheKey, False, started)
+        if not dispatched:
+            self._runResult(response.result, context)
+        if response.creative:
+            emitCreative(response.creative)
+        return lambda: response.creative
+
+    def compareDegraded(self, commandFromGame: str, **context) -> Callable:
+        """Сравнить команду без нейросети, пока она недоступна: локально с ослабленным порогом `degradedCutoff`.
+        Найденная команда выполняется (или ставится в очередь), а возвращается заготовленный ответ игроку
+
+        Args:
+            commandFromGame (str): Сообщение игрока в чате игры
+            context: Именованные аргументы для функции команды (например, `username`)
+
+        Returns:
+            Callable: Функция, возвращающая заготовленный ответ
+        """
+        started = time.perf_counter()
+        userCommand = commandFromGame.lower()
+        matched, _ = self.matcher.match(userCommand, cutoff=self.degradedCutoff)
+        if matched is None and self.intents is not None:
+            matched, _ = self.intents.classify(userCommand, threshold=self.degradedCutoff)
+        self.stats["degraded"] += 1
+        COMMANDS.inc(tier="degraded")
+        COMPARE_SECONDS.observe(time.perf_counter() - started, tier="degraded")
+        self._runResult(matched, context)
+        reply = prompts.cannedReply(recognized=matched is not None)
+        return lambda: reply
+
+    def _askOne(self, userCommand: str) -> str:
+        # распознавание команды обгоняет в очереди обычные беседы с игроками
+        return self.aiSession.customAsk(self._messages(userCommand), temperature=self.temperature, priority=PRIORITIES.ACTION)
+
+    def _resolveBatch(self, commands: list[str]) -> list[str]:
+        # одинаковые команды от разных игроков спрашиваются один раз
+        unique = list(dict.fromkeys(commands))
+        if len(unique) == 1:
+            return [self._askOne(unique[0])] * len(commands)
+
+        numbered = "\n".join(f"{i}: {' '.join(command.split())}" for i, command in enumerate(unique, 1))
+        rawResponse = self.aiSession.customAsk(
+            [self.batchSystemMessage, createMessageBody(numbered, "user")],
+            temperature=self.temperature,
+            priority=PRIORITIES.ACTION,
+        )
+        responses = parseBatchResponse(rawResponse)
+
+        answers: dict[str, str] = {}
+        for i, command in enumerate(unique, 1):
+            response = responses.get(i)
+            if response is None:
+                # модель пропустила сообщение или испортила его элемент - спрашиваем отдельно
+                self.stats["batchMisses"] += 1
+                answers[command] = self._askOne(command)
+            else:
+                answers[command] = response.model_dump_json()
+        log.debug("command batch compared", size=len(commands), unique=len(unique), parsed=len(responses))
+        return [answers[command] for command in commands]
+
+    def close(self):
+        """Остановить сборщик пакетов, дождавшись уже собранных команд"""
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def _cacheKey(self, userCommand: str, batch: bool = False) -> str:
+        # в ключ входят и отрисованные системные промпты, по которым мог быть получен ответ: после правки SYSTEM_PROMPT_2
+        # или SYSTEM_PROMPT_BATCH ответы, полученные со старым текстом, из кэша не берутся. Пакетный режим отправляет
+        # одиночный промпт для пакета из одной команды и для пропусков, поэтому учитывает оба
+        systemMessages = [self.systemMessage, self.batchSystemMessage] if batch else [self.systemMessage]
+        return ResponseCache.makeKey(
+            normalizeCommand(userCommand), self.commandsHash, ResponseCache.makeKey(systemMessages), self.aiSession.model_uri, self.temperature,
+        )
+
+    def _messages(self, userCommand: str) -> list[dict[str, str]]:
+        return [
+            self.systemMessage,
+            createMessageBody(userCommand, "user"),
+        ]
+
+    def _finish(self, userCommand: str, response: CommandResponse, rawResponse: str, cacheKey: str | None, fromCache: bool, started: float):
+        # в кэш попадают только ответы, из которых удалось что-то разобрать
+        if cacheKey is not None and not fromCache and (response.result or response.creative):
+            self.cache.set(cacheKey, rawResponse) # type: ignore
+
+        command = response.result.lower() if response.result else None
+        if self.learnFromAi and self.intents is not None and command in self.casesMap:
+            self.intents.learn(userCommand, command) # type: ignore
+
+        tier = "cache" if fromCache else "ai"
+        COMMANDS.inc(tier=tier)
+        COMPARE_SECONDS.observe(time.perf_counter() - started, tier=tier)
+        log.debug("command compared", tier=tier, result=response.result)
+
+    def _runResult(self, result: str | None, context: dict):
+        command = result.lower() if result else None
+        if command in self.casesMap:
+            runCase = self._dispatch(command, context) # type: ignore
+            if self.executor is None:
+                runCase()
 
         
         
 
+MINECRAFT_CHAT_LIMIT = 256
+"""Максимальная длина сообщения в чате Minecraft вместе с командой"""
+
+
+class ChatLineSink:
+    """Собирает потоковый ответ нейросети в строки чата Minecraft. Строка отправляется, как только закончено
+    предложение или текст перестает помещаться в одно сообщение.
+    """
+    SENTENCE_END = re.compile(r"[.!?…\n]+[\s\"')»]*")
+
+    def __init__(self, send: Callable[[str], None], maxLength: int = MINECRAFT_CHAT_LIMIT) -> None:
+        """Собирает потоковый ответ нейросети в строки чата Minecraft
+
+        Args:
+            send (Callable[[str], None]): Функция отправки одной строки в чат
+            maxLength (int, optional): Максимальная длина одной строки. Defaults to MINECRAFT_CHAT_LIMIT.
+        """
+        self.send = send
+        self.maxLength = maxLength
+        self.buffer: str = ""
+        self.sentLines: int = 0
+
+    @classmethod
+    def forWhisper(cls, bot, username: str) -> "ChatLineSink":
+        """Создать приемник, отправляющий строки игроку в личные сообщения
+
+        Args:
+            bot (`mineflayer.createBot` | `utils.dispatcher.Outbox`): Экземпляр бота или его очередь исходящих сообщений
+            username (str): Ник игрока
+
+        Returns:
+            ChatLineSink: Приемник с длиной строки, учитывающей `/tell <ник> `
+        """
+        return cls(lambda line: bot.whisper(username, line), maxLength=MINECRAFT_CHAT_LIMIT - len(f"/tell {username} "))
+
+    def _emit(self, line: str):
+        line = line.strip()
+        if line:
+            self.send(line)
+            self.sentLines += 1
+
+    def feed(self, delta: str):
+        """Добавить новый фрагмент текста и отправить законченные строки
+
+        Args:
+            delta (str): Новый фрагмент ответа
+        """
+        self.buffer += delta
+        while True:
+            end = None
+            for match in self.SENTENCE_END.finditer(self.buffer):
+                if match.end() > self.maxLength:
+                    break
+                end = match.end()
+            if end is not None:
+                self._emit(self.buffer[:end])
+                self.buffer = self.buffer[end:]
+            elif len(self.buffer) > self.maxLength:
+                self._emitOverflow()
+            else:
+                return
+
+    def _emitOverflow(self):
+        # предложение не влезает в одно сообщение - режем по последнему пробелу
+        cut = self.buffer.rfind(" ", 0, self.maxLength)
+        cut = cut if cut > 0 else self.maxLength
+        self._emit(self.buffer[:cut])
+        self.buffer = self.buffer[cut:]
+
+    def flush(self):
+        """Отправить остаток текста после окончания потока"""
+        while len(self.buffer) > self.maxLength:
+            self._emitOverflow()
+        self._emit(self.buffer)
+        self.buffer = ""
+
+
 class BotActions:
-    def __init__(self, bot, movements):
+    def __init__(self, bot, movements, navigation=None):
         """Дополнительные методы для управления ботом
 
         Args:
             bot (`mineflayer.createBot`): Экземпляр бота
             movements (`pathfinder.Movements`): Двигатель для бота
+            navigation (`utils.navigation.NavigationService`, optional): Сервис навигации. Если задан, движение идет через него. Defaults to None.
         """
         
         self.bot = bot
         self.movements = movements
+        self.navigation = navigation
         
     def reset(self):
         """Сбросить все действия для текущего бота
         """
-        self.bot.pathfinder.setGoal(None)
-        self.bot.pathfinder.setMovements(self.movements)
+        if self.navigation is not None:
+            # настройки движения не меняются при остановке, поэтому их не нужно передавать заново
+            self.navigation.stop()
+        else:
+            self.bot.pathfinder.setGoal(None)
+            self.bot.pathfinder.setMovements(self.movements)
         self.bot.stopDigging()
+
+    def follow(self, username: str, distance: float = 1) -> bool:
+        """Следовать за игроком
+
+        Args:
+            username (str): Ник игрока
+            distance (float, optional): На каком расстоянии держаться от игрока. Defaults to 1.
+
+        Returns:
+            bool: False, если игрока не видно
+        """
+        if self.navigation is not None:
+            return self.navigation.follow(username, distance)
+
+        from javascript import require
+        pathfinder = require("mineflayer-pathfinder")
+
+        player = self.bot.players[username]
+        target = player.entity if player else None
+        if not target:
+            return False
+        self.bot.pathfinder.setMovements(self.movements)
+        self.bot.pathfinder.setGoal(pathfinder.goals.GoalFollow(target, distance), True)
+        return True
+
+    def stopMoving(self):
+        """Сбросить цель движения, не трогая остальные действия"""
+        if self.navigation is not None:
+            self.navigation.stop()
+        else:
+            self.bot.pathfinder.setGoal(None)
         
         
+ITEM_TIERS = {"wooden": 1, "golden": 2, "stone": 3, "chainmail": 3, "iron": 4, "diamond": 5, "netherite": 6}
+"""Уровень материала инструмента или брони. Чем выше - тем лучше"""
+
+ITEM_CATEGORIES = (
+    "sword", "pickaxe", "axe", "shovel", "hoe", "helmet", "chestplate", "leggings", "boots",
+    "log", "planks", "ore", "ingot", "seeds", "bucket", "bow", "arrow", "shield",
+)
+"""Категории предметов, которые определяются по суффиксу системного имени (`iron_pickaxe` -> `pickaxe`)"""
+
+JS_ITEM_TO_JSON = "(item) => item && ({slot: item.slot, type: item.type, name: item.name, displayName: item.displayName, " \
+    "count: item.count, stackSize: item.stackSize, durabilityUsed: item.durabilityUsed ?? 0, maxDurability: item.maxDurability ?? 0})"
+"""JS функция, превращающая `prismarine-item` в простой объект"""
+
+
+def evalJson(code: str, bot) -> object:
+    """Выполнить JS код на стороне Node за один вызов моста и вернуть результат как обычные данные Python.
+
+    Код выполняется как тело функции, в которой доступна переменная `bot`, и должен вернуть значение, сериализуемое в JSON.
+
+    Args:
+        code (str): Тело JS функции с `return`
+        bot (`mineflayer.createBot`): Экземпляр бота
+
+    Returns:
+        object: Результат, разобранный из JSON
+    """
+    from javascript import eval_js
+    return json.loads(eval_js(f"return JSON.stringify((() => {{ {code} }})())"))
+
+
+def describeItem(item: dict) -> dict:
+    """Дополнить данные предмета категорией и уровнем материала
+
+    Args:
+        item (dict): Данные предмета из `JS_ITEM_TO_JSON`
+
+    Returns:
+        dict: Тот же словарь с полями `category` и `tier`
+    """
+    name: str = item["name"]
+    item["category"] = next((c for c in ITEM_CATEGORIES if name == c or name.endswith(f"_{c}")), None)
+    item["tier"] = ITEM_TIERS.get(name.split("_", 1)[0], 0)
+    return item
+
+
+class InventoryMirror:
+    """Копия инвентаря бота в памяти Python с индексами по имени, ID и категории предмета.
+
+    Слоты забираются из Node одним вызовом моста, а дальше копия обновляется по событиям `updateSlot`,
+    поэтому проверки наличия и поиск лучшего предмета не делают ни одного вызова в Node.
+    """
+    def __init__(self, bot, subscribe: bool = True) -> None:
+        """Копия инвентаря бота в памяти Python
+
+        Args:
+            bot (`mineflayer.createBot`): Экземпляр бота
+            subscribe (bool, optional): Подписаться на события инвентаря для обновления копии. Defaults to True.
+        """
+        self.bot = bot
+        self.slots: dict[int, dict] = {}
+        """Номер слота -> данные предмета"""
+        self.byName: dict[str, set[int]] = {}
+        self.byType: dict[int, set[int]] = {}
+        self.byCategory: dict[str, set[int]] = {}
+        self.syncCount: int = 0
+        """Сколько раз инвентарь забирался из Node целиком"""
+        self._lock = threading.Lock()
+
+        self.sync()
+        if subscribe:
+            self._subscribe()
+
+    def _subscribe(self):
+        from javascript import On
+
+        @On(self.bot.inventory, "updateSlot")
+        def updateSlotHandler(this, slot, oldItem, newItem, *args):
+            self.refreshSlot(int(slot))
+
+        # окна (сундуки, верстаки) меняют много слотов разом, проще забрать инвентарь заново
+        @On(self.bot, "windowClose")
+        def windowCloseHandler(this, *args):
+            self.sync()
+
+    def sync(self):
+        """Забрать все слоты инвентаря из Node одним вызовом и перестроить индексы"""
+        with INVENTORY_SYNC_SECONDS.time(kind="full"):
+            items = evalJson(f"const toJson = {JS_ITEM_TO_JSON}; return bot.inventory.slots.map(toJson)", self.bot)
+        with self._lock:
+            self.slots.clear()
+            self.byName.clear()
+            self.byType.clear()
+            self.byCategory.clear()
+            for index, item in enumerate(items): # type: ignore
+                if item:
+                    self._add(index, describeItem(item))
+            self.syncCount += 1
+
+    def refreshSlot(self, index: int):
+        """Забрать из Node один слот и обновить индексы
+
+        Args:
+            index (int): Номер слота
+        """
+        with INVENTORY_SYNC_SECONDS.time(kind="slot"):
+            item = evalJson(f"return ({JS_ITEM_TO_JSON})(bot.inventory.slots[{index}])", self.bot)
+        self.updateSlot(index, describeItem(item) if item else None) # type: ignore
+
+    def updateSlot(self, index: int, item: dict | None):
+        """Заменить содержимое слота в копии
+
+        Args:
+            index (int): Номер слота
+            item (dict | None): Данные предмета или `None`, если слот опустел
+        """
+        with self._lock:
+            self._remove(index)
+            if item:
+                self._add(index, item)
+
+    def _add(self, index: int, item: dict):
+        self.slots[index] = item
+        self.byName.setdefault(item["name"], set()).add(index)
+        self.byType.setdefault(item["type"], set()).add(index)
+        if item.get("category"):
+            self.byCategory.setdefault(item["category"], set()).add(index)
+
+    def _remove(self, index: int):
+        item = self.slots.pop(index, None)
+        if item is None:
+            return
+        for key, lookup in ((item["name"], self.byName), (item["type"], self.byType), (item.get("category"), self.byCategory)):
+            slots = lookup.get(key)
+            if slots is not None:
+                slots.discard(index)
+                if not slots:
+                    del lookup[key]
+
+    def items(self) -> list[dict]:
+        """Все непустые слоты"""
+        with self._lock:
+            return list(self.slots.values())
+
+    def __contains__(self, itemIdOrName: int | str) -> bool:
+        """Проверить наличие предмета по ID, точному имени или части имени
+
+        Args:
+            itemIdOrName (int | str): ID или системное имя предмета (можно часть имени, например `sword`)
+
+        Returns:
+            bool: True, если предмет есть в инвентаре
+        """
+        INVENTORY_LOOKUPS.inc(op="contains")
+        # индексы меняются из обработчиков событий моста, поэтому читаются под той же блокировкой
+        with self._lock:
+            if isinstance(itemIdOrName, int):
+                return itemIdOrName in self.byType
+            name = itemIdOrName.lower()
+            # индекс по именам хранит только различные имена, поэтому поиск по части имени - O(k) без вызовов в Node
+            return name in self.byName or name in self.byCategory or any(name in n for n in self.byName)
+
+    def count(self, itemIdOrName: int | str) -> int:
+        """Сколько всего предметов с таким ID или именем в инвентаре
+
+        Returns:
+            int: Суммарное количество
+        """
+        INVENTORY_LOOKUPS.inc(op="count")
+        with self._lock:
+            slots = self.byType.get(itemIdOrName, set()) if isinstance(itemIdOrName, int) else self.byName.get(itemIdOrName.lower(), set())
+            return sum(self.slots[i]["count"] for i in slots)
+
+    def findByBestItem(self, fieldByMax: str, fieldByName: str = "") -> dict:
+        """Найти лучший предмет по числовой характеристике среди предметов, в имени которых есть `fieldByName`.
+        Если `fieldByName` - известная категория, перебираются только слоты этой категории
+
+        Returns:
+            dict: Данные найденного предмета или `{fieldByMax: -1}`, если ничего не найдено
+        """
+        INVENTORY_LOOKUPS.inc(op="best")
+        with self._lock:
+            if fieldByName in self.byCategory:
+                candidates = [self.slots[i] for i in self.byCategory[fieldByName]]
+            else:
+                candidates = list(self.slots.values())
+        return findByBestItem(candidates, fieldByMax=fieldByMax, fieldByName=fieldByName)
+
+
 class BotInventory:
-    def __init__(self, bot, mcData) -> None:
+    def __init__(self, bot, mcData, mirror: InventoryMirror | None = None) -> None:
         self.bot = bot
         self.mcData = mcData
         self.inventory = self.bot.inventory
-        self.slots: list = self.bot.inventory.slots
+        self.mirror = mirror or InventoryMirror(bot)
+        """Копия инвентаря в памяти Python, через которую идут все проверки"""
+
+    @property
+    def slots(self) -> list[dict]:
+        return self.mirror.items()
     
     @property
     def nslots(self):
-        return list(filter(lambda x: bool(x), self.slots))
+        return self.mirror.items()
     
     @property
     def hotbar(self, index: int = 0) -> dict:
-        return filter(lambda d: d.slot == 36 + index, self.slots) # type: ignore
+        return filter(lambda d: d["slot"] == 36 + index, self.slots) # type: ignore
     
     def __contains__(self, itemIdOrName: int | str) -> bool:
         """Проверить наличие предмета в инвентаре бота
@@ -148,10 +1276,7 @@ class BotInventory:
         Returns:
             bool: True, если указанный предмет есть в инвентаре бота
         """
-        for slot in self.slots:
-            if slot and (itemIdOrName == slot.type or itemIdOrName == slot.name.lower() or itemIdOrName in slot.name.lower()):
-                return True
-        return False
+        return itemIdOrName in self.mirror
     
     def _findByBestItem(self, fieldByMax: str, fieldByName: str = "") -> dict:
         """Найти лучший предмет в инвентаре по указанной характеристике.
@@ -162,7 +1287,7 @@ class BotInventory:
         
         Returns dict: json найденного предмета в инвентаре
         """
-        return findByBestItem(self.slots, fieldByMax=fieldByMax, fieldByName=fieldByName)
+        return self.mirror.findByBestItem(fieldByMax=fieldByMax, fieldByName=fieldByName)
     
     def hasPickaxe(self) -> dict:
         """Проверить наличие кирки. Если кирка есть - вернуть json самой лучшей кирки
@@ -170,7 +1295,8 @@ class BotInventory:
         Returns:
             dict: json самой лучшей кирки в инвентаре
         """
-        return {}
+        best = self.mirror.findByBestItem("tier", "pickaxe")
+        return best if best["tier"] >= 0 else {}
     
     
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+"""Команды, которые бот выполняет без языковой модели, и сборка их распознавания.
+
+Таблица команд общая для `main.py` и ботов флота (`utils.fleet`), а исполнитель действий и `CommandsComparator`
+у каждого бота свои, поэтому команды, распознанные локально, работают и пока модель недоступна.
+"""
+from typing import Callable
+
+from utils.actions import ActionExecutor, FollowAction
+from utils.botUtils import BotActions, CommandsComparator
+
+
+BOT_COMMAND_EXAMPLES = {
+    "стоп": ["стой", "остановись", "хватит", "замри", "не двигайся", "прекрати"],
+    "за мной": ["иди за мной", "следуй за мной", "пошли со мной", "пойдем", "иди сюда", "ко мне"],
+}
+"""Примеры фраз для классификатора: перефразированные команды распознаются без нейросети"""
+
+BOT_NEGATIVE_EXAMPLES = [
+    "не ходи за мной", "не иди за мной", "не надо за мной", "не останавливайся", "не стой",
+    "пойдем в шахту", "пойдем в деревню", "иди домой", "иди копать", "мне скучно",
+    "стоп игра", "стоп кран", "как дела", "привет", "что ты умеешь", "расскажи историю",
+    "где ты", "мне нужна помощь", "сколько времени", "построй дом",
+]
+"""Фразы, похожие на команды, но не являющиеся ими. Половина обучает класс "не команда", по другой калибруется порог"""
+
+
+def createBotCommands(botActions: BotActions) -> dict[str, Callable]:
+    """Команды, которые бот распознает без нейросети. Функции получают ник игрока
+
+    Args:
+        botActions (BotActions): Действия бота
+
+    Returns:
+        dict[str, Callable]: Команда -> функция
+    """
+    return {
+        "стоп": lambda username: botActions.reset(),
+        "за мной": lambda username: FollowAction(botActions, username),
+    }
+
+
+def createComparator(botActions: BotActions, executor: ActionExecutor | None = None) -> CommandsComparator:
+    """Локальное распознавание команд бота. Все, что не распознано, уходит в беседу с языковой моделью
+
+    Args:
+        botActions (BotActions): Действия бота
+        executor (ActionExecutor | None, optional): Исполнитель действий бота. Defaults to None.
+
+    Returns:
+        CommandsComparator: Сравнение команд без запросов к нейросети
+    """
+    return CommandsComparator(
+        createBotCommands(botActions),
+        aiSession=None, # type: ignore
+        disableAi=True,
+        executor=executor,
+        examples=BOT_COMMAND_EXAMPLES,
+        negatives=BOT_NEGATIVE_EXAMPLES,
+    )
@@ -0,0 +1,189 @@
+"""Вынос работы обработчиков событий из потока моста JSPyBridge.
+
+Обработчик события (`@On(bot, "whisper")`) только ставит задачу в очередь и сразу возвращается. Задачи
+выполняются в пуле потоков, причем задачи одного игрока - строго по очереди. Сообщения в игру отправляются
+через `Outbox` из одного потока, поэтому порядок реплик сохраняется, а обработчики не ждут Node.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from utils.logs import getLogger
+from utils.metrics import REGISTRY
+
+
+log = getLogger(__name__)
+
+HANDLER_WAIT_SECONDS = REGISTRY.histogram("handler_wait_seconds", "Сколько задача обработчика ждала в очереди")
+HANDLER_RUN_SECONDS = REGISTRY.histogram("handler_run_seconds", "Время выполнения обработчика события")
+
+
+class EventDispatcher:
+    """Пул потоков для обработчиков событий с сохранением порядка задач внутри одного ключа (например, ника игрока)"""
+    def __init__(self, workers: int = 8, name: str = "handler") -> None:
+        """Пул потоков для обработчиков событий
+
+        Args:
+            workers (int, optional): Сколько задач может выполняться одновременно. Defaults to 8.
+            name (str, optional): Префикс имени потоков. Defaults to "handler".
+        """
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queues: dict[str, deque[tuple[float, Callable, tuple, dict]]] = {}
+        """Ключ -> задачи, ждущие своей очереди. Ключ есть в словаре, пока у него есть выполняющаяся задача"""
+
+        self.queued: int = 0
+        self.running: int = 0
+        self.completed: int = 0
+        self.failed: int = 0
+        self._waitTotal: float = 0.0
+        self._runTotal: float = 0.0
+        self.maxWait: float = 0.0
+        self.maxRun: float = 0.0
+        REGISTRY.gauge("handler_queue_depth", lambda: self.queued, "Задачи обработчиков, ждущие выполнения")
+
+    def submit(self, key: str, fn: Callable, *args, **kwargs):
+        """Поставить задачу в очередь ключа. Вызывается из обработчика события и не блокирует его
+
+        Args:
+            key (str): Ключ порядка (задачи с одним ключом выполняются по очереди)
+            fn (Callable): Функция-обработчик
+        """
+        task = (time.perf_counter(), fn, args, kwargs)
+        with self._lock:
+            self.queued += 1
+            pending = self._queues.get(key)
+            if pending is not None:
+                pending.append(task)
+                return
+            self._queues[key] = deque()
+        self._pool.submit(self._run, key, task)
+
+    def _run(self, key: str, task: tuple[float, Callable, tuple, dict]):
+        while True:
+            submitted, fn, args, kwargs = task
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                fn(*args, **kwargs)
+                failed = False
+            except Exception as e:
+                log.error("handler failed", handler=getattr(fn, "__name__", repr(fn)), error=str(e))
+                failed = True
+            finished = time.perf_counter()
+            handler = getattr(fn, "__name__", "handler")
+            HANDLER_WAIT_SECONDS.observe(started - submitted, handler=handler)
+            HANDLER_RUN_SECONDS.observe(finished - started, handler=handler)
+
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.failed += failed
+                self._waitTotal += started - submitted
+                self._runTotal += finished - started
+                self.maxWait = max(self.maxWait, started - submitted)
+                self.maxRun = max(self.maxRun, finished - started)
+
+                pending = self._queues[key]
+                if not pending:
+                    del self._queues[key]
+                    return
+                task = pending.popleft()
+
+    def queueDepth(self, key: str | None = None) -> int:
+        """Сколько задач ждет выполнения
+
+        Args:
+            key (str | None, optional): Ключ. Если не задан - по всем ключам. Defaults to None.
+
+        Returns:
+            int: Количество ожидающих задач
+        """
+        with self._lock:
+            if key is None:
+                return self.queued
+            pending = self._queues.get(key)
+            return len(pending) if pending is not None else 0
+
+    def stats(self) -> dict[str, float]:
+        """Метрики очереди и времени работы обработчиков
+
+        Returns:
+            dict[str, float]: Глубина очереди, число выполняемых, завершенных и упавших задач, среднее и максимальное ожидание и выполнение в мс
+        """
+        with self._lock:
+            done = self.completed or 1
+            return {
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avgWaitMs": round(self._waitTotal / done * 1000, 2),
+                "maxWaitMs": round(self.maxWait * 1000, 2),
+                "avgRunMs": round(self._runTotal / done * 1000, 2),
+                "maxRunMs": round(self.maxRun * 1000, 2),
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Остановить пул потоков"""
+        self._pool.shutdown(wait=wait)
+
+
+class Outbox:
+    """Потокобезопасная очередь исходящих сообщений бота. Все вызовы `bot.chat`/`bot.whisper` выполняются
+    из одного потока по порядку, с паузой `minInterval` между сообщениями (защита от антиспама сервера).
+
+    У `Outbox` те же методы `chat` и `whisper`, что и у бота, поэтому его можно передавать вместо бота,
+    например в `ChatLineSink.forWhisper`.
+    """
+    def __init__(self, bot, minInterval: float = 0.0) -> None:
+        """Очередь исходящих сообщений бота
+
+        Args:
+            bot (`mineflayer.createBot`): Экземпляр бота
+            minInterval (float, optional): Минимальная пауза между сообщениями в секундах. Defaults to 0.0.
+        """
+        self.bot = bot
+        self.minInterval = minInterval
+        self._queue: queue.Queue[tuple[Callable, tuple] | None] = queue.Queue()
+        self.sent: int = 0
+        self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while (item := self._queue.get()) is not None:
+            fn, args = item
+            try:
+                fn(*args)
+                self.sent += 1
+            except Exception as e:
+                log.warning("send failed", error=str(e))
+            if self.minInterval:
+                time.sleep(self.minInterval)
+
+    def post(self, fn: Callable, *args: Any):
+        """Поставить в очередь произвольный вызов к боту"""
+        self._queue.put((fn, args))
+
+    def whisper(self, username: str, message: str):
+        """Поставить в очередь личное сообщение игроку"""
+        self.post(self.bot.whisper, username, message)
+
+    def chat(self, message: str):
+        """Поставить в очередь сообщение в общий чат"""
+        self.post(self.bot.chat, message)
+
+    @property
+    def depth(self) -> int:
+        """Сколько сообщений ждет отправки"""
+        return self._queue.qsize()
+
+    def close(self):
+        """Отправить оставшиеся сообщения и остановить поток"""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
@@ -0,0 +1,303 @@
+"""Запуск нескольких ботов из одного процесса Python.
+
+Все боты работают через один мост Node, один раз загружают `minecraft-data` для своей версии и делят между собой
+сессию YandexGPT (один пул соединений, один фоновый цикл событий и один менеджер IAM-токена), пул обработчиков
+событий и менеджер историй переписки. На каждого бота приходятся только сам `mineflayer`-бот, его `Movements`,
+исполнитель действий с распознаванием команд, копия инвентаря, снимок мира и очередь исходящих сообщений.
+"""
+import json
+import threading
+import time
+from typing import Any
+
+from javascript import require, On
+
+from ai.breaker import CircuitOpenError
+from utils.actions import ActionExecutor
+from utils.botUtils import BotActions, BotInventory, ChatLineSink, CommandsComparator
+from utils.commands import createComparator
+from utils.worldSnapshot import WorldSnapshotter
+from utils.dispatcher import EventDispatcher, Outbox
+from utils.navigation import NavigationService
+from utils.logs import getLogger
+
+
+log = getLogger(__name__)
+
+
+DEFAULT_BOT_OPTIONS = {
+    "host": "127.0.0.1",
+    "port": "25565",
+    "version": "1.20.4",
+}
+
+
+def loadRoster(filename: str) -> list[dict[str, Any]]:
+    """Прочитать файл со списком ботов
+
+    Файл - JSON вида `{"defaults": {"host": ..., "port": ..., "version": ...}, "bots": [{"name": "_jeb"}, ...]}`
+    или просто список ботов. Значения из `defaults` подставляются в каждого бота, если у него они не заданы.
+
+    Args:
+        filename (str): Путь к файлу
+
+    Returns:
+        list[dict[str, Any]]: Параметры ботов
+    """
+    with open(filename, encoding="utf-8") as file:
+        roster = json.load(file)
+
+    if isinstance(roster, list):
+        roster = {"bots": roster}
+
+    defaults = {**DEFAULT_BOT_OPTIONS, **roster.get("defaults", {})}
+    bots = []
+    for entry in roster["bots"]:
+        if "name" not in entry:
+            raise ValueError(f"В описании бота не указано имя: {entry}")
+        bots.append({**defaults, **entry})
+    return bots
+
+
+class SharedResources:
+    """Ресурсы, общие для всех ботов процесса"""
+    def __init__(self, yagpt=None, chatSessions=None, dispatcher: EventDispatcher | None = None, intentSession=None) -> None:
+        """Ресурсы, общие для всех ботов процесса
+
+        Args:
+            yagpt (`ai.asyncSession.PooledYaGPTSession`, optional): Общая сессия YandexGPT. Если не задана - ИИ отключен. Defaults to None.
+            chatSessions (`ai.history.ChatSessionManager`, optional): Общий менеджер историй переписки. Defaults to None.
+            dispatcher (EventDispatcher | None, optional): Общий пул обработчиков событий. Defaults to None.
+            intentSession (`ai.asyncSession.PooledYaGPTSession`, optional): Общая сессия локальной модели, распознающей команды. Defaults to None.
+        """
+        self.mineflayer = require("mineflayer")
+        self.pathfinder = require("mineflayer-pathfinder")
+        self._minecraftData = require("minecraft-data")
+        self._mcData: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+        self.yagpt = yagpt
+        self.chatSessions = chatSessions
+        self.intentSession = intentSession
+        self.dispatcher = dispatcher or EventDispatcher()
+
+    def mcData(self, version: str):
+        """Данные `minecraft-data` для версии. Загружаются один раз на весь процесс"""
+        with self._lock:
+            if version not in self._mcData:
+                self._mcData[version] = self._minecraftData(version)
+            return self._mcData[version]
+
+
+class BotAgent:
+    """Один бот флота: подключение, обработчики событий и состояние для отчета о здоровье"""
+    def __init__(self, options: dict[str, Any], shared: SharedResources, reconnectDelay: float | None = 10.0, chatInterval: float = 0.0) -> None:
+        """Один бот флота
+
+        Args:
+            options (dict[str, Any]): Параметры бота из файла со списком ботов (`name`, `host`, `port`, `version`)
+            shared (SharedResources): Общие ресурсы процесса
+            reconnectDelay (float | None, optional): Через сколько секунд переподключаться после отключения. `None` - не переподключаться. Defaults to 10.0.
+            chatInterval (float, optional): Минимальная пауза между сообщениями бота в секундах. Defaults to 0.0.
+        """
+        self.options = options
+        self.name: str = options["name"]
+        self.shared = shared
+        self.reconnectDelay = reconnectDelay
+        self.chatInterval = chatInterval
+
+        self.bot = None
+        self.botActions: BotActions | None = None
+        self.executor: ActionExecutor | None = None
+        self.comparator: CommandsComparator | None = None
+        self.navigation: NavigationService | None = None
+        self.botInventory: BotInventory | None = None
+        self.world: WorldSnapshotter | None = None
+        self.outbox: Outbox | None = None
+
+        self.status: str = "created"
+        self.lastError: str | None = None
+        self.connects: int = 0
+        self.connectedAt: float | None = None
+        self.spawnedAt: float | None = None
+        self.spawnTime: float | None = None
+        """Сколько секунд прошло от подключения до первого появления в мире"""
+        self.handled: int = 0
+
+    def connect(self):
+        """Создать бота и подписаться на его события"""
+        self.status = "connecting"
+        self.connects += 1
+        self.connectedAt = time.monotonic()
+        self.spawnedAt = None
+        self.botInventory = None
+
+        bot = self.bot = self.shared.mineflayer.createBot({
+            "host": self.options["host"],
+            "port": str(self.options["port"]),
+            "username": self.name,
+            "version": self.options["version"],
+        })
+        mcData = self.shared.mcData(self.options["version"])
+
+        bot.loadPlugin(self.shared.pathfinder.pathfinder)
+        self.world = WorldSnapshotter(bot, interval=float(self.options.get("snapshotInterval", 1.0)))
+        self.navigation = NavigationService(bot, mcData, world=self.world)
+
+        self.botActions = BotActions(bot, self.navigation.movements("default"), self.navigation)
+        if self.executor is not None:
+            self.executor.stop()
+        # у каждого бота свой исполнитель, поэтому "стоп" одному боту не прерывает действия остальных
+        self.executor = ActionExecutor(self.botActions).start()
+        self.comparator = createComparator(self.botActions, self.executor)
+        if self.outbox is not None:
+            self.outbox.close()
+        self.outbox = Outbox(bot, minInterval=self.chatInterval)
+
+        @On(bot, "spawn")
+        def spawnHandler(*args):
+            if self.botInventory is None:
+                self.botInventory = BotInventory(bot, mcData)
+                self.world.start() # type: ignore
+                self.spawnedAt = time.monotonic()
+                self.spawnTime = self.spawnedAt - self.connectedAt # type: ignore
+            self.status = "online"
+
+        @On(bot, "chat")
+        def chatHandler(this, username: str, message: str, *args):
+            if username != self.name:
+                self.outbox.whisper(username, f"Напиши мне командой `/tell {self.name} <твое_сообщение>` и тогда я смогу помочь!") # type: ignore
+
+        @On(bot, "whisper")
+        def whisperHandler(this, username: str, message: str, *args):
+            # известные команды сразу уходят исполнителю действий, не дожидаясь ответов нейросети на прошлые сообщения
+            reply = self.comparator.replyLocal(message, username=username) # type: ignore
+            if reply is not None:
+                self.outbox.whisper(username, reply) # type: ignore
+                return
+            self.shared.dispatcher.submit(f"{self.name}:{username}", self.handleWhisper, username, message)
+
+        @On(bot, "kicked")
+        def kickedHandler(this, reason, *args):
+            self.lastError = f"kicked: {reason}"
+
+        @On(bot, "error")
+        def errorHandler(this, error, *args):
+            self.lastError = str(error)
+
+        @On(bot, "end")
+        def endHandler(*args):
+            self.status = "offline"
+            if self.world is not None:
+                self.world.stop()
+            if self.reconnectDelay is not None:
+                threading.Timer(self.reconnectDelay, self.connect).start()
+
+    def handleWhisper(self, username: str, message: str):
+        """Обработка личного сообщения игрока в пуле потоков. Сообщения одного игрока одному боту обрабатываются по очереди"""
+        self.handled += 1
+        if self.shared.yagpt is None:
+            self.outbox.chat("При запуске бота Вы отключили запросы к YandexGPT, указав необязательную опцию --disableAi.\n\nПожалуйста, перезапустите бота без использования этой опции") # type: ignore
+            return
+
+        # у каждого бота своя история переписки с игроком
+        history = self.shared.chatSessions.get(f"{self.name}:{username}") # type: ignore
+        sink = ChatLineSink.forWhisper(self.outbox, username)
+        try:
+            if self.shared.intentSession is not None:
+                # перефразированную команду распознает локальная модель, и запрос к основной не нужен
+                reply = self.comparator.compareIntent(message, self.shared.intentSession, username=username) # type: ignore
+                if reply is not None:
+                    self.outbox.whisper(username, reply()) # type: ignore
+                    return
+            self.shared.yagpt.askStreamFuture(message, sink.feed, history=history).result()
+            sink.flush()
+        except CircuitOpenError:
+            # модель недоступна: команда ищется с ослабленным порогом, а игрок сразу получает заготовленный ответ
+            self.outbox.whisper(username, self.comparator.compareDegraded(message, username=username)()) # type: ignore
+        except Exception as e:
+            log.error("reply failed", bot=self.name, username=username, error=str(e))
+            self.outbox.whisper(username, "Прости, не могу тебе ответить") # type: ignore
+
+    def health(self) -> dict[str, Any]:
+        """Состояние бота для отчета
+
+        Returns:
+            dict[str, Any]: Статус, число подключений, время до появления в мире, здоровье и сытость, задержка, последняя ошибка
+        """
+        report: dict[str, Any] = {
+            "status": self.status,
+            "connects": self.connects,
+            "spawnTime": round(self.spawnTime, 2) if self.spawnTime is not None else None,
+            "uptime": round(time.monotonic() - self.spawnedAt, 1) if self.spawnedAt is not None and self.status == "online" else 0,
+            "handled": self.handled,
+            "outbox": self.outbox.depth if self.outbox is not None else 0,
+            "lastError": self.lastError,
+        }
+        if self.navigation is not None:
+            navigation = self.navigation.report()
+            report["replans"] = navigation["replans"]
+            report["avgPlanningMs"] = navigation["avgPlanningMs"]
+        if self.executor is not None:
+            action = self.executor.current
+            report["action"] = action.name if action is not None else None
+        # здоровье и задержка берутся из последнего снимка мира, без отдельных вызовов моста
+        snapshot = self.world.latest if self.world is not None else None
+        if self.status == "online" and snapshot is not None:
+            report["health"] = snapshot.bot["health"]
+            report["food"] = snapshot.bot["food"]
+            report["ping"] = snapshot.players.get(self.name, {}).get("ping")
+        return report
+
+
+class Fleet:
+    """Группа ботов с общими ресурсами и поочередным подключением"""
+    def __init__(self, roster: list[dict[str, Any]], shared: SharedResources, stagger: float = 2.0, reconnectDelay: float | None = 10.0, chatInterval: float = 0.0) -> None:
+        """Группа ботов с общими ресурсами
+
+        Args:
+            roster (list[dict[str, Any]]): Параметры ботов (см. `loadRoster`)
+            shared (SharedResources): Общие ресурсы процесса
+            stagger (float, optional): Пауза между подключениями ботов в секундах, чтобы не упереться в ограничение сервера на частоту входов. Defaults to 2.0.
+            reconnectDelay (float | None, optional): Через сколько секунд переподключать бота после отключения. `None` - не переподключать. Defaults to 10.0.
+            chatInterval (float, optional): Минимальная пауза между сообщениями одного бота в секундах. Defaults to 0.0.
+        """
+        names = [options["name"] for options in roster]
+        if len(names) != len(set(names)):
+            raise ValueError("Имена ботов в списке должны быть уникальными")
+
+        self.shared = shared
+        self.stagger = stagger
+        self.agents: dict[str, BotAgent] = {
+            options["name"]: BotAgent(options, shared, reconnectDelay=reconnectDelay, chatInterval=chatInterval)
+            for options in roster
+        }
+
+    def start(self):
+        """Подключить ботов по одному с паузой `stagger`. Блокирует вызывающий поток до подключения последнего бота"""
+        for i, agent in enumerate(self.agents.values()):
+            if i:
+                time.sleep(self.stagger)
+            try:
+                agent.connect()
+            except Exception as e:
+                agent.status = "failed"
+                agent.lastError = str(e)
+                log.error("connect failed", bot=agent.name, error=str(e))
+
+    def health(self) -> dict[str, Any]:
+        """Отчет о состоянии всех ботов и общих ресурсов
+
+        Returns:
+            dict[str, Any]: `bots` - состояние каждого бота, `online` - сколько ботов в мире, `dispatcher` - метрики пула обработчиков
+        """
+        bots = {name: agent.health() for name, agent in self.agents.items()}
+        report: dict[str, Any] = {
+            "online": sum(1 for h in bots.values() if h["status"] == "online"),
+            "total": len(bots),
+            "bots": bots,
+            "dispatcher": self.shared.dispatcher.stats(),
+        }
+        if self.shared.chatSessions is not None:
+            report["chatSessions"] = len(self.shared.chatSessions)
+        return report
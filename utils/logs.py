@@ -0,0 +1,79 @@
+"""Структурированные логи процесса бота на structlog с уровнями и ограничением частоты.
+
+Уровень задается переменной окружения `LOG_LEVEL` (по умолчанию `info`). Одно и то же событие одного логгера
+пишется не чаще `LOG_RATE` раз за `LOG_RATE_WINDOW` секунд, остальные отбрасываются, а их количество
+дописывается к следующей записи полем `suppressed`.
+
+    log = getLogger(__name__)
+    log.debug("request", messages=3, bytes=1024)
+"""
+import logging
+import os
+import threading
+import time
+
+import structlog
+
+from utils.dotenvLoader import loadDotEnv
+
+
+class RateLimiter:
+    """Процессор structlog, ограничивающий частоту одинаковых событий"""
+    def __init__(self, limit: int = 20, window: float = 10.0) -> None:
+        """Ограничение частоты одинаковых событий
+
+        Args:
+            limit (int, optional): Сколько записей одного события пропускать за окно. Defaults to 20.
+            window (float, optional): Длина окна в секундах. Defaults to 10.0.
+        """
+        self.limit = limit
+        self.window = window
+        self._windows: dict[tuple[str, str], list[float | int]] = {}
+        """(логгер, событие) -> [начало окна, записано за окно, отброшено]"""
+        self._lock = threading.Lock()
+
+    def __call__(self, logger, methodName: str, eventDict: dict) -> dict:
+        key = (eventDict.get("logger", ""), str(eventDict.get("event", "")))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state is not None else 0
+                state = self._windows[key] = [now, 0, 0]
+                if suppressed:
+                    eventDict["suppressed"] = suppressed
+            if state[1] >= self.limit:
+                state[2] += 1
+                raise structlog.DropEvent
+            state[1] += 1
+        return eventDict
+
+
+def configure(level: str | None = None, json: bool = False):
+    """Настроить structlog для всего процесса
+
+    Args:
+        level (str | None, optional): Минимальный уровень (`debug`, `info`, `warning`, `error`). Defaults to `LOG_LEVEL` или `info`.
+        json (bool, optional): Писать записи в JSON вместо человекочитаемого вида. Defaults to False.
+    """
+    level = (level or os.environ.get("LOG_LEVEL") or "info").upper()
+    structlog.configure(
+        processors=[
+            structlog.processors.add_log_level,
+            RateLimiter(int(os.environ.get("LOG_RATE") or 20), float(os.environ.get("LOG_RATE_WINDOW") or 10)),
+            structlog.processors.TimeStamper(fmt="%H:%M:%S"),
+            structlog.processors.JSONRenderer(ensure_ascii=False) if json else structlog.dev.ConsoleRenderer(colors=False),
+        ],
+        wrapper_class=structlog.make_filtering_bound_logger(logging.getLevelName(level)),
+        cache_logger_on_first_use=True,
+    )
+
+
+def getLogger(name: str):
+    """Логгер с именем модуля в поле `logger`"""
+    return structlog.get_logger().bind(logger=name)
+
+
+# уровень и частота могут быть заданы в .env, поэтому он загружается до настройки
+loadDotEnv()
+configure()
@@ -0,0 +1,304 @@
+"""Легкие метрики процесса бота: счетчики, гистограммы и таймеры.
+
+Метрики регистрируются в общем реестре `REGISTRY` и отдаются в текстовом формате Prometheus по HTTP
+(`REGISTRY.serve`) и/или периодически сбрасываются в JSON файл (`REGISTRY.startJsonDump`).
+
+    REQUESTS = REGISTRY.counter("ai_requests_total", "Запросы к языковой модели")
+    REQUESTS.inc(status=200)
+
+    with REGISTRY.histogram("compare_seconds", "Время сравнения команды").time():
+        ...
+"""
+import bisect
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Iterator
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+"""Границы корзин гистограммы по умолчанию в секундах"""
+
+
+def _labelsKey(labels: dict[str, Any]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _formatLabels(key: tuple[tuple[str, str], ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Монотонно растущий счетчик с метками"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str = "") -> None:
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any):
+        """Увеличить счетчик для набора меток"""
+        key = _labelsKey(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        """Текущее значение для набора меток"""
+        with self._lock:
+            return self._values.get(_labelsKey(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_formatLabels(key)} {value}" for key, value in self._values.items()]
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return {_formatLabels(key) or "": value for key, value in self._values.items()}
+
+
+class Gauge:
+    """Значение, которое считывается функцией в момент сбора метрик (например, глубина очереди)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, fn: Callable[[], float], help: str = "") -> None:
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def _read(self) -> float | None:
+        try:
+            return float(self.fn())
+        except Exception:
+            return None
+
+    def render(self) -> list[str]:
+        value = self._read()
+        return [] if value is None else [f"{self.name} {value}"]
+
+    def snapshot(self) -> dict[str, float | None]:
+        return {"": self._read()}
+
+
+class _HistogramSeries:
+    __slots__ = ("buckets", "count", "sum", "max")
+
+    def __init__(self, size: int) -> None:
+        self.buckets = [0] * size
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram:
+    """Распределение значений (обычно длительностей в секундах) по корзинам с метками"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str = "", buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.bounds = tuple(sorted(buckets))
+        self._series: dict[tuple, _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any):
+        """Добавить наблюдение"""
+        key = _labelsKey(labels)
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.bounds) + 1)
+            series.buckets[index] += 1
+            series.count += 1
+            series.sum += value
+            if value > series.max:
+                series.max = value
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Замерить длительность блока `with`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def timed(self, **labels: Any) -> Callable[[Callable], Callable]:
+        """Декоратор, замеряющий длительность вызовов функции"""
+        def decorator(f: Callable) -> Callable:
+            @functools.wraps(f)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.bounds, series.buckets):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_formatLabels(key, (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_formatLabels(key, (('le', '+Inf'),))} {series.count}")
+                lines.append(f"{self.name}_sum{_formatLabels(key)} {series.sum}")
+                lines.append(f"{self.name}_count{_formatLabels(key)} {series.count}")
+        return lines
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {
+                _formatLabels(key) or "": {
+                    "count": series.count,
+                    "sum": round(series.sum, 6),
+                    "avg": round(series.sum / series.count, 6) if series.count else 0.0,
+                    "max": round(series.max, 6),
+                }
+                for key, series in self._series.items()
+            }
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса. Повторная регистрация метрики с тем же именем возвращает существующую"""
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self._lock = threading.Lock()
+        self._dumpStop = threading.Event()
+
+    def _register(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        """Получить или создать счетчик"""
+        return self._register(name, lambda: Counter(name, help))
+
+    def histogram(self, name: str, help: str = "", buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """Получить или создать гистограмму"""
+        return self._register(name, lambda: Histogram(name, help, buckets))
+
+    def gauge(self, name: str, fn: Callable[[], float], help: str = "") -> Gauge:
+        """Зарегистрировать значение, которое считывается функцией `fn`. Повторная регистрация заменяет функцию"""
+        gauge: Gauge = self._register(name, lambda: Gauge(name, fn, help))
+        gauge.fn = fn
+        return gauge
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, Any]:
+        """Все метрики в виде словаря для JSON"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {"time": time.time(), "metrics": {metric.name: metric.snapshot() for metric in metrics}}
+
+    def dumpJson(self, filename: str):
+        """Записать снимок метрик в JSON файл (атомарно, через временный файл)"""
+        tmp = f"{filename}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file, ensure_ascii=False)
+        os.replace(tmp, filename)
+
+    def startJsonDump(self, filename: str, interval: float = 30.0) -> threading.Thread:
+        """Периодически записывать снимок метрик в JSON файл в фоновом потоке
+
+        Args:
+            filename (str): Путь к файлу
+            interval (float, optional): Интервал записи в секундах. Defaults to 30.0.
+        """
+        def run():
+            while not self._dumpStop.wait(interval):
+                try:
+                    self.dumpJson(filename)
+                except OSError:
+                    pass
+
+        thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        thread.start()
+        return thread
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9100) -> threading.Thread:
+        """Поднять HTTP сервер с метриками в фоновом потоке: `/metrics` (Prometheus) и `/metrics.json`.
+        Используются FastAPI и uvicorn, а если они не установлены - `http.server` из стандартной библиотеки
+
+        Args:
+            host (str, optional): Адрес. Defaults to "127.0.0.1".
+            port (int, optional): Порт. Defaults to 9100.
+        """
+        try:
+            target = self._fastApiServer(host, port)
+        except ModuleNotFoundError:
+            target = self._stdlibServer(host, port)
+        thread = threading.Thread(target=target, name="metrics-http", daemon=True)
+        thread.start()
+        return thread
+
+    def _fastApiServer(self, host: str, port: int) -> Callable[[], Any]:
+        import uvicorn
+        from fastapi import FastAPI
+        from fastapi.responses import JSONResponse, PlainTextResponse
+
+        app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+        @app.get("/metrics", response_class=PlainTextResponse)
+        def metrics():
+            return PlainTextResponse(self.render(), media_type="text/plain; version=0.0.4")
+
+        @app.get("/metrics.json")
+        def metricsJson():
+            return JSONResponse(self.snapshot())
+
+        return uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning")).run
+
+    def _stdlibServer(self, host: str, port: int) -> Callable[[], Any]:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, contentType = registry.render().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, contentType = json.dumps(registry.snapshot(), ensure_ascii=False).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", contentType)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return ThreadingHTTPServer((host, port), Handler).serve_forever
+
+    def stop(self):
+        """Остановить периодическую запись в JSON"""
+        self._dumpStop.set()
+
+
+REGISTRY = MetricsRegistry()
+"""Общий реестр метрик процесса"""
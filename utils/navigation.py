@@ -0,0 +1,222 @@
+"""Навигация бота поверх `mineflayer-pathfinder` с повторным использованием настроек и целей.
+
+`NavigationService` держит по одному настроенному `Movements` на профиль (например, с копанием и без) и меняет его у
+pathfinder только при смене профиля. Повторная команда с той же целью (или с целью, сдвинувшейся меньше чем на
+`debounceDistance` блоков) не вызывает `setGoal`, поэтому pathfinder продолжает идти по уже построенному пути, а не
+пересчитывает его на стороне Node. Если передан `WorldSnapshotter`, повторная команда следовать за игроком проверяется
+по снимку мира и не обращается к прокси игрока вовсе.
+"""
+import threading
+from typing import Any
+
+from utils.worldSnapshot import WorldSnapshotter, distance
+
+
+MOVEMENT_PROFILES: dict[str, dict[str, Any]] = {
+    "default": {"canDig": False},
+    "dig": {"canDig": True},
+    "careful": {"canDig": False, "allowParkour": False, "allowSprinting": False},
+}
+"""Профиль -> значения полей `pathfinder.Movements`"""
+
+
+class NavigationService:
+    """Движение бота к целям с кэшем `Movements` по профилям, подавлением лишних смен цели и метриками планирования"""
+    def __init__(
+                    self,
+                    bot,
+                    mcData,
+                    profiles: dict[str, dict[str, Any]] | None = None,
+                    debounceDistance: float = 1.5,
+                    thinkTimeout: int | None = None,
+                    subscribe: bool = True,
+                    world: WorldSnapshotter | None = None,
+                ) -> None:
+        """Навигация бота
+
+        Args:
+            bot (`mineflayer.createBot`): Экземпляр бота с загруженным плагином pathfinder
+            mcData (`minecraft-data`): Данные игры для версии бота
+            profiles (dict[str, dict[str, Any]] | None, optional): Профили движения. Defaults to `MOVEMENT_PROFILES`.
+            debounceDistance (float, optional): На сколько блоков должна сдвинуться цель, чтобы путь строился заново. Defaults to 1.5.
+            thinkTimeout (int | None, optional): Предел времени на построение пути в мс (`bot.pathfinder.thinkTimeout`). Defaults to None.
+            subscribe (bool, optional): Подписаться на события pathfinder для сбора метрик. Defaults to True.
+            world (WorldSnapshotter | None, optional): Снимки мира, по которым ищется сущность игрока без вызовов моста. Defaults to None.
+        """
+        from javascript import require
+        self._pathfinder = require("mineflayer-pathfinder")
+
+        self.bot = bot
+        self.mcData = mcData
+        self.profiles = profiles or MOVEMENT_PROFILES
+        self.debounceDistance = debounceDistance
+        self.world = world
+        if thinkTimeout is not None:
+            bot.pathfinder.thinkTimeout = thinkTimeout
+
+        self._movements: dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.activeProfile: str | None = None
+        self.goal: tuple | None = None
+        """Описание текущей цели: `("follow", username, range, entityId)` или `("goto", {x, y, z}, range)`. Меняется под `_lock`"""
+
+        self.stats: dict[str, float] = {
+            "goals": 0,
+            "debounced": 0,
+            "profileSwitches": 0,
+            "replans": 0,
+            "noPath": 0,
+            "planningMs": 0.0,
+            "maxPlanningMs": 0.0,
+            "reached": 0,
+        }
+        """`goals` - сколько раз цель передана в pathfinder, `debounced` - сколько раз повторная цель отброшена,
+        `replans` - сколько раз pathfinder строил путь, `planningMs` - суммарное время построения путей"""
+
+        if subscribe:
+            self._subscribe()
+
+    def _subscribe(self):
+        from javascript import On
+
+        @On(self.bot, "path_update")
+        def pathUpdateHandler(this, results, *args):
+            status, planning = results.status, float(results.time or 0)
+            with self._lock:
+                self.stats["replans"] += 1
+                self.stats["planningMs"] += planning
+                self.stats["maxPlanningMs"] = max(self.stats["maxPlanningMs"], planning)
+                if status == "noPath":
+                    self.stats["noPath"] += 1
+
+        @On(self.bot, "goal_reached")
+        def goalReachedHandler(this, *args):
+            with self._lock:
+                self.stats["reached"] += 1
+                # GoalFollow динамическая и не завершается, остальные цели после достижения забываются
+                if self.goal is not None and self.goal[0] != "follow":
+                    self.goal = None
+
+    def movements(self, profile: str = "default"):
+        """Настроенный `Movements` для профиля. Создается один раз
+
+        Args:
+            profile (str, optional): Имя профиля из `profiles`. Defaults to "default".
+        """
+        with self._lock:
+            if profile not in self._movements:
+                movements = self._pathfinder.Movements(self.bot, self.mcData)
+                for field, value in self.profiles[profile].items():
+                    setattr(movements, field, value)
+                self._movements[profile] = movements
+            return self._movements[profile]
+
+    def useProfile(self, profile: str = "default"):
+        """Сделать профиль активным. `setMovements` вызывается только при смене профиля"""
+        movements = self.movements(profile)
+        if self.activeProfile != profile:
+            self.bot.pathfinder.setMovements(movements)
+            self.activeProfile = profile
+            self.stats["profileSwitches"] += 1
+
+    def _setGoal(self, goal: tuple, jsGoal, dynamic: bool = False):
+        # вызов моста идет без блокировки: события pathfinder, пришедшие во время него, тоже берут `_lock`
+        self.bot.pathfinder.setGoal(jsGoal, dynamic)
+        with self._lock:
+            self.goal = goal
+            self.stats["goals"] += 1
+
+    def _debounced(self) -> bool:
+        with self._lock:
+            self.stats["debounced"] += 1
+        return True
+
+    def follow(self, username: str, distance: float = 1, profile: str = "default") -> bool:
+        """Следовать за игроком. Повторная команда следовать за той же сущностью игрока не перестраивает путь.
+        После возрождения у игрока новая сущность, поэтому цель выставляется заново
+
+        Args:
+            username (str): Ник игрока
+            distance (float, optional): На каком расстоянии держаться от игрока. Defaults to 1.
+            profile (str, optional): Профиль движения. Defaults to "default".
+
+        Returns:
+            bool: False, если игрока не видно
+        """
+        self.useProfile(profile)
+        if self.world is not None:
+            # сущность игрока берется из снимка: повторная команда отбрасывается без единого вызова моста
+            player = self.world.get(self.world.interval * 2).players.get(username)
+            entityId = player["entityId"] if player else None
+            if entityId is None:
+                return False
+            with self._lock:
+                same = self.goal == ("follow", username, distance, entityId)
+            if same:
+                return self._debounced()
+
+        player = self.bot.players[username]
+        target = player.entity if player else None
+        if not target:
+            return False
+
+        goal = ("follow", username, distance, target.id)
+        # GoalFollow динамическая: pathfinder сам подстраивает путь под движение игрока, пока цель не сброшена
+        with self._lock:
+            same = self.goal == goal
+        if same:
+            return self._debounced()
+        self._setGoal(goal, self._pathfinder.goals.GoalFollow(target, distance), True)
+        return True
+
+    def goto(self, position: dict, distance: float = 1, profile: str = "default") -> bool:
+        """Дойти до точки. Если новая точка почти совпадает с текущей целью, путь не перестраивается
+
+        Args:
+            position (dict): Позиция `{x, y, z}` (например, из `WorldSnapshot`)
+            distance (float, optional): На каком расстоянии от точки можно остановиться. Defaults to 1.
+            profile (str, optional): Профиль движения. Defaults to "default".
+
+        Returns:
+            bool: True, если цель передана в pathfinder, False - если отброшена как повторная
+        """
+        self.useProfile(profile)
+        with self._lock:
+            current = self.goal
+        if current is not None and current[0] == "goto" and current[2] == distance \
+                and self.distanceToGoal(position) < self.debounceDistance:
+            self._debounced()
+            return False
+
+        goal = ("goto", dict(position), distance)
+        self._setGoal(goal, self._pathfinder.goals.GoalNear(position["x"], position["y"], position["z"], distance))
+        return True
+
+    def distanceToGoal(self, position: dict) -> float:
+        """Расстояние от позиции до текущей цели `goto`"""
+        with self._lock:
+            goal = self.goal
+        if goal is None or goal[0] != "goto":
+            return float("inf")
+        return distance(goal[1], position)
+
+    def stop(self):
+        """Сбросить цель. Профиль движения остается прежним, поэтому следующая цель не требует `setMovements`"""
+        with self._lock:
+            goal, self.goal = self.goal, None
+        if goal is not None or self.bot.pathfinder.isMoving():
+            self.bot.pathfinder.setGoal(None)
+
+    def report(self) -> dict[str, Any]:
+        """Метрики навигации
+
+        Returns:
+            dict[str, Any]: Счетчики из `stats`, среднее время построения пути, активный профиль и текущая цель
+        """
+        with self._lock:
+            report: dict[str, Any] = dict(self.stats)
+            goal = self.goal
+        report["avgPlanningMs"] = round(report["planningMs"] / report["replans"], 2) if report["replans"] else 0.0
+        report["activeProfile"] = self.activeProfile
+        report["goal"] = list(goal) if goal else None
+        return report
@@ -0,0 +1,98 @@
+"""Замер времени запуска бота по этапам.
+
+Этапы бывают последовательные (`phase`) и фоновые (`background`), которые выполняются в отдельном потоке
+параллельно с подключением к серверу. Отчет печатается один раз, обычно после первого появления бота в мире.
+"""
+import concurrent.futures
+import contextlib
+import threading
+import time
+from typing import Any, Callable, Iterator
+
+
+PROCESS_STARTED = time.perf_counter()
+"""Момент импорта модуля. Импортируйте его первым, чтобы в отчет попало и время импортов"""
+
+
+class StartupProfiler:
+    """Собирает длительность этапов запуска и печатает их разбивку"""
+    def __init__(self, enabled: bool = False) -> None:
+        """Замер времени запуска по этапам
+
+        Args:
+            enabled (bool, optional): Печатать ли отчет. Этапы замеряются всегда, это дешево. Defaults to False.
+        """
+        self.enabled = enabled
+        self.phases: list[tuple[str, float, float, str]] = []
+        """Этапы: имя, начало и конец относительно `PROCESS_STARTED` в секундах, поток"""
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def _record(self, name: str, started: float, finished: float):
+        with self._lock:
+            self.phases.append((name, started - PROCESS_STARTED, finished - PROCESS_STARTED, threading.current_thread().name))
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Замерить этап, выполняющийся в текущем потоке
+
+        Args:
+            name (str): Название этапа
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, started, time.perf_counter())
+
+    def mark(self, name: str, since: float = PROCESS_STARTED):
+        """Записать этап, который начался в `since` и закончился сейчас (например, ожидание события)
+
+        Args:
+            name (str): Название этапа
+            since (float, optional): Начало этапа по `time.perf_counter()`. Defaults to PROCESS_STARTED.
+        """
+        self._record(name, since, time.perf_counter())
+
+    def background(self, name: str, fn: Callable[[], Any]) -> concurrent.futures.Future:
+        """Выполнить этап в отдельном потоке
+
+        Args:
+            name (str): Название этапа (и потока)
+            fn (Callable[[], Any]): Работа этапа
+
+        Returns:
+            concurrent.futures.Future: Результат `fn`
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+
+        def run():
+            with self.phase(name):
+                try:
+                    future.set_result(fn())
+                except BaseException as e:
+                    future.set_exception(e)
+
+        threading.Thread(target=run, name=name, daemon=True).start()
+        return future
+
+    def report(self) -> str:
+        """Разбивка запуска по этапам в порядке начала
+
+        Returns:
+            str: Таблица этапов
+        """
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        lines = [f"{'этап':<24}{'начало, мс':>12}{'длительность, мс':>18}  поток"]
+        for name, started, finished, thread in phases:
+            lines.append(f"{name:<24}{started * 1000:>12.1f}{(finished - started) * 1000:>18.1f}  {thread}")
+        total = max((p[2] for p in phases), default=0.0)
+        lines.append(f"{'всего':<24}{'':>12}{total * 1000:>18.1f}")
+        return "\n".join(lines)
+
+    def printReport(self):
+        """Напечатать отчет один раз, если профилирование включено"""
+        if self.enabled and not self._reported:
+            self._reported = True
+            print(self.report())
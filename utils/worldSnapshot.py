@@ -0,0 +1,201 @@
+"""Пакетные запросы к миру через мост JSPyBridge.
+
+Каждое обращение к полю JS-объекта (`bot.players[name].entity.position.x`) - это отдельный вызов в процесс Node.
+Здесь все нужные данные собираются на стороне Node одной JS функцией и приходят в Python одним вызовом
+в виде обычных словарей и списков.
+"""
+import math
+import threading
+import time
+from typing import Callable
+
+from utils.botUtils import JS_ITEM_TO_JSON, describeItem, evalJson
+from utils.logs import getLogger
+from utils.metrics import REGISTRY
+
+
+log = getLogger(__name__)
+
+SNAPSHOT_SECONDS = REGISTRY.histogram("world_snapshot_seconds", "Время снимка мира вместе с вызовом моста")
+
+
+JS_SNAPSHOT = """
+const toJson = %(item)s;
+const pos = (p) => p && ({x: p.x, y: p.y, z: p.z});
+const me = bot.entity;
+const radius = %(radius)s;
+const players = {};
+for (const [name, player] of Object.entries(bot.players)) {
+    players[name] = {username: name, uuid: player.uuid, ping: player.ping, entityId: player.entity ? player.entity.id : null, position: pos(player.entity && player.entity.position)};
+}
+const entities = [];
+for (const entity of Object.values(bot.entities)) {
+    if (!me || entity === me) continue;
+    const distance = entity.position.distanceTo(me.position);
+    if (distance > radius) continue;
+    entities.push({id: entity.id, type: entity.type, name: entity.name, username: entity.username ?? null, position: pos(entity.position), distance: distance});
+}
+return {
+    time: Date.now(),
+    bot: {
+        username: bot.username, health: bot.health, food: bot.food, foodSaturation: bot.foodSaturation,
+        position: pos(me && me.position), yaw: me ? me.yaw : null, pitch: me ? me.pitch : null,
+        heldItem: toJson(bot.heldItem), dimension: bot.game ? bot.game.dimension : null,
+    },
+    players: players,
+    entities: entities,
+    inventory: bot.inventory ? bot.inventory.slots.map(toJson).filter(Boolean) : [],
+};
+"""
+"""JS функция снимка мира. Подставляются `item` (сериализация предмета) и `radius` (радиус сбора сущностей)"""
+
+
+def distance(a: dict | None, b: dict | None) -> float:
+    """Расстояние между двумя позициями из снимка
+
+    Args:
+        a (dict | None): Позиция `{x, y, z}`
+        b (dict | None): Позиция `{x, y, z}`
+
+    Returns:
+        float: Расстояние в блоках или `inf`, если одной из позиций нет
+    """
+    if not a or not b:
+        return math.inf
+    return math.dist((a["x"], a["y"], a["z"]), (b["x"], b["y"], b["z"]))
+
+
+class WorldSnapshot:
+    """Неизменяемый снимок мира вокруг бота в виде обычных данных Python"""
+    def __init__(self, data: dict) -> None:
+        self.data = data
+        self.time: float = data["time"] / 1000
+        """Время снимка на стороне Node (секунды unix)"""
+        self.bot: dict = data["bot"]
+        self.players: dict[str, dict] = data["players"]
+        self.entities: list[dict] = data["entities"]
+        self.inventory: list[dict] = [describeItem(item) for item in data["inventory"]]
+
+    @property
+    def position(self) -> dict | None:
+        """Позиция бота"""
+        return self.bot["position"]
+
+    def playerPosition(self, username: str) -> dict | None:
+        """Позиция игрока, если он в зоне видимости бота
+
+        Args:
+            username (str): Ник игрока
+
+        Returns:
+            dict | None: Позиция `{x, y, z}` или `None`
+        """
+        player = self.players.get(username)
+        return player["position"] if player else None
+
+    def entitiesWithin(self, radius: float, predicate: Callable[[dict], bool] | None = None) -> list[dict]:
+        """Сущности в радиусе от бота, от ближайшей к самой дальней
+
+        Args:
+            radius (float): Радиус в блоках
+            predicate (Callable[[dict], bool] | None, optional): Дополнительный фильтр. Defaults to None.
+
+        Returns:
+            list[dict]: Данные сущностей
+        """
+        found = [e for e in self.entities if e["distance"] <= radius and (predicate is None or predicate(e))]
+        return sorted(found, key=lambda e: e["distance"])
+
+    def nearestEntity(self, predicate: Callable[[dict], bool] | None = None) -> dict | None:
+        """Ближайшая к боту сущность
+
+        Args:
+            predicate (Callable[[dict], bool] | None, optional): Фильтр, например `lambda e: e["type"] == "hostile"`. Defaults to None.
+
+        Returns:
+            dict | None: Данные сущности или `None`
+        """
+        return next(iter(self.entitiesWithin(math.inf, predicate)), None)
+
+    def age(self) -> float:
+        """Сколько секунд прошло с момента снимка"""
+        return time.time() - self.time
+
+
+class WorldSnapshotter:
+    """Снимает мир вокруг бота одним вызовом моста и, при необходимости, обновляет снимок в фоне с заданным интервалом"""
+    def __init__(self, bot, interval: float = 1.0, entityRadius: float = 32) -> None:
+        """Снимает мир вокруг бота одним вызовом моста
+
+        Args:
+            bot (`mineflayer.createBot`): Экземпляр бота
+            interval (float, optional): Интервал фонового обновления в секундах. Defaults to 1.0.
+            entityRadius (float, optional): В каком радиусе от бота собирать сущности. Defaults to 32.
+        """
+        self.bot = bot
+        self.interval = interval
+        self.entityRadius = entityRadius
+        self._code = JS_SNAPSHOT % {"item": JS_ITEM_TO_JSON, "radius": float(entityRadius)}
+
+        self.latest: WorldSnapshot | None = None
+        """Последний снятый снимок"""
+        self.snapshotCount: int = 0
+        self.lastDuration: float = 0.0
+        """Сколько секунд занял последний снимок вместе с вызовом моста"""
+
+        self._stopEvent = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def snapshot(self) -> WorldSnapshot:
+        """Снять мир прямо сейчас
+
+        Returns:
+            WorldSnapshot: Новый снимок
+        """
+        start = time.perf_counter()
+        snapshot = WorldSnapshot(evalJson(self._code, self.bot)) # type: ignore
+        self.lastDuration = time.perf_counter() - start
+        SNAPSHOT_SECONDS.observe(self.lastDuration)
+        self.latest = snapshot
+        self.snapshotCount += 1
+        return snapshot
+
+    def get(self, maxAge: float | None = None) -> WorldSnapshot:
+        """Вернуть последний снимок, если он не старше `maxAge` секунд, иначе снять новый
+
+        Args:
+            maxAge (float | None, optional): Допустимый возраст снимка. По умолчанию - интервал обновления. Defaults to None.
+
+        Returns:
+            WorldSnapshot: Снимок мира
+        """
+        maxAge = self.interval if maxAge is None else maxAge
+        if self.latest is None or self.latest.age() > maxAge:
+            return self.snapshot()
+        return self.latest
+
+    def _run(self):
+        while not self._stopEvent.is_set():
+            try:
+                self.snapshot()
+            except Exception as e:
+                log.warning("world snapshot failed", error=str(e))
+            self._stopEvent.wait(self.interval)
+
+    def start(self) -> "WorldSnapshotter":
+        """Запустить фоновое обновление снимка
+
+        Returns:
+            WorldSnapshotter: Этот же объект
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stopEvent.clear()
+            self._thread = threading.Thread(target=self._run, name="world-snapshot", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановить фоновое обновление"""
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)